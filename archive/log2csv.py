@@ -1,7 +1,9 @@
 import argparse
-import os, re, csv, glob
+import os, re, csv, glob, json
 from archive.get_test_commands import getAllSubsystems
 from constants import FIELDNAMES, SUMMARY_PATTERN
+import getSummary
+import summary_cache
 class CSVSummary:
     def __init__(self, csv_out_dir):
         self.file_name = f"{csv_out_dir}.csv"
@@ -35,7 +37,38 @@ class CSVSummary:
         
         return summary_paths
 
+    def find_logs(self, log_path):
+        # Device logs, for summarizing straight from the logs instead of _summary.log files
+        if os.path.isfile(log_path):
+            return [log_path]
+        log_paths = glob.glob(os.path.join(log_path, "**", "*.log"), recursive=True)
+        return [path for path in log_paths if not path.endswith("_summary.log")]
+
+    def addLog(self, log_path, use_cache = True):
+        # Analyzed results are cached, so logs unchanged since the last run are not parsed again
+        if use_cache:
+            analysis = summary_cache.cachedAnalysis(log_path, getSummary.analyzeLog)
+        else:
+            analysis = getSummary.analyzeLog(log_path)
+        if analysis is None:
+            return None
+        ip = os.path.splitext(os.path.basename(log_path))[0]
+        new_test = analysis['total_tests']
+        new_fail, new_ignore, new_hang = analysis['total_failed'], analysis['total_ignored'], analysis['total_hangs']
+        self.updateRow(ip, new_test, new_test - new_fail - new_ignore - new_hang, new_fail, new_hang)
+
     def addSummary(self, summary_log):
+        # Prefer the JSON summary written alongside (getSummary.py -F json) over parsing the text
+        json_summary = f"{os.path.splitext(summary_log)[0]}.json"
+        if os.path.isfile(json_summary):
+            with open(json_summary, "r") as f:
+                summary = json.load(f)
+            if 'error' not in summary:
+                ip = os.path.basename(summary_log).replace("_summary.log", "")
+                new_test, new_fail = summary['total_tests'], summary['total_failed']
+                new_ignore, new_hang = summary['total_ignored'], summary['total_hangs']
+                self.updateRow(ip, new_test, new_test - new_fail - new_ignore - new_hang, new_fail, new_hang)
+                return
         try:
             with open(summary_log, "r") as f:
                 lines = f.readlines()
@@ -53,33 +86,36 @@ class CSVSummary:
         if match:
             new_test, new_fail, new_ignore, new_hang, error_msg = map(int, match.groups())
             new_pass = new_test - new_fail - new_ignore - new_hang
-            # Read existing CSV content
-            all_rows= []
-            row_found = False
-            if os.path.isfile(self.file_name):
-                with open(self.file_name, 'r', newline='') as f:
-                    reader = csv.DictReader(f)
-                    # Find the matching subsystem row
-                    for row in reader:
-                        if row['Subsystem'] == ip:
-                            # Update the values by adding new stats to existing stats
-                            row['Total Tests'] = int(row.get('Total Tests', 0)) + new_test
-                            row['Pass'] = int(row.get('Pass', 0)) + new_pass
-                            row['Fail'] = int(row.get('Fail', 0 )) + new_fail
-                            row['Hang'] = int(row.get('Hang', 0)) + new_hang
-                            row_found = True
-                        
-                        all_rows.append(row)
-            
-            if not row_found:
-                new_row = {
-                    'Subsystem': ip,
-                    'Total Tests': new_test,
-                    'Pass': new_pass,
-                    'Fail': new_fail,
-                    'Hang': new_hang
-                }
-                all_rows.append(new_row)
+            self.updateRow(ip, new_test, new_pass, new_fail, new_hang)
+
+    def updateRow(self, ip, new_test, new_pass, new_fail, new_hang):
+        # Read existing CSV content
+        all_rows= []
+        row_found = False
+        if os.path.isfile(self.file_name):
+            with open(self.file_name, 'r', newline='') as f:
+                reader = csv.DictReader(f)
+                # Find the matching subsystem row
+                for row in reader:
+                    if row['Subsystem'] == ip:
+                        # Update the values by adding new stats to existing stats
+                        row['Total Tests'] = int(row.get('Total Tests', 0)) + new_test
+                        row['Pass'] = int(row.get('Pass', 0)) + new_pass
+                        row['Fail'] = int(row.get('Fail', 0 )) + new_fail
+                        row['Hang'] = int(row.get('Hang', 0)) + new_hang
+                        row_found = True
+                    
+                    all_rows.append(row)
+        
+        if not row_found:
+            new_row = {
+                'Subsystem': ip,
+                'Total Tests': new_test,
+                'Pass': new_pass,
+                'Fail': new_fail,
+                'Hang': new_hang
+            }
+            all_rows.append(new_row)
 
         with open(self.file_name, 'w', newline='') as f:
             writer = csv.DictWriter(f, fieldnames= FIELDNAMES)
@@ -107,8 +143,18 @@ if __name__ == "__main__":
         help="Output path for csv file",
         default = '/usr/local/google/home/chinmingryan/Documents/logs/mbu/test_command_output/report'
     )
+    parser.add_argument("-r", "--raw", action="store_true",
+                        help="Summarize device logs directly (through the summary cache) instead of _summary.log files")
+    parser.add_argument("--no-cache", action="store_true", help="With -r, re-analyze logs even if cached")
+    parser.add_argument("--clear-cache", action="store_true", help="Remove every cached summary before running")
     args = parser.parse_args()
+    if args.clear_cache:
+        print(f"Removed {summary_cache.clearCache()} cached summaries")
     testClass = CSVSummary(args.output_log)
-    summary_list = testClass.find_summaries(args.log_summary)
-    for summary in summary_list:
-        testClass.addSummary(summary)
+    if args.raw:
+        for log in testClass.find_logs(args.log_summary):
+            testClass.addLog(log, not args.no_cache)
+    else:
+        summary_list = testClass.find_summaries(args.log_summary)
+        for summary in summary_list:
+            testClass.addSummary(summary)
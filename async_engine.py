@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# Author: Chin Ming Ryan Wong
+
+import asyncio, functools, os, signal, subprocess, time
+import serial
+import staging_scheduler
+from send_to_terminal import PortRunner, StreamCapture, DELAY, SILENCE_TIMEOUT, READY_QUIET
+from send_to_terminal import SUCCESS, ERROR, PROMPT_FOUND, SILENT, TIMED_OUT
+from dhub_automation import dhub_command, parse_port_line
+from command_timing import CommandTiming
+from iteration_pool import IterationPool
+from plan_runner import runPlan
+from constants import FTDI_MULTI_PATH, STAGE_LK_PATH
+
+class AsyncPortRunner(PortRunner):
+    """
+    PortRunner driven by an asyncio event loop instead of blocking reads.
+
+    The port is opened exactly like PortRunner (same settings and loggers, so the log
+    output is unchanged) and then switched to non-blocking reads. The event loop calls
+    back whenever the PTY is readable and the bytes are buffered here, so waiting for a
+    prompt costs no thread. Must be created inside a running event loop.
+    """
+    def __init__(self, prt, timeout_arg = 100, delay = DELAY, verbosity = False, logName = 'terminal',
+                 silence_timeout = SILENCE_TIMEOUT, pacing = 'fixed', pacing_stats = None, capture = 'buffered',
+                 timing = None):
+        super().__init__(prt, timeout_arg, delay, verbosity, logName, silence_timeout, pacing, pacing_stats, capture,
+                         timing)
+        self.ser.timeout = 0
+        self._buf = bytearray()
+        self._data = asyncio.Event()
+        self._error = None
+        self._loop = asyncio.get_running_loop()
+        self._fd = self.ser.fileno()
+        self._loop.add_reader(self._fd, self._onReadable)
+
+    def _onReadable(self):
+        try:
+            data = self.ser.read(self.ser.in_waiting or 1)
+        except (serial.SerialException, OSError) as e:
+            # PTY went away (dhub stopped); surfaced by the next read
+            self._error = e
+            self._removeReader()
+            data = b""
+        self._buf += data
+        self._data.set()
+
+    def _removeReader(self):
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            self._fd = None
+
+    async def _wait(self, timeout):
+        # Waits for more output or timeout seconds
+        self._data.clear()
+        if timeout > 0:
+            try:
+                await asyncio.wait_for(self._data.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        if self._error is not None:
+            raise serial.SerialException(f"Read failed on {self.prt}: {self._error}")
+
+    def close(self):
+        self._removeReader()
+        super().close()
+
+    def resetInput(self):
+        self.ser.reset_input_buffer()
+        self.ser.reset_output_buffer()
+        self._buf.clear()
+
+    async def readResponse(self, expect_response = 'gsp ]', silence_timeout = None, count = 1, poke = True,
+                           sink = None, timeout = None):
+        """
+        Async PortRunner.readResponse: waits for count prompts. With poke False the
+        console is never poked and only timeout (default two port timeouts) ends the wait,
+        like the read_until calls used for the AOSS ports. With a sink, output that can no longer
+        be part of a prompt is passed to it and dropped from the buffer after every read.
+
+        Returns:
+            tuple: (response bytes up to and including the last prompt (b"" with a sink), PROMPT_FOUND, SILENT or TIMED_OUT)
+        """
+        expect = expect_response.encode()
+        budget = 2 * self.timeout if timeout is None else timeout
+        silence = self.silenceWindow(silence_timeout) if poke else budget
+        loop = self._loop
+        start = last_output = loop.time()
+        seen_len = search_from = 0
+        found = 0
+        poked = False
+        self.first_byte = None
+        self.bytes_read = 0
+        self.prompt_times = []
+        while True:
+            now = loop.time()
+            if len(self._buf) > seen_len:
+                last_output = now
+                poked = False
+                if self.first_byte is None: self.first_byte = now
+                self.bytes_read += len(self._buf) - seen_len
+                seen_len = len(self._buf)
+                pos = self._buf.find(expect, search_from)
+                while pos != -1:
+                    found += 1
+                    self.prompt_times.append(now)
+                    search_from = pos + len(expect)
+                    if found == count:
+                        response = bytes(self._buf[:search_from])
+                        del self._buf[:search_from]
+                        if sink is not None:
+                            sink(response)
+                            response = b""
+                        return response, PROMPT_FOUND
+                    pos = self._buf.find(expect, search_from)
+                # Rolling tail: the prompt may be split across reads
+                search_from = max(search_from, len(self._buf) - len(expect) + 1)
+                if sink is not None and search_from > 0:
+                    sink(bytes(self._buf[:search_from]))
+                    del self._buf[:search_from]
+                    seen_len -= search_from
+                    search_from = 0
+            if now - start >= budget:
+                return self._drain(sink), TIMED_OUT
+            if now - last_output >= silence:
+                if poked:
+                    return self._drain(sink), SILENT
+                self.ser.write('\n'.encode())
+                poked = True
+                last_output = now
+            await self._wait(min(silence - (now - last_output), budget - (now - start)))
+
+    def _drain(self, sink = None):
+        response = bytes(self._buf)
+        self._buf.clear()
+        if sink is not None:
+            sink(response)
+            return b""
+        return response
+
+    async def runCommand(self, command, ignore_fail = False, expect_response = 'gsp ]', delay = None, timeout = None,
+                         silence_timeout = None):
+        self.resetInput()
+        if command[:-2] != '\n': self.ser.write(f'{command}\n'.encode())
+        elif command[:2] == '\n': self.ser.write(f'{command}'.encode())
+        sent_at, sent = time.time(), self._loop.time()
+        if self.capture == 'stream':
+            capture = StreamCapture(self.logBytes)
+            _, status = await self.readResponse(expect_response, silence_timeout, sink = capture.feed, timeout = timeout)
+            done = self._loop.time()
+            result = self.finishStream(capture, status, ignore_fail)
+        else:
+            response, status = await self.readResponse(expect_response, silence_timeout, timeout = timeout)
+            done = self._loop.time()
+            result = self.finishBuffered(response, status, ignore_fail)
+        self.recordCommand(command, sent_at, sent, done, result)
+        if result == SUCCESS: await self.pace(self.delay, delay)
+        return result
+
+    async def runBatch(self, commands, ignore_fail = False, expect_response = 'gsp ]', delay = None, timeout = None,
+                       rows = None):
+        # Async PortRunner.runBatch
+        self.resetInput()
+        self.ser.write("".join(f"{command}\n" for command in commands).encode())
+        sent_at, sent = time.time(), self._loop.time()
+        response, status = await self.readResponse(expect_response, timeout = timeout, count = len(commands))
+        results = self.finishBatch(commands, response, status, expect_response, ignore_fail, sent_at, sent, rows)
+        if ERROR not in results:
+            self.pacing_stats['commands'] += len(commands) - 1
+            self.pacing_stats['fixed_s'] += (len(commands) - 1) * self.delay
+            await self.pace(self.delay, delay)
+        return results
+
+    async def waitReady(self, max_wait, quiet = READY_QUIET) -> float:
+        loop = self._loop
+        start = last_output = loop.time()
+        while True:
+            now = loop.time()
+            if self._buf:
+                # Output after the prompt is dropped, as reset_input_buffer would
+                self._buf.clear()
+                last_output = now
+            if now - start >= max_wait or now - last_output >= quiet:
+                break
+            await self._wait(min(quiet - (now - last_output), max_wait - (now - start)))
+        return loop.time() - start
+
+    async def pace(self, fixed_delay, override = None):
+        if override is not None:
+            await asyncio.sleep(override)
+            waited = override
+        elif self.pacing == 'adaptive':
+            waited = await self.waitReady(fixed_delay)
+        else:
+            await asyncio.sleep(fixed_delay)
+            waited = fixed_delay
+        self.pacing_stats['commands'] += 1
+        self.pacing_stats['fixed_s'] += fixed_delay
+        self.pacing_stats['waited_s'] += waited
+
+    async def sendAndLog(self, command, expect_response, count = 2, timeout = None):
+        # AOSS ports: send, read count prompts and log whatever came back
+        sent_at, sent = time.time(), self._loop.time()
+        self.ser.write(f'{command}\n'.encode())
+        response, status = await self.readResponse(expect_response, count=count, poke=False, timeout=timeout)
+        self.recordCommand(command, sent_at, sent, self._loop.time(), SUCCESS if status == PROMPT_FOUND else ERROR, 'aoss')
+        self.logResponse(response)
+        return response
+
+class AsyncDhub():
+    """
+    DhubAutomation as an asyncio subprocess. dhub output is drained in the background
+    so it can never block on a full pipe.
+    """
+    def __init__(self, serial_num):
+        self.serial_num = serial_num
+        self.proc = None
+        self.ports = {}
+        self._drain = None
+
+    async def start(self) -> dict:
+        symlink_dir = "./MLB_1"
+        if os.path.exists(symlink_dir):
+            await _run(["rm", "-rf", symlink_dir])
+        print("Starting dhub...")
+        self.ports = {}
+        self.proc = await asyncio.create_subprocess_exec(*dhub_command(self.serial_num), stdout=subprocess.PIPE,
+                                                         stderr=subprocess.DEVNULL, start_new_session=True)
+        print("Establishing dhub ports...")
+        while True:
+            line = await self.proc.stdout.readline()
+            if not line or parse_port_line(line.decode().strip(), self.ports):
+                break
+        self._drain = asyncio.ensure_future(self._drainOutput())
+        return self.ports
+
+    async def _drainOutput(self):
+        while await self.proc.stdout.read(1 << 16):
+            pass
+
+    async def stop(self):
+        if self.proc is None or self.proc.returncode is not None:
+            print("dhub process is not running.")
+            return
+        print("Terminating dhub process...")
+        pgid = os.getpgid(self.proc.pid)
+        try:
+            # Equivalent to Ctrl+C
+            os.killpg(pgid, signal.SIGINT)
+        except OSError as e:
+            print(f"Error terminating dhub process: {e}")
+        try:
+            await asyncio.wait_for(self.proc.wait(), 10)
+            print("dhub process successfully terminated.")
+        except asyncio.TimeoutError:
+            print("dhub process did not terminate gracefully after SIGINT. Forcing SIGKILL.")
+            try:
+                os.killpg(pgid, signal.SIGKILL)
+            except OSError as e:
+                print(f"Error sending SIGKILL: {e}")
+            await self.proc.wait()
+            print("dhub process forcibly killed.")
+        if self._drain is not None:
+            self._drain.cancel()
+
+async def _run(cmd, stdout = subprocess.DEVNULL, stderr = None) -> int:
+    # Runs a command without blocking the loop, returns its exit code
+    proc = await asyncio.create_subprocess_exec(*cmd, stdout=stdout, stderr=stderr)
+    return await proc.wait()
+
+async def _stageAttempt(package_path, soc_sn = None, brd_sn = None) -> bool:
+    # serial_num_util.stage_attempt with the FTDI reset and LK staging run as async subprocesses
+    print("Attempting ROM Recovery")
+    ftdi_cmd = ['sudo', FTDI_MULTI_PATH, '5'] + ([brd_sn] if brd_sn is not None else [])
+    await _run(ftdi_cmd, stderr=subprocess.DEVNULL)
+    print(f"Re-staging {brd_sn} for lk")
+    stage_cmd = [STAGE_LK_PATH, "--path", package_path] + (["--serial", soc_sn] if soc_sn is not None else [])
+    return await _run(stage_cmd, stderr=subprocess.DEVNULL) == 0
+
+async def creset_and_lk(package_path, soc_sn = None, brd_sn = None):
+    """
+    serial_num_util.creset_and_lk with the FTDI reset and LK staging run as async subprocesses,
+    queued on the host's StagingScheduler without blocking the loop.
+    """
+    print(f"C-Resetting device with SoC SN: {soc_sn} and Board SN: {brd_sn}")
+    await staging_scheduler.getScheduler().stageAsync(functools.partial(_stageAttempt, package_path, soc_sn, brd_sn),
+                                                      soc_sn, brd_sn)
+    await asyncio.sleep(5)
+
+class AsyncOps():
+    """
+    plan_runner.SyncOps for the event loop: AsyncPortRunner ports, AsyncDhub and asyncio
+    subprocesses, with blocking work (log fsync, summary) run in the default executor.
+    """
+    runner = AsyncPortRunner
+
+    def __init__(self, soc_sn):
+        self.soc_sn = soc_sn
+        self.dhub = AsyncDhub(soc_sn)
+
+    async def startDhub(self) -> dict:
+        return await self.dhub.start()
+
+    async def stopDhub(self):
+        await self.dhub.stop()
+
+    async def cresetAndLk(self, package_path, brd_sn):
+        await creset_and_lk(package_path, self.soc_sn, brd_sn)
+
+    async def run(self, cmd) -> int:
+        return await _run(cmd)
+
+    async def call(self, method, *args, **kwargs):
+        return await method(*args, **kwargs)
+
+    async def offload(self, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+async def run_SOP(plan, soc_sn, brd_sn, package_path, iteration, **kwargs):
+    """
+    send_to_terminal_batch_v2.run_SOP on the event loop: the same step loop (plan_runner.runPlan),
+    the same logs. kwargs are runPlan's.
+    """
+    await runPlan(AsyncOps(soc_sn), plan, soc_sn, brd_sn, package_path, iteration, **kwargs)
+
+async def device_task(plan, soc_sn, brd_sn, lk_package_path, iteration, limit, **kwargs):
+    async with limit:
+        if isinstance(iteration, IterationPool) and not iteration.remaining():
+            print(f"[{soc_sn}] No iterations left, skipping.")
+            return
+        print(f"[{soc_sn}] Starting setup (Reset & LK)...")
+        timing = CommandTiming(soc_sn)
+        with timing.step('creset_and_lk'):
+            await creset_and_lk(lk_package_path, soc_sn, brd_sn)
+        print(f"[{soc_sn}] Setup complete. Starting SOP execution...")
+        try:
+            await run_SOP(plan, soc_sn, brd_sn, lk_package_path, iteration, timing = timing, **kwargs)
+        except Exception:
+            # Hand the iteration this device was running back to the rest of the fleet
+            if isinstance(iteration, IterationPool):
+                iteration.abandon(soc_sn)
+            raise
+        print(f"[{soc_sn}] Task finished.")
+
+async def run_devices(plan, paired_sn_list, lk_package_path, iteration, max_concurrency = 0, **kwargs):
+    """
+    Runs a compiled test plan (test_plan.compilePlan) on every device pair on one event loop.
+
+    Args:
+        iteration: Iterations per device, or an IterationPool shared by every device.
+        max_concurrency (int): Devices running at once, 0 for all of them.
+        kwargs: silence_timeout, pacing, capture, verify_summary, shard_report and ramdisk_cache, passed to run_SOP.
+    """
+    limit = asyncio.Semaphore(max_concurrency or max(len(paired_sn_list), 1))
+    tasks = [device_task(plan, pair['soc_sn'], pair['brd_sn'], lk_package_path, iteration, limit, **kwargs)
+             for pair in paired_sn_list]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    for pair, result in zip(paired_sn_list, results):
+        if isinstance(result, Exception):
+            print(f"[{pair['soc_sn']}] Task failed: {result!r}")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# Author: Chin Ming Ryan Wong
+
+import argparse
+import contextlib
+import io
+import json
+import mmap
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import getSummary
+import log_generator
+from marker_matcher import MATCHER
+from log_index import indexPath
+from constants import BENCH_LOG_DIR
+
+DEFAULT_SIZES = ["10M", "100M", "1G", "5G"]
+# Phases timed on their own: reading lines, classifying them, and the mmap marker scan
+PHASES = ('read', 'classify', 'scan')
+
+def _goldenDiff(results, golden):
+    # Names of the result fields that differ from the golden result
+    if results is None:
+        return ['<no result>']
+    return getSummary.diffResults(results, golden)
+
+def _runPhase(phase, path):
+    if phase == 'read':
+        with getSummary.openLog(path) as f:
+            for line in f:
+                pass
+    elif phase == 'classify':
+        classify = MATCHER.classify
+        with getSummary.openLog(path) as f:
+            for line in f:
+                classify(line)
+    elif phase == 'scan':
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for _ in getSummary.iterMarkedLines(mm):
+                pass
+
+def _measure(kind, path):
+    """
+    Runs one phase or analysis mode in this (fresh) process.
+
+    Returns:
+        dict: {'seconds', 'summary_seconds', 'peak_rss_mb', 'diff'}, where diff lists the
+        result fields differing from the golden result (analysis modes only).
+    """
+    # Cold start for the modes that keep sidecar files
+    for sidecar in (getSummary.statePath(path), indexPath(path)):
+        if os.path.exists(sidecar):
+            os.remove(sidecar)
+    measurement = {'summary_seconds': None, 'diff': None}
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if kind in PHASES:
+            _runPhase(kind, path)
+            results = None
+        else:
+            results = getSummary.ANALYZE_MODES[kind](path)
+    measurement['seconds'] = time.perf_counter() - start
+    if results is not None:
+        summary_path = f"{path}.bench_summary.log"
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            getSummary.log_test_summary(results, summary_path)
+        measurement['summary_seconds'] = time.perf_counter() - start
+        os.remove(summary_path)
+        measurement['diff'] = _goldenDiff(results, log_generator.loadGolden(path))
+    # ru_maxrss is in KB on Linux
+    measurement['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return measurement
+
+def benchLog(size: int, seed = 0, profile = 'apc', log_dir = BENCH_LOG_DIR) -> str:
+    """
+    Returns the path of a generated log of the given size, generating it (and its
+    golden result) only if it is not already in log_dir.
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    path = os.path.join(log_dir, f"bench_{profile}_{size}_{seed}.log")
+    if not (os.path.isfile(path) and os.path.isfile(log_generator.goldenPath(path))):
+        print(f"Generating {path}...")
+        start = time.perf_counter()
+        log_generator.generateLog(path, size, seed, profile)
+        print(f"  {os.path.getsize(path) / (1 << 20):.0f} MB in {time.perf_counter() - start:.1f} s")
+    return path
+
+def runBenchmark(sizes, kinds, profile = 'apc', seed = 0, log_dir = BENCH_LOG_DIR) -> list:
+    """
+    Benchmarks every phase/mode in kinds on a generated log of every size, each run in
+    its own process so peak memory is per run.
+
+    Returns:
+        list: One dict per run with size, kind, seconds, MB/s, lines/s, peak RSS and golden diff.
+    """
+    rows = []
+    context = multiprocessing.get_context('spawn')
+    for size in sizes:
+        path = benchLog(size, seed, profile, log_dir)
+        file_bytes = os.path.getsize(path)
+        with open(path, "rb") as f:
+            lines = sum(block.count(b"\n") for block in iter(lambda: f.read(1 << 20), b""))
+        for kind in kinds:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                measurement = pool.submit(_measure, kind, path).result()
+            seconds = measurement['seconds']
+            row = {'size': file_bytes, 'lines': lines, 'kind': kind, **measurement,
+                   'mb_per_sec': file_bytes / (1 << 20) / seconds if seconds else float('inf'),
+                   'lines_per_sec': lines / seconds if seconds else float('inf')}
+            rows.append(row)
+            golden = "-" if row['diff'] is None else ("OK" if not row['diff'] else "MISMATCH " + ", ".join(row['diff'][:5]))
+            summary = f"{row['summary_seconds']:.2f}" if row['summary_seconds'] is not None else "-"
+            print(f"{file_bytes / (1 << 20):8.0f} MB  {kind:<12} {seconds:8.2f} s  {row['mb_per_sec']:8.1f} MB/s  "
+                  f"{row['lines_per_sec']:>12,.0f} lines/s  summary {summary:>6} s  "
+                  f"peak {row['peak_rss_mb']:7.1f} MB  golden {golden}")
+    return rows
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark getSummary phases and analysis modes on generated logs.")
+    parser.add_argument('-s', '--sizes', type=str, nargs='+', default=DEFAULT_SIZES, help="Log sizes, e.g. 10M 1G 5G.")
+    parser.add_argument('-k', '--kinds', type=str, nargs='+', default=list(PHASES) + list(getSummary.ANALYZE_MODES),
+                        choices=list(PHASES) + list(getSummary.ANALYZE_MODES), help="Phases and modes to run.")
+    parser.add_argument('-p', '--profile', type=str, choices=log_generator.PROFILES.keys(), default='apc')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-d', '--dir', type=str, default=BENCH_LOG_DIR, help="Where generated logs are kept.")
+    parser.add_argument('-o', '--output', type=str, default=None, help="Also write the results as JSON.")
+    args = parser.parse_args()
+    rows = runBenchmark([log_generator.parseSize(size) for size in args.sizes], args.kinds, args.profile,
+                        args.seed, args.dir)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+    # Non-zero exit if any mode disagrees with the golden result
+    sys.exit(1 if any(row['diff'] for row in rows) else 0)
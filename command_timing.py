@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# Author: Chin Ming Ryan Wong
+
+import argparse
+import csv
+import json
+import math
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+# One record per command sent or setup step run. Times are seconds; 'sent' is wall clock,
+# first_byte_s and prompt_s are measured from it. Setup steps only fill prompt_s (their duration).
+TIMING_FIELDS = ['device', 'iteration', 'row', 'kind', 'command', 'sent', 'first_byte_s', 'prompt_s',
+                 'bytes', 'outcome']
+ROW_SUMMARY_FIELDS = ['row', 'kind', 'command', 'count', 'p50_s', 'p95_s', 'max_s', 'total_s', 'failures']
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of values (0 < pct <= 100), None for no values.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(math.ceil(pct * len(values) / 100), 1)
+    return values[rank - 1]
+
+class RowStats():
+    """
+    Durations and failures per test plan row (and kind, since a reboot row holds several steps),
+    the only part of the records the row summary needs.
+    """
+    def __init__(self):
+        self.groups = {}
+
+    def add(self, record):
+        key = (record['row'], record['kind'], record['command'])
+        group = self.groups.setdefault(key, {'count': 0, 'failures': 0, 'durations': []})
+        group['count'] += 1
+        group['failures'] += record['outcome'] != 'SUCCESS'
+        if record['prompt_s'] is not None:
+            group['durations'].append(record['prompt_s'])
+
+    def rows(self) -> list:
+        """
+        Returns:
+            list: One dict per group with ROW_SUMMARY_FIELDS, in plan order. Times are send to prompt.
+        """
+        rows = []
+        for (row, kind, command), group in self.groups.items():
+            durations = group['durations']
+            rows.append({'row': row, 'kind': kind, 'command': command, 'count': group['count'],
+                         'p50_s': percentile(durations, 50), 'p95_s': percentile(durations, 95),
+                         'max_s': max(durations) if durations else None, 'total_s': sum(durations),
+                         'failures': group['failures']})
+        # Setup before the first row (row None) first
+        rows.sort(key=lambda r: (-1 if r['row'] is None else r['row']))
+        return rows
+
+class CommandTiming():
+    """
+    Timing records of one device. run_SOP sets iteration and row before each test plan row;
+    every PortRunner of the device shares the recorder (like pacing_stats) and adds one record
+    per command ('command' on APC, 'aoss' on the AOSS ports), and setup steps are timed with step().
+
+    Records are written to <log>_timing.csv and <log>_timing.jsonl as they are made, once open()
+    is called (the few made before are held until then), so a long soak does not keep them in
+    memory and a host crash keeps everything up to the last command. Only the per-row durations
+    are kept, for the summary.
+
+    Args:
+        device (str): SoC serial number, copied into every record.
+    """
+    def __init__(self, device):
+        self.device = device
+        self.iteration = None
+        self.row = None
+        self.stats = RowStats()
+        self.paths = []
+        self.pending = []
+        self.files = None
+        self.csv_writer = None
+
+    def open(self, log_dir, log_name):
+        """
+        Starts writing records to <log_name>_timing.csv and <log_name>_timing.jsonl in log_dir.
+        """
+        os.makedirs(log_dir, exist_ok=True)
+        base = os.path.join(log_dir, f"{log_name}_timing")
+        self.paths = [f"{base}.csv", f"{base}.jsonl"]
+        self.files = [open(path, "w", newline="") for path in self.paths]
+        self.csv_writer = csv.DictWriter(self.files[0], fieldnames=TIMING_FIELDS)
+        self.csv_writer.writeheader()
+        pending, self.pending = self.pending, []
+        for record in pending:
+            self.write(record)
+
+    def write(self, record):
+        self.stats.add(record)
+        if self.files is None:
+            self.pending.append(record)
+            return
+        self.csv_writer.writerow(record)
+        self.files[1].write(json.dumps(record) + "\n")
+        for f in self.files:
+            f.flush()
+
+    def close(self):
+        if self.files is not None:
+            for f in self.files:
+                f.close()
+            self.files = None
+
+    def discard(self):
+        """
+        Closes and removes the timing files, for a run with nothing to summarize.
+        """
+        self.close()
+        for path in self.paths:
+            if os.path.exists(path):
+                os.remove(path)
+        self.paths = []
+
+    def command(self, command, sent, first_byte_s, prompt_s, nbytes, outcome, kind = 'command'):
+        self.write({'device': self.device, 'iteration': self.iteration, 'row': self.row, 'kind': kind,
+                    'command': command, 'sent': sent, 'first_byte_s': first_byte_s, 'prompt_s': prompt_s,
+                    'bytes': nbytes, 'outcome': outcome})
+
+    @contextmanager
+    def step(self, kind, command = ""):
+        """
+        Times the enclosed block as one record of the given kind ('creset_and_lk', 'dhub_start', 'fastboot').
+        The outcome is ERROR if the block raised; callers set record['outcome'] for failures that don't
+        inside the block, since the record is written when it exits.
+        """
+        sent = time.time()
+        start = time.monotonic()
+        record = {'device': self.device, 'iteration': self.iteration, 'row': self.row, 'kind': kind,
+                  'command': command, 'sent': sent, 'first_byte_s': None, 'prompt_s': None, 'bytes': None,
+                  'outcome': 'SUCCESS'}
+        try:
+            yield record
+        except BaseException:
+            record['outcome'] = 'ERROR'
+            raise
+        finally:
+            record['prompt_s'] = time.monotonic() - start
+            self.write(record)
+
+    def summary(self) -> list:
+        return self.stats.rows()
+
+    def export(self, log_dir) -> list:
+        """
+        Closes the timing files, moves them to log_dir and writes the per-row summary
+        <log_name>_timing_summary.csv next to them.
+
+        Returns:
+            list: The paths written.
+        """
+        self.close()
+        paths = []
+        for path in self.paths:
+            paths.append(os.path.join(log_dir, os.path.basename(path)))
+            shutil.move(path, paths[-1])
+        self.paths = paths
+        summary_path = os.path.splitext(paths[0])[0] + "_summary.csv"
+        writeRowSummary(self.summary(), summary_path)
+        return paths + [summary_path]
+
+def summarizeRows(records) -> list:
+    """
+    Groups records by test plan row (and kind) across iterations and devices, see RowStats.rows.
+    """
+    stats = RowStats()
+    for record in records:
+        stats.add(record)
+    return stats.rows()
+
+def writeRowSummary(rows, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=ROW_SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def renderRowSummary(rows, top = None) -> str:
+    """
+    Formats row summaries as a table, only the top slowest rows by total time if top is given.
+    """
+    if top is not None:
+        rows = sorted(rows, key=lambda r: r['total_s'], reverse=True)[:top]
+    fmt = lambda v: "-" if v is None else f"{v:.2f}"
+    out = [f"{'row':>5}  {'kind':<14}{'count':>6}{'p50 s':>9}{'p95 s':>9}{'max s':>9}{'total s':>10}{'fail':>6}  command"]
+    for r in rows:
+        row = "-" if r['row'] is None else r['row']
+        out.append(f"{row:>5}  {r['kind']:<14}{r['count']:>6}{fmt(r['p50_s']):>9}{fmt(r['p95_s']):>9}"
+                   f"{fmt(r['max_s']):>9}{fmt(r['total_s']):>10}{r['failures']:>6}  {r['command']}")
+    return "\n".join(out)
+
+def loadJsonl(path):
+    # One record at a time, a soak's file does not fit in memory as a list
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Summarize per-command timing (<log>_timing.jsonl) per test plan row.")
+    parser.add_argument('-l', '--logs', type=str, nargs='+', required=True,
+                        help="Timing files of one or more devices; rows are summarized across all of them.")
+    parser.add_argument('-n', '--top', type=int, default=None, help="Only the n slowest rows by total time.")
+    parser.add_argument('-o', '--output', type=str, default=None, help="Also write the summary as CSV.")
+    args = parser.parse_args()
+    records = (record for path in args.logs for record in loadJsonl(path))
+    rows = summarizeRows(records)
+    print(renderRowSummary(rows, args.top))
+    if args.output:
+        writeRowSummary(rows, args.output)
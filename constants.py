@@ -25,8 +25,61 @@ GPCA_END_MARKER = "gsa: "
 TEST_CONTENT_END_MARKERS = ["-----------------------", "*********** TEST SUMMARY **************"]
 AOSS_AON_SCR_END_MARKER = "I aon_toolbox: E20 firmware already running"
 SUCCESS_END_MARKER = ["gsa: Test Passed", "returned 0 --> PASS"]
+EXEC_TIME_MARKER = "Total Execution Time:"
 RESULT_PATTERN = compile(r"(\d+)\s+Tests\s+(\d+)\s+Failures\s+(\d+)\s+Ignored")
 RESULT_PATTERN_1 = compile(r"(?:PASSED|FAILED) - (\d+)") # hsio_ufs test result pattern
+# Saved parser state for incremental analysis, written next to each log
+LOG_STATE_EXT = ".state"
+
+# log_writer.py constants
+# Device log bytes are written out once this many are pending or this many seconds have passed
+LOG_FLUSH_INTERVAL = 0.5
+LOG_FLUSH_BYTES = 64 * 1024
+
+# iteration_pool.py constants
+# A failed iteration is run again on another device at most this many times in all
+UNIT_MAX_ATTEMPTS = 3
+# A device stops taking iterations after this many failures in a row
+DEVICE_MAX_FAILURES = 3
+
+# plan_shards.py constants
+# Per-segment report of a sharded run and the segment durations the next run is balanced by,
+# written to the log directory as <plan><ext>
+SEGMENT_SUMMARY_EXT = "_segment_summary.log"
+SEGMENT_HISTORY_EXT = "_segments.json"
+
+# staging_scheduler.py constants
+# ROM recovery + LK stagings at once per USB bus ('bus'), per hub ('hub') or per host ('host'); 0 = no limit
+STAGING_CONCURRENCY = 2
+STAGING_GROUP = 'bus'
+# Attempts per staging, and the backoff before a retry (doubled per retry, capped)
+STAGING_ATTEMPTS = 5
+STAGING_BACKOFF = 2.0
+STAGING_BACKOFF_MAX = 30.0
+SYSFS_USB_DEVICES = "/sys/bus/usb/devices"
+# Per-staging metrics of a run, written to the log directory
+STAGING_METRICS_NAME = "staging_metrics.csv"
+
+# ramdisk_cache.py constants
+# Bytes read at a time when hashing a ramdisk image
+RAMDISK_HASH_BLOCK = 1 << 20
+
+# log_index.py constants
+# Sidecar index written next to each log
+LOG_INDEX_EXT = ".idx"
+
+# fleet_summary.py constants
+# Consolidated summary written to the log directory
+FLEET_SUMMARY_NAME = "fleet_summary.log"
+
+# summary_cache.py constants
+# Cached analyzeLog results, shared by getSummary.py, fleet_summary.py and log2csv.py
+SUMMARY_CACHE_DIR = "~/.cache/lk_processing/summaries"
+SUMMARY_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# benchmark_parser.py constants
+# Generated benchmark logs and their golden results, reused between runs
+BENCH_LOG_DIR = "/tmp/lk_bench"
 
 # dhub_automation.py constants
 DHUB_PATH = "./dhub.pyz"
@@ -1,6 +1,34 @@
 import subprocess, os, signal, threading, time
 from constants import DHUB_PATH
 
+# dhub output line prefix -> port name
+DHUB_PORT_NAMES = {
+    "APC terminal:": "APC",
+    "CPM terminal:": "CPM",
+    "AOSS_SENSOR_CORE terminal:": "AOSS_SENSOR_CORE",
+    "AOSS_A32 terminal:": "AOSS_A32",
+}
+DHUB_LAUNCHED = "Launched DHUB. Press Ctrl-C to exit."
+
+def dhub_command(serial_num):
+    return ["python3", DHUB_PATH, "--usb", "--usb-endpoint-address", "1"
+            ,"--usb-vendor-id", "0x18d1", "--usb-product-id", "0x4eef"
+            ,"--usb-interface-name", "UART and Debug Interface", "-r"
+            ,"r3p0", "--usb-serial-number", serial_num
+            ,"--no-tmux-session", "--pts-symlink-basedir", f"./{serial_num}"
+            ,"--debug_port_socket_path", f"./{serial_num}/dhub_debug_1_port.sock"]
+
+def parse_port_line(line, ports):
+    """
+    Records a terminal path from one line of dhub output into ports.
+    Returns True once dhub reports it has launched (all ports printed).
+    """
+    for prefix, name in DHUB_PORT_NAMES.items():
+        if prefix in line:
+            ports[name] = line.split(f"{prefix} ")[-1]
+            break
+    return DHUB_LAUNCHED in line
+
 class DhubAutomation():
     def __init__(self, serial):
         self.dhub_output = None
@@ -16,20 +44,8 @@ class DhubAutomation():
         else:
             print("Establishing dhub ports...")
             for line in self.dhub_output.stdout:
-                if "APC terminal:" in line.decode().strip():
-                    apc_term = line.decode().strip().split("APC terminal: ")[-1]
-                    self.ports["APC"] = apc_term
-                elif "CPM terminal:" in line.decode().strip():
-                    cpm_term = line.decode().strip().split("CPM terminal: ")[-1]
-                    self.ports["CPM"] = cpm_term
-                elif "AOSS_SENSOR_CORE terminal:" in line.decode().strip():
-                    aoss_term = line.decode().strip().split("AOSS_SENSOR_CORE terminal: ")[-1]
-                    self.ports["AOSS_SENSOR_CORE"] = aoss_term
-                elif "AOSS_A32 terminal:" in line.decode().strip():
-                    aoss_a32_term = line.decode().strip().split("AOSS_A32 terminal: ")[-1]
-                    self.ports["AOSS_A32"] = aoss_a32_term
                 # Exit for loop if both ports are found
-                if "Launched DHUB. Press Ctrl-C to exit." in line.decode().strip():
+                if parse_port_line(line.decode().strip(), self.ports):
                     break
             # Return the ports dictionary
             return self.ports
@@ -40,12 +56,7 @@ class DhubAutomation():
             # Using shell command to be extra thorough with symlinks
             subprocess.run(["rm", "-rf", symlink_dir])
         print("Starting dhub...")
-        self.dhub_output = subprocess.Popen(["python3", DHUB_PATH, "--usb", "--usb-endpoint-address", "1"
-                                        ,"--usb-vendor-id", "0x18d1", "--usb-product-id", "0x4eef"
-                                        ,"--usb-interface-name", "UART and Debug Interface", "-r" 
-                                        ,"r3p0", "--usb-serial-number", serial_num
-                                        ,"--no-tmux-session", "--pts-symlink-basedir", f"./{serial_num}"
-                                        ,"--debug_port_socket_path", f"./{serial_num}/dhub_debug_1_port.sock"]
+        self.dhub_output = subprocess.Popen(dhub_command(serial_num)
                                         , stdout=subprocess.PIPE, stderr=subprocess.PIPE
                                         , start_new_session=True)
         self.ports_ready.set()
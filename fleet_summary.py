@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# Author: Chin Ming Ryan Wong
+
+import argparse
+import contextlib
+import glob
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import getSummary
+import summary_cache
+from constants import LOG_OUTPUT_DIR, FLEET_SUMMARY_NAME
+
+def findDeviceLogs(log_dir: str) -> list:
+    """
+    Returns every device log under log_dir, skipping summaries written next to them.
+    """
+    logs = []
+    for path in glob.glob(os.path.join(log_dir, "**", "*.log"), recursive=True):
+        name = os.path.basename(path)
+        if name.endswith("_summary.log") or name == FLEET_SUMMARY_NAME:
+            continue
+        logs.append(path)
+    return sorted(logs)
+
+def _summarizeDevice(log_path, mode, use_cache = True, formats = ('text',)):
+    # Worker: rewrites <log>_summary.log (no formats: none) and returns the counts for the fleet
+    # summary. Replaced rather than appended to, so re-summarizing a run leaves one summary per device
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        analyze = getSummary.ANALYZE_MODES[mode]
+        analysis = summary_cache.cachedAnalysis(log_path, analyze) if use_cache else analyze(log_path)
+        for fmt in formats:
+            getSummary.log_test_summary(analysis, getSummary.summaryPath(log_path, fmt=fmt), fmt, append=False)
+    if analysis is None:
+        return log_path, None, time.perf_counter() - start
+    tests = {}
+    for test, stats in analysis['test_stats'].items():
+        tests[test] = {
+            'total': stats['total'],
+            'failures': len(stats['failures']),
+            'ignored': len(stats['ignored']),
+            'hangs': len(stats['hangs']),
+        }
+    counts = {key: value for key, value in analysis.items() if key not in ('test_stats', 'cmd_hang')}
+    counts['cmd_hangs'] = analysis['cmd_hang']['count']
+    counts['tests'] = tests
+    return log_path, counts, time.perf_counter() - start
+
+def renderFleetSummary(devices: dict, log_dir: str) -> str:
+    """
+    Formats per-device counts (log path -> counts from _summarizeDevice) as one report.
+    """
+    out = []
+    out.append('----------------------- Fleet Summary -----------------------')
+    out.append(f'Log directory: {log_dir}')
+    out.append(f'Generated: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}')
+    out.append(f'Devices: {len(devices)}')
+    totals = {'iterations': 0, 'total_tests': 0, 'total_failed': 0, 'total_ignored': 0,
+              'total_hangs': 0, 'total_error_msg': 0, 'cmd_hangs': 0}
+    per_test = {}
+    out.append('')
+    out.append('--- Devices ---')
+    for log_path, counts in devices.items():
+        name = os.path.splitext(os.path.basename(log_path))[0]
+        if counts is None:
+            out.append(f"{name}: analysis could not be completed")
+            continue
+        for key in totals:
+            totals[key] += counts[key]
+        status = "PASSED" if not (counts['total_failed'] or counts['total_ignored'] or counts['total_hangs']) else "FAILED"
+        out.append(f"{name}: {counts['iterations']} Iterations {counts['total_tests']} Tests {counts['total_failed']} Fails "
+                   f"{counts['total_ignored']} Ignored {counts['total_hangs']} Hangs {counts['total_error_msg']} Error Messages "
+                   f"{counts['cmd_hangs']} Hanged Commands - {status}")
+        for test, stats in counts['tests'].items():
+            if stats['failures'] or stats['ignored'] or stats['hangs']:
+                entry = per_test.setdefault(test, {'failures': 0, 'ignored': 0, 'hangs': 0, 'devices': []})
+                entry['failures'] += stats['failures']
+                entry['ignored'] += stats['ignored']
+                entry['hangs'] += stats['hangs']
+                entry['devices'].append(name)
+
+    out.append('')
+    out.append('--- Fleet total ---')
+    out.append(f"{totals['total_tests']} Tests {totals['total_failed']} Fails {totals['total_ignored']} Ignored "
+               f"{totals['total_hangs']} Hangs {totals['total_error_msg']} Error Messages")
+    out.append(f"{totals['iterations']} Iterations {totals['cmd_hangs']} Hanged Commands")
+    out.append('')
+    out.append('--- Tests with failures, ignores or hangs ---')
+    if not per_test:
+        out.append("None")
+    for test, entry in sorted(per_test.items(), key=lambda item: -(item[1]['failures'] + item[1]['hangs'])):
+        out.append(f"'{test}': {entry['failures']} failure(s) {entry['ignored']} ignored {entry['hangs']} hang(s) "
+                   f"on {len(entry['devices'])} device(s): {', '.join(entry['devices'])}")
+    return "\n".join(out) + "\n"
+
+def summarizeFleet(log_dir: str, jobs = None, mode = 'mmap', output = None, use_cache = True,
+                   formats = ('text',), logs = None, write_device_summaries = True) -> dict:
+    """
+    Analyzes every device log under log_dir in a process pool, writing each
+    <log>_summary.log and one consolidated fleet summary.
+
+    Args:
+        log_dir (str): Directory searched recursively for device logs.
+        jobs (int): Worker processes, defaults to the CPU count.
+        mode (str): getSummary.ANALYZE_MODES entry used per log.
+        output (str): Fleet summary path, defaults to <log_dir>/FLEET_SUMMARY_NAME.
+        use_cache (bool): Reuse cached results of logs unchanged since the last run.
+        formats (tuple): getSummary.SUMMARY_FORMATS written per device.
+        logs (list): Only these device logs (e.g. one test plan's) instead of every log under log_dir.
+        write_device_summaries (bool): False only builds the fleet summary, for logs whose run
+            already wrote their summaries (their analyses come from the summary cache).
+
+    Returns:
+        dict: log path -> counts (None where analysis failed).
+    """
+    logs = findDeviceLogs(log_dir) if logs is None else sorted(logs)
+    formats = formats if write_device_summaries else ()
+    output = output or os.path.join(log_dir, FLEET_SUMMARY_NAME)
+    jobs = jobs or os.cpu_count() or 1
+    print(f"Summarizing {len(logs)} device logs under {log_dir} with {jobs} workers...")
+    start = time.perf_counter()
+    devices = {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(_summarizeDevice, log, mode, use_cache, formats) for log in logs]
+        for future in as_completed(futures):
+            log_path, counts, elapsed = future.result()
+            devices[log_path] = counts
+            print(f"  {os.path.basename(log_path)}: {elapsed:.2f} s")
+    devices = {log: devices[log] for log in logs}
+    with open(output, "w") as f:
+        f.write(renderFleetSummary(devices, log_dir))
+    wall = time.perf_counter() - start
+    rate = len(logs) / wall if wall else 0.0
+    print(f"Fleet summary saved to {output}")
+    print(f"{len(logs)} files in {wall:.2f} s ({rate:.2f} files/sec)")
+    return devices
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Summarize every device log in a directory in parallel.")
+    parser.add_argument('-d', '--dir', type=str, default=LOG_OUTPUT_DIR, help="Directory containing device logs.")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument('-m', '--mode', type=str, choices=getSummary.ANALYZE_MODES.keys(), default='mmap',
+                        help="Analysis mode used for each log.")
+    parser.add_argument('-o', '--output', type=str, default=None, help="Fleet summary path.")
+    parser.add_argument('-F', '--format', type=str, nargs='+', choices=getSummary.SUMMARY_FORMATS, default=['text'],
+                        help="Per-device summary formats to write.")
+    parser.add_argument('--no-cache', action='store_true', help="Re-analyze every log even if a cached summary exists.")
+    args = parser.parse_args()
+    summarizeFleet(args.dir, args.jobs, args.mode, args.output, not args.no_cache, args.format)
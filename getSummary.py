@@ -3,255 +3,751 @@
 
 import os
 import re
-from collections import defaultdict
+import io
+import sys
+import gzip
+import bz2
+import lzma
+import mmap
+import json
+import contextlib
 from datetime import datetime
 import time
 import argparse
-import logging
-from constants import LOG_PARSE_MARKER, TEST_MARKERS, TEST_CONTENT_END_MARKERS, HANG_MARKER, ERROR_MSG_MARKERS, SUCCESS_END_MARKER
-from constants import RESULT_PATTERN, RESULT_PATTERN_1, FALSE_TEST_MARKERS
-class MultiLineFormatter(logging.Formatter):
-    def format(self, record):
-        full_msg = super().format(record)
-        lines = full_msg.splitlines()
-        if len(lines) <= 1:
-            return full_msg
-        
-        prefix = full_msg[:full_msg.find(record.getMessage())]
-            # Add prefix to every line
-        return "\n".join([lines[0]] + [prefix + line for line in lines[1:]])
+import csv
+import codecs
+import locale
+from constants import TEST_CONTENT_END_MARKERS
+from constants import RESULT_PATTERN, RESULT_PATTERN_1, EXEC_TIME_MARKER, LOG_STATE_EXT
+from result_store import ResultStore, TestStatsView
+import summary_cache
+from marker_matcher import MATCHER, ByteMarkerScanner, ITERATION, TEST, ERROR, SUCCESS, HANG, EXEC_TIME
+_CONTENT_END_MARKERS = frozenset(TEST_CONTENT_END_MARKERS)
+# LogAnalyzer attributes saved by getState, besides the result store
+_ANALYZER_STATE = ('line_num', 'state', 'last_test_line', 'test_args', 'test_id', 'test_start',
+                   'match', 'match_1', 'hsio_failures', 'match_success', 'result_line_num',
+                   'exec_time_line')
+
+class LogAnalyzer():
+    """
+    Single-pass, line-at-a-time test result parser.
+
+    Replaces the nested line iterators of the original analyzeLog with an explicit
+    state machine so a log can be fed from any source with bounded memory. Results
+    are recorded in a ResultStore; only its occurrence columns grow with the log.
+
+    States mirror the old loops:
+        outer   - between tests
+        test    - inside a test command, waiting for its result or the next test
+        content - saw "Total Execution Time:", waiting for a content end marker
+        result  - saw the content end marker, waiting for RESULT_PATTERN(_1)
+        hsio    - saw RESULT_PATTERN_1 (PASSED - n), next line holds FAILED - n
+    """
+    def __init__(self, first_line = 1):
+        self.store = ResultStore()
+        self.line_num = first_line - 1
+        self.state = 'outer'
+        # Last line number seen inside a test, used for timeout hang lines
+        self.last_test_line = None
+        self._resetTest(None, None, 0)
+
+    def _resetTest(self, test_args, test_id, start_line):
+        self.test_args = test_args
+        self.test_id = test_id
+        self.test_start = start_line
+        self.match = None
+        self.match_1 = None
+        self.hsio_failures = None
+        self.match_success = None
+        self.result_line_num = -1
+        self.exec_time_line = 0
+
+    def feedLine(self, line, line_num = None):
+        """
+        Feeds one log line. line_num defaults to the line after the previous one.
+        """
+        self.line_num = self.line_num + 1 if line_num is None else line_num
+        i = self.line_num
+        state = self.state
+
+        if state == 'outer':
+            self._outerLine(i, line, MATCHER.classify(line))
+        elif state == 'test':
+            self._testLine(i, line, MATCHER.classify(line))
+        elif state == 'content':
+            # Look for the end of test content within 3 lines of the timer
+            if line.strip() in _CONTENT_END_MARKERS:
+                self.state = 'result'
+            elif i >= self.exec_time_line + 3:
+                print("No elapsed timer found")
+                self.state = 'test'
+        elif state == 'result':
+            # Keep only the groups so the parser state can be saved
+            match = RESULT_PATTERN.search(line)
+            match_1 = RESULT_PATTERN_1.search(line)
+            self.match = match.groups() if match else None
+            self.match_1 = match_1.groups() if match_1 else None
+            if self.match or self.match_1:
+                self.result_line_num = i # This is the original line number
+                self.state = 'hsio' if self.match_1 and not self.match else 'test'
+            elif i >= self.exec_time_line + 3: # Stop searching after 3 lines
+                self.state = 'test'
+        elif state == 'hsio':
+            # hsio_ufs prints "PASSED - n" followed by "FAILED - n"
+            fail_match = RESULT_PATTERN_1.search(line)
+            self.hsio_failures = int(fail_match.groups()[0]) if fail_match else None
+            self.state = 'test'
+
+    def feedLines(self, lines):
+        for line in lines:
+            self.feedLine(line)
+        return self
+
+    def _outerLine(self, i, line, found):
+        if ITERATION in found: self.store.iterations += 1
+        if HANG in found:
+            self.store.addCmdHang(i)
+        # Check if the line contains a start of a test command
+        if MATCHER.isTestStart(found):
+            test_args = line[found[TEST]:].strip()
+            test_id = self.store.testId(test_args)
+            self.store.total[test_id] += 1
+            self._resetTest(test_args, test_id, i)
+            self.state = 'test'
+
+    def _testLine(self, j, line, found):
+        self.last_test_line = j
+        if not found: return
+        if ITERATION in found: self.store.iterations += 1
+        elif MATCHER.isTestStart(found):
+            # Close the current test, then handle the line between tests
+            self._closeTest()
+            self._outerLine(j, line, found)
+            return
+        # Add a hang counter when a hang is detected
+        if HANG in found:
+            self.store.addOutcome('hangs', self.test_id, j)
+        # Increment error message counter if line contains error
+        if ERROR in found:
+            self.store.error_msg[self.test_id] += 1
+        # Hardcoded test command success
+        if SUCCESS in found:
+            self.match_success = True
+            self._closeTest()
+            return
+        # Found test results, look for content end marker then the result line
+        if EXEC_TIME in found:
+            self.exec_time_line = j
+            self.state = 'content'
+
+    def _closeTest(self):
+        store, tid = self.store, self.test_id
+        if self.match:
+            tests, failures, ignored = map(int, self.match)
+            if failures > 0:
+                store.addOutcome('failures', tid, self.result_line_num)
+            if ignored > 0:
+                store.addOutcome('ignored', tid, self.result_line_num)
+            if failures == 0 and ignored == 0:
+                store.success[tid] += 1
+        elif self.match_1 and self.hsio_failures is not None:
+            print("hsio_ufs test detected")
+            if self.hsio_failures > 0:
+                store.addOutcome('failures', tid, self.result_line_num)
+            else:
+                store.success[tid] += 1
+        elif self.match_success:
+            print(f"Hardcoded success detected for test '{self.test_args}' starting at line {self.test_start}")
+            store.success[tid] += 1
+        else:
+            print(f"Timeout or no result found for test '{self.test_args}' starting at line {self.test_start}")
+            store.timeout[tid] = 1
+            hang_line = self.last_test_line if self.last_test_line is not None else self.test_start
+            store.addOutcome('hangs', tid, hang_line - 1)
+        self.state = 'outer'
+
+    def finish(self) -> dict:
+        """
+        Closes any test still open at end of input and returns the results dict.
+        """
+        if self.state != 'outer':
+            self._closeTest()
+        return self.store.results()
+
+    def snapshot(self) -> dict:
+        """
+        Returns the results so far without closing a test that is still running, so
+        feeding can continue. The running test counts in total_tests only.
+        """
+        return self.store.results()
+
+    def getState(self) -> dict:
+        """
+        Returns the full parser state as JSON-serializable data, see fromState.
+        """
+        state = {name: getattr(self, name) for name in _ANALYZER_STATE}
+        state['store'] = self.store.toState()
+        return state
+
+    @classmethod
+    def fromState(cls, state: dict):
+        analyzer = cls()
+        for name in _ANALYZER_STATE:
+            setattr(analyzer, name, state[name])
+        analyzer.store = ResultStore.fromState(state['store'])
+        # JSON turns tuples into lists
+        analyzer.match = tuple(analyzer.match) if analyzer.match else analyzer.match
+        analyzer.match_1 = tuple(analyzer.match_1) if analyzer.match_1 else analyzer.match_1
+        return analyzer
+
+def mergeResults(parts) -> dict:
+    """
+    Merges results dicts of consecutive pieces of one log, in log order, into one
+    results dict. Line numbers must already be global.
+    """
+    store = ResultStore()
+    for part in parts:
+        test_stats = part['test_stats']
+        store.extend(test_stats.store if isinstance(test_stats, TestStatsView) else ResultStore.fromResults(part))
+    return store.results()
+
+class _ChunkReader(io.RawIOBase):
+    # Presents an iterable of byte chunks as a raw stream for TextIOWrapper
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        while not self.pending:
+            try:
+                self.pending = next(self.chunks)
+            except StopIteration:
+                return 0
+        n = min(len(buf), len(self.pending))
+        buf[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+def linesFromChunks(chunks, encoding = None):
+    """
+    Splits an iterable of byte chunks into text lines, using the same newline
+    handling as openLog.
+    """
+    return io.TextIOWrapper(io.BufferedReader(_ChunkReader(chunks)), encoding=encoding, errors="replace")
+
+class CaptureAnalyzer():
+    """
+    Parses a device log while it is being captured. run_SOP hands it every byte written
+    to the log (see LogWriterHandler's tap), which is split into lines exactly as openLog
+    reads them back, so finish() returns what analyzeLog would return for the finished
+    file without reading it again.
+    """
+    def __init__(self):
+        self.analyzer = LogAnalyzer()
+        self.decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors="replace"), translate=True)
+        self.partial = ""
+        # Bytes fed, to check that the log holds exactly what was parsed
+        self.bytes = 0
+
+    def feed(self, data: bytes):
+        self.bytes += len(data)
+        text = self.partial + self.decoder.decode(data)
+        lines = text.split("\n")
+        self.partial = lines.pop()
+        feedLine = self.analyzer.feedLine
+        for line in lines:
+            feedLine(line + "\n")
+
+    def finish(self) -> dict:
+        # A last line without a newline is read as is
+        line = self.partial + self.decoder.decode(b"", final=True)
+        if line:
+            self.analyzer.feedLine(line)
+        self.partial = ""
+        return self.analyzer.finish()
+
+def _normalizeResults(results: dict) -> dict:
+    # Classic, JSON-comparable form of a results dict
+    results = dict(results)
+    results['test_stats'] = {test: dict(stats) for test, stats in results['test_stats'].items()}
+    return json.loads(json.dumps(results))
+
+def diffResults(results: dict, expected: dict) -> list:
+    """
+    Returns the names of the fields (test_stats per test) where two results dicts differ,
+    comparing their JSON form so store-backed and classic results compare equal.
+    """
+    results, expected = _normalizeResults(results), _normalizeResults(expected)
+    diff = [key for key in sorted(set(results) | set(expected)) if key != 'test_stats' and results.get(key) != expected.get(key)]
+    tests = set(results['test_stats']) | set(expected['test_stats'])
+    diff += [f"test_stats['{test}']" for test in sorted(tests)
+             if results['test_stats'].get(test) != expected['test_stats'].get(test)]
+    return diff
+
+def openLog(logPath: str):
+    """
+    Opens a log for line iteration. "-" reads stdin, .gz/.bz2/.xz are decompressed.
+    Logs hold raw console bytes, so invalid UTF-8 is replaced as in analyzeLogMapped.
+    """
+    if logPath == '-':
+        return sys.stdin
+    if logPath.endswith('.gz'):
+        return gzip.open(logPath, "rt", errors="replace")
+    if logPath.endswith('.bz2'):
+        return bz2.open(logPath, "rt", errors="replace")
+    if logPath.endswith('.xz'):
+        return lzma.open(logPath, "rt", errors="replace")
+    return open(logPath, "r", errors="replace")
+
+def analyzeLines(lines, first_line = 1) -> dict:
+    """
+    Analyzes any iterable of log lines (file object, pipe, generator) in one pass.
+
+    Args:
+        lines (iterable): Log lines, with or without trailing newlines.
+        first_line (int): Line number of the first line.
+
+    Returns:
+        dict: Same structure as analyzeLog.
+    """
+    return LogAnalyzer(first_line).feedLines(lines).finish()
 
 def analyzeLog(logPath: str) -> dict:
     """
     Analyzes a log file for test results without creating any new files.
+    The file is streamed line by line, so memory does not grow with log size.
 
     Args:
-        logPath (str): The full path to the log file.
+        logPath (str): The full path to the log file, "-" for stdin.
 
     Returns:
         dict: A dictionary containing detailed analysis results, or None if an error occurs.
     """
-    # --- Part 1: Analyze test results from the original log file ---
-    
-    test_stats = defaultdict(lambda: {
-        'total': 0, 'success': 0, 'timeout': False,
-        'failures': [], 'ignored': [], 'hangs': [],
-        'error_msg': 0
-    })
-    cmd_hang = {'count':0, 'line': []}
-    iteration_num = 0
-
     try:
-        with open(logPath, "r") as f:
-            lines = f.readlines()
+        f = openLog(logPath)
     except FileNotFoundError:
         print(f"Error: Log file not found at '{logPath}'")
         return None
 
-    lines_iterator = iter(enumerate(lines, 1)) # Start enumeration at 1 for line numbers
-    line_buffer = None
+    if f is sys.stdin:
+        return analyzeLines(f)
+    with f:
+        return analyzeLines(f)
 
-    while True:
-        # Stay on the same line if line_buffer is not empty
-        if line_buffer:
-            i, line = line_buffer
-            line_buffer = None
-        else:
-        # Manually move onto the next line
-            try:
-                i, line = next(lines_iterator)
-            except StopIteration:
-                break   # End of file
+SUMMARY_FORMATS = ('text', 'json', 'csv')
+SUMMARY_CSV_FIELDS = ['test', 'total', 'passed', 'failed', 'ignored', 'hangs', 'error_msg', 'timeout',
+                      'failure_lines', 'ignored_lines', 'hang_lines', 'iterations', 'cmd_hangs']
 
-        if LOG_PARSE_MARKER in line: iteration_num += 1
-        if HANG_MARKER in line:
-            cmd_hang['count'] += 1
-            cmd_hang['line'].append(i)
-        
-        # Check if the line contains a start of a test command
-        is_test = any(m in line for m in TEST_MARKERS)
-        is_invalid = any(m in line for m in ERROR_MSG_MARKERS + FALSE_TEST_MARKERS)
-        if is_test and not is_invalid:
-            found_indices = (line.find(marker) for marker in TEST_MARKERS if line.find(marker) != -1)
-            marker_index = min(found_indices, default=-1)
-            test_args = line[marker_index:].strip()
-            test_stats[test_args]['total'] += 1
-
-            match = None
-            match_1 = None
-            # To store hard coded success test commands
-            match_success = None
-            
-            result_line_num = -1
-
-            for j, next_line in lines_iterator:
-                is_test_iter = any(m in next_line for m in TEST_MARKERS)
-                is_invalid_iter = any(m in next_line for m in ERROR_MSG_MARKERS + FALSE_TEST_MARKERS)
-                if LOG_PARSE_MARKER in next_line: iteration_num += 1
-                elif is_test_iter and not is_invalid_iter:
-                    # Save current line in outer while loop
-                    line_buffer = (j, next_line)
-                    break
-                # Add a hang counter when a hang is detected
-                if HANG_MARKER in next_line.strip():
-                    test_stats[test_args]['hangs'].append({'count': 1, 'line': j})
-                # Increment error message counter if line contains error 
-                if any(marker in next_line.strip() for marker in ERROR_MSG_MARKERS):
-                    test_stats[test_args]['error_msg'] += 1
-                # Hardcoded test command success
-                if any(marker in next_line.strip() for marker in SUCCESS_END_MARKER):
-                    match_success = True
-                    break
-                # Found test results, store result num in match or match_1
-                # Otherwise, both match is 'None'
-                if "Total Execution Time:" in next_line.strip():
-                    for k, content_end_line in lines_iterator:
-                        if any(marker == content_end_line.strip() for marker in TEST_CONTENT_END_MARKERS):
-                            for l, result_line in lines_iterator:
-                                match = RESULT_PATTERN.search(result_line)                                  
-                                match_1 = RESULT_PATTERN_1.search(result_line)
-                                if match or match_1:
-                                    result_line_num = l # This is the original line number
-                                    break 
-                                if l >= j + 3: # Stop searching after 3 lines
-                                    break
-                            break
-                        if k >= j + 3:
-                            print("No elapsed timer found")
-                            break
-            if match:
-                tests, failures, ignored = map(int, match.groups())
-                if failures > 0:
-                    test_stats[test_args]['failures'].append({'count': 1, 'line': result_line_num})
-                if ignored > 0:
-                    test_stats[test_args]['ignored'].append({'count': 1, 'line': result_line_num})
-                if failures == 0 and ignored == 0:
-                    test_stats[test_args]['success'] += 1
-            elif match_1:
-                print("hsio_ufs test detected")
-                tests = int(match_1.groups()[0])
-                l, next_line = next(lines_iterator)
-                # Find failure
-                match_1 = RESULT_PATTERN_1.search(next_line)
-                failures = int(match_1.groups()[0])
-                if failures > 0:
-                    test_stats[test_args]['failures'].append({'count': 1, 'line': result_line_num})
-                if failures == 0:
-                    test_stats[test_args]['success'] += 1
-            elif match_success:
-                print(f"Hardcoded success detected for test '{test_args}' starting at line {i}")
-                test_stats[test_args]['success'] += 1
-            else:
-                print(f"Timeout or no result found for test '{test_args}' starting at line {i}")
-                test_stats[test_args]['timeout'] = True
-                test_stats[test_args]['hangs'].append({'count': 1, 'line': j-1})
-
-    # --- Part 2: Aggregate data ---
-    total_runs = sum(stats['total'] for stats in test_stats.values())
-    total_passed = sum(stats['success'] for stats in test_stats.values())
-    total_failures = sum(sum(f['count'] for f in stats['failures']) for stats in test_stats.values())
-    total_hangs = sum(sum(h['count'] for h in stats['hangs']) for stats in test_stats.values())
-    total_ignored = sum(sum(i['count'] for i in stats['ignored']) for stats in test_stats.values())
-    timeout_detected = any(stats['timeout'] for stats in test_stats.values())
-    total_error_msg = sum(stats['error_msg'] for stats in test_stats.values())
-
-    results = {
-        "iterations": iteration_num,
-        "total_tests": total_runs,
-        "total_passed": total_passed,
-        "total_failed": total_failures,
-        "total_hangs": total_hangs,
-        "total_ignored": total_ignored,
-        "timeout_flag": timeout_detected,
-        "test_stats": test_stats,
-        "total_error_msg": total_error_msg,
-        "cmd_hang": cmd_hang
-    }
-    return results
-
-def log_test_summary(results_dict: dict, log_path: str):
+def _summaryRows(results_dict: dict) -> list:
+    """
+    Returns one (test, stats) pair per test, in test order, where stats holds the
+    counters plus 'failures', 'ignored' and 'hangs' as lists of (count, line).
+    A store-backed result is read straight from its columns.
+    """
+    test_stats = results_dict['test_stats']
+    rows = []
+    if isinstance(test_stats, TestStatsView):
+        store = test_stats.store
+        by_test = store.outcomesByTest()
+        for tid, test in enumerate(store.names):
+            stats = {'total': store.total[tid], 'success': store.success[tid], 'timeout': bool(store.timeout[tid]),
+                     'error_msg': store.error_msg[tid]}
+            for kind in ('failures', 'ignored', 'hangs'):
+                stats[kind] = [(1, line) for line in by_test[kind][tid]]
+            rows.append((test, stats))
+        return rows
+    for test, stats in test_stats.items():
+        stats = dict(stats)
+        for kind in ('failures', 'ignored', 'hangs'):
+            stats[kind] = [(info['count'], info['line']) for info in stats[kind]]
+        rows.append((test, stats))
+    return rows
+
+def _renderText(results_dict, rows) -> str:
+    out = ['----------------------- Test Summary -----------------------',
+           f'Total iterations: {results_dict["iterations"]}',
+           f"{results_dict['total_tests']} Tests {results_dict['total_failed']} Fails {results_dict['total_ignored']} Ignored "
+           f"{results_dict['total_hangs']} Hangs {results_dict['total_error_msg']} Error Messages"]
+    if results_dict["timeout_flag"]:
+        out.append("\nWARNING: One or more tests may have timed out (result summary not found).")
+
+    if not results_dict['total_failed'] and not results_dict['total_ignored'] and not results_dict['total_hangs']:
+        out.append("\nPASSED")
+        return "\n".join(out) + "\n"
+    # Every section from the same pass over the tests
+    failed, ignored, hanged = [], [], []
+    for test, stats in rows:
+        failed += [f"'{test}': {count} failure(s) found on line {line}" for count, line in stats['failures']]
+        ignored += [f"'{test}': {count} ignored found on line {line}" for count, line in stats['ignored']]
+        hanged += [f"'{test}': {count} hangs found on line {line}" for count, line in stats['hangs']]
+    cmd_hangs = [f"1 hang found on line {line}" for line in results_dict['cmd_hang']['line']]
+    for title, lines in (("Failed tests", failed), ("Ignored tests", ignored), ("Hanged tests", hanged),
+                         ("Hanged commands", cmd_hangs)):
+        out.append(f"\n--- {title} ---")
+        out.extend(lines or ["None"])
+    return "\n".join(out) + "\n"
+
+def _occurrenceLines(occurrences):
+    # [(count, line)] -> one line number per occurrence
+    return [line for count, line in occurrences for _ in range(count)]
+
+def _renderJson(results_dict, rows) -> str:
+    passed = not results_dict['total_failed'] and not results_dict['total_ignored'] and not results_dict['total_hangs']
+    summary = {key: results_dict[key] for key in ('iterations', 'total_tests', 'total_passed', 'total_failed',
+                                                  'total_ignored', 'total_hangs', 'total_error_msg', 'timeout_flag')}
+    summary['status'] = "PASSED" if passed else "FAILED"
+    summary['cmd_hang'] = {'count': results_dict['cmd_hang']['count'], 'line': list(results_dict['cmd_hang']['line'])}
+    summary['tests'] = [{'test': test, 'total': stats['total'], 'passed': stats['success'],
+                         'timeout': stats['timeout'], 'error_msg': stats['error_msg'],
+                         'failures': _occurrenceLines(stats['failures']),
+                         'ignored': _occurrenceLines(stats['ignored']),
+                         'hangs': _occurrenceLines(stats['hangs'])} for test, stats in rows]
+    return json.dumps(summary) + "\n"
+
+def _renderCsv(results_dict, rows) -> str:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=SUMMARY_CSV_FIELDS)
+    writer.writeheader()
+    for test, stats in rows:
+        failures, ignored, hangs = (_occurrenceLines(stats[kind]) for kind in ('failures', 'ignored', 'hangs'))
+        writer.writerow({'test': test, 'total': stats['total'], 'passed': stats['success'], 'failed': len(failures),
+                         'ignored': len(ignored), 'hangs': len(hangs), 'error_msg': stats['error_msg'],
+                         'timeout': int(stats['timeout']), 'failure_lines': " ".join(map(str, failures)),
+                         'ignored_lines': " ".join(map(str, ignored)), 'hang_lines': " ".join(map(str, hangs))})
+    # Whole-log totals, including what is not tied to a test
+    writer.writerow({'test': 'TOTAL', 'total': results_dict['total_tests'], 'passed': results_dict['total_passed'],
+                     'failed': results_dict['total_failed'], 'ignored': results_dict['total_ignored'],
+                     'hangs': results_dict['total_hangs'], 'error_msg': results_dict['total_error_msg'],
+                     'timeout': int(results_dict['timeout_flag']), 'iterations': results_dict['iterations'],
+                     'cmd_hangs': results_dict['cmd_hang']['count']})
+    return buf.getvalue()
+
+_RENDERERS = {'text': _renderText, 'json': _renderJson, 'csv': _renderCsv}
+
+def renderSummary(results_dict: dict, fmt: str = 'text') -> str:
+    """
+    Renders an analyzeLog result as one string in a single pass over its tests.
+
+    Args:
+        results_dict (dict): The dictionary returned by analyzeLog, or None if analysis failed.
+        fmt (str): 'text' (the _summary.log format), 'json' or 'csv'.
+    """
+    if not results_dict:
+        if fmt == 'json':
+            return json.dumps({'error': "Analysis could not be completed."}) + "\n"
+        if fmt == 'csv':
+            return ",".join(SUMMARY_CSV_FIELDS) + "\n"
+        return "Analysis could not be completed.\n"
+    return _RENDERERS[fmt](results_dict, _summaryRows(results_dict))
+
+def log_test_summary(results_dict: dict, log_path: str, fmt: str = 'text', append: bool = True):
     """
     Creates and saves a formatted summary from a test results dictionary to a log file.
+    The summary is rendered in memory and written with one write; text summaries are
+    appended to the file like before, JSON and CSV replace it.
 
     Args:
         results_dict (dict): The dictionary returned by analyzeLog.
         log_path (str): The path to the file where the summary should be saved.
+        fmt (str): One of SUMMARY_FORMATS.
+        append (bool): Append text summaries; False replaces the file, as for a re-summarized log.
     """
-    # Use a unique logger name to avoid conflicts
-    logger = logging.getLogger('summary_logger')
-    logger.setLevel(logging.INFO)
-    
+    summary = renderSummary(results_dict, fmt)
     # Ensure the directory for the log file exists
-    os.makedirs(os.path.dirname(log_path), exist_ok=True)
-    
-    # Create a file handler that appends to the specified log file
-    fh = logging.FileHandler(log_path, mode="a")
-    fh.setFormatter(MultiLineFormatter("%(message)s"))
-    logger.addHandler(fh)
+    if os.path.dirname(log_path):
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    # csv writes its own \r\n line ends
+    with open(log_path, "a" if fmt == 'text' and append else "w", newline="" if fmt == 'csv' else None) as f:
+        f.write(summary)
 
-    if not results_dict:
-        logger.error("Analysis could not be completed.")
-        logger.removeHandler(fh) # Clean up handler
-        return
-    
-    logger.info('----------------------- Test Summary -----------------------')
-    logger.info(f'Total iterations: {results_dict["iterations"]}')
-    logger.info(f"{results_dict['total_tests']} Tests {results_dict['total_failed']} Fails {results_dict['total_ignored']} Ignored {results_dict['total_hangs']} Hangs {results_dict['total_error_msg']} Error Messages")
-    if results_dict["timeout_flag"]:
-        logger.warning("\nWARNING: One or more tests may have timed out (result summary not found).")
+_LINE_BREAK = re.compile(rb"[\r\n]")
+READ_BLOCK = 1 << 20
+# Lines after "Total Execution Time:" read by position: up to 3 for the content end
+# marker, one more for the result line and one for the hsio FAILED - n line
+_EXEC_TIME_WINDOW = 5
+# Bytes per slice when counting line breaks, so the copy stays small
+_COUNT_SLICE = 1 << 24
 
-    if not results_dict['total_failed'] and not results_dict['total_ignored'] and not results_dict['total_hangs']:
-        logger.info("\nPASSED")
-    else:
-        logger.info("\n--- Failed tests ---")
-        failed_tests_found = False
-        for test, stats in results_dict['test_stats'].items():
-            for fail_info in stats['failures']:
-                logger.info(
-                    f"'{test}': {fail_info['count']} failure(s) found on line {fail_info['line']}"
-                )
-                failed_tests_found = True
-        if not failed_tests_found:
-            logger.info("None")
-        
-        logger.info("\n--- Ignored tests ---")
-        ignored_tests_found = False
-        for test, stats in results_dict['test_stats'].items():
-            for ignore_info in stats['ignored']:
-                logger.info(
-                    f"'{test}': {ignore_info['count']} ignored found on line {ignore_info['line']}"
-                )
-                ignored_tests_found = True
-        if not ignored_tests_found:
-            logger.info("None")
-        
-        logger.info("\n--- Hanged tests ---")
-        hang_tests_found = False
-        for test, stats in results_dict['test_stats'].items():
-            for hang_info in stats['hangs']:
-                logger.info(
-                    f"'{test}': {hang_info['count']} hangs found on line {hang_info['line']}"
-                )
-                hang_tests_found = True
-        if not hang_tests_found:
-            logger.info("None")
-        logger.info("\n--- Hanged commands ---")
-        if results_dict.get("cmd_hang").get("count") != 0:
-            for hang_line in results_dict.get("cmd_hang").get("line"):
-                logger.info(f"1 hang found on line {hang_line}")
+def _countLineBreaks(mm, start, end, has_cr = True):
+    # Same line breaks as open(path, "r"): \n, \r\n and a lone \r
+    count = 0
+    while start < end:
+        stop = min(start + _COUNT_SLICE, end)
+        if stop < end and mm[stop - 1:stop] == b'\r':
+            stop += 1   # Keep \r\n in one slice
+        seg = mm[start:stop]
+        count += seg.count(b'\n')
+        if has_cr:
+            count += seg.count(b'\r') - seg.count(b'\r\n')
+        start = stop
+    return count
+
+def _lineEnd(mm, pos):
+    # Returns (end of line content, start of next line)
+    brk = _LINE_BREAK.search(mm, pos)
+    if brk is None:
+        return len(mm), len(mm)
+    end = brk.start()
+    if mm[end:end + 2] == b'\r\n':
+        return end, end + 2
+    return end, end + 1
+
+def _lineStart(mm, pos):
+    # Search backwards in growing windows so a file without \r is not rescanned
+    width = 256
+    lo = pos
+    while lo > 0:
+        lo = max(0, pos - width)
+        brk = max(mm.rfind(b'\n', lo, pos), mm.rfind(b'\r', lo, pos))
+        if brk != -1:
+            return brk + 1
+        width *= 4
+    return 0
+
+def iterMarkedLines(mm, start = 0, end = None, first_line = 1):
+    """
+    Yields (line number, byte offset, line) for only the lines of a mapped log that
+    can change LogAnalyzer state, found by searching the raw buffer for each marker:
+        - lines holding any marker
+        - the lines read by position after "Total Execution Time:"
+        - the last line (its number closes a test still open at end of file)
+    Every other line is a no-op for the parser and is never decoded.
+
+    start/end limit the scan to a byte range that begins at a line start (first_line)
+    and ends at a line start or end of file.
+    """
+    size = len(mm) if end is None else end
+    exec_marker = EXEC_TIME_MARKER.encode('utf-8')
+    scanner = ByteMarkerScanner(mm, MATCHER.bytes_markers, start)
+    has_cr = mm.find(b'\r', start, size) != -1
+    cur_start, cur_line = start, first_line  # Next undecoded line and its number
+    window_end = 0                           # Decode every line up to this line number
+    while cur_start < size:
+        if cur_line <= window_end:
+            line_start, line_num = cur_start, cur_line
         else:
-            logger.info("None")
+            hit = scanner.next(cur_start)
+            if hit == -1 or hit >= size:
+                break
+            line_start = _lineStart(mm, hit)
+            line_num = cur_line + _countLineBreaks(mm, cur_start, line_start, has_cr)
+        line_end, next_start = _lineEnd(mm, line_start)
+        raw = mm[line_start:line_end]
+        if exec_marker in raw:
+            window_end = line_num + _EXEC_TIME_WINDOW
+        yield line_num, line_start, raw.decode('utf-8', errors='replace') + ('\n' if next_start > line_end else '')
+        cur_start, cur_line = next_start, line_num + 1
 
-    # Clean up by removing the handler so the file is closed and logger is freed
-    logger.removeHandler(fh)
-    
-def main(log_file: str):
-    # Create a summary log file from original log
-    analysis = analyzeLog(log_file)
+    if cur_start < size:
+        # Last line of the range, after the final marker
+        last_end = size
+        if mm[last_end - 1:last_end] == b'\n':
+            last_end -= 2 if mm[last_end - 2:last_end] == b'\r\n' else 1
+        elif mm[last_end - 1:last_end] == b'\r':
+            last_end -= 1
+        line_start = _lineStart(mm, last_end)
+        if line_start >= cur_start:
+            line_num = cur_line + _countLineBreaks(mm, cur_start, line_start, has_cr)
+            yield line_num, line_start, mm[line_start:last_end].decode('utf-8', errors='replace') + ('\n' if last_end < size else '')
+
+def analyzeLogMapped(logPath: str) -> dict:
+    """
+    Analyzes a log by scanning the memory-mapped raw bytes for markers and decoding
+    only the lines the parser needs. Produces the same results as analyzeLog; run
+    time is dominated by the marker search over the file rather than per-line Python.
+
+    Args:
+        logPath (str): The full path to an uncompressed log file.
+
+    Returns:
+        dict: Same structure as analyzeLog, or None if the file does not exist.
+    """
+    try:
+        f = open(logPath, "rb")
+    except FileNotFoundError:
+        print(f"Error: Log file not found at '{logPath}'")
+        return None
+
+    with f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return analyzeLines([])
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            analyzer = LogAnalyzer()
+            for line_num, _, line in iterMarkedLines(mm):
+                analyzer.feedLine(line, line_num)
+            return analyzer.finish()
+
+def analyzeLogParallel(logPath: str) -> dict:
+    """
+    Splits the log at iteration boundaries using its sidecar index and analyzes the
+    pieces in a process pool. See log_index.analyzeLogChunked.
+    """
+    # Imported here, log_index builds on this module
+    from log_index import analyzeLogChunked
+    return analyzeLogChunked(logPath)
+
+def statePath(logPath: str) -> str:
+    return f"{logPath}{LOG_STATE_EXT}"
+
+def _completeLinesEnd(f, start, end):
+    # Offset just past the last complete line in [start, end). A trailing \r may
+    # still be followed by \n, so it does not complete a line yet.
+    pos = end
+    while pos > start:
+        block_start = max(start, pos - READ_BLOCK)
+        f.seek(block_start)
+        block = f.read(pos - block_start)
+        if pos == end and block.endswith(b'\r'):
+            block = block[:-1]
+        brk = max(block.rfind(b'\n'), block.rfind(b'\r'))
+        if brk != -1:
+            return block_start + brk + 1
+        pos = block_start
+    return start
+
+def analyzeLogIncremental(logPath: str, final = True) -> dict:
+    """
+    Analyzes only what was appended to a log since the previous call. The parser
+    state and the byte offset it reached are saved next to the log (statePath) and
+    the next call resumes from there, so a running log can be re-summarized every
+    few seconds without re-reading it. A log that shrank or was replaced starts over.
+
+    Args:
+        logPath (str): The full path to an uncompressed log file.
+        final (bool): Close a test still running at the end, as analyzeLog does.
+            False reports it as in progress (live summaries).
+
+    Returns:
+        dict: Same structure as analyzeLog, or None if the file does not exist.
+    """
+    try:
+        f = open(logPath, "rb")
+    except FileNotFoundError:
+        print(f"Error: Log file not found at '{logPath}'")
+        return None
+
+    with f:
+        st = os.fstat(f.fileno())
+        saved = None
+        try:
+            with open(statePath(logPath), "r") as sf:
+                saved = json.load(sf)
+        except (FileNotFoundError, ValueError):
+            pass
+        analyzer = None
+        if saved and saved.get('inode') == st.st_ino and saved.get('offset', 0) <= st.st_size:
+            try:
+                analyzer = LogAnalyzer.fromState(saved['analyzer'])
+                offset = saved['offset']
+            except (KeyError, TypeError, ValueError):
+                print(f"Saved state for '{logPath}' is from an older version, starting over")
+        if analyzer is None:
+            analyzer = LogAnalyzer()
+            offset = 0
+
+        end = _completeLinesEnd(f, offset, st.st_size)
+        if end > offset:
+            f.seek(offset)
+            analyzer.feedLines(linesFromChunks(_readBlocks(f, end - offset)))
+        # Unterminated last line, only parsed for a final result
+        f.seek(end)
+        tail = f.read(st.st_size - end) if final else b""
+
+    tmp_path = f"{statePath(logPath)}.tmp"
+    with open(tmp_path, "w") as sf:
+        json.dump({'inode': st.st_ino, 'offset': end, 'analyzer': analyzer.getState()}, sf)
+    os.replace(tmp_path, statePath(logPath))
+
+    if not final:
+        return analyzer.snapshot()
+    # Finish a copy so the saved state can keep resuming
+    analyzer = LogAnalyzer.fromState(json.loads(json.dumps(analyzer.getState())))
+    return analyzer.feedLines(linesFromChunks([tail])).finish()
+
+def _readBlocks(f, length):
+    while length > 0:
+        block = f.read(min(READ_BLOCK, length))
+        if not block:
+            break
+        length -= len(block)
+        yield block
+
+def followLog(logPath: str, interval: float, summary_path: str = None):
+    """
+    Re-summarizes a log that is still being written every interval seconds until
+    interrupted, rewriting summary_path each time.
+    """
+    summary_path = summary_path or summaryPath(logPath, live=True)
+    try:
+        while True:
+            with contextlib.redirect_stdout(io.StringIO()):
+                analysis = analyzeLogIncremental(logPath, final=False)
+            if analysis is not None:
+                if os.path.exists(summary_path):
+                    os.remove(summary_path)
+                log_test_summary(analysis, summary_path)
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] Iteration {analysis['iterations']}: "
+                      f"{analysis['total_tests']} Tests {analysis['total_failed']} Fails "
+                      f"{analysis['total_ignored']} Ignored {analysis['total_hangs']} Hangs "
+                      f"{analysis['cmd_hang']['count']} Hanged commands")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+ANALYZE_MODES = {
+    'stream': analyzeLog,
+    'mmap': analyzeLogMapped,
+    'parallel': analyzeLogParallel,
+    'incremental': analyzeLogIncremental,
+}
+
+# Summary file extension per format
+SUMMARY_EXTS = {'text': ".log", 'json': ".json", 'csv': ".csv"}
+
+def summaryPath(log_file: str, live = False, fmt = 'text') -> str:
+    # <dir>/<name>.log -> <dir>/<name>_summary.log (or _live_summary.log, _summary.json, ...)
     dir, base = os.path.split(log_file)
     base, ext = os.path.splitext(base)
-    summary_path = os.path.join(dir, f"{base}_summary.log")
-    log_test_summary(analysis, summary_path)
+    suffix = "_live_summary" if live else "_summary"
+    return os.path.join(dir, f"{base}{suffix}{SUMMARY_EXTS[fmt]}")
+
+def capturedAnalysis(log_file: str, captured: CaptureAnalyzer, mode: str = 'stream', verify: bool = False) -> dict:
+    """
+    Returns the results parsed while log_file was captured, or None if the log does not
+    hold exactly the captured bytes (e.g. it was appended to an older log). With verify
+    the log is also parsed again and that result wins if the two differ.
+    """
+    analysis = captured.finish()
+    size = os.path.getsize(log_file) if os.path.isfile(log_file) else None
+    if size != captured.bytes:
+        print(f"Captured {captured.bytes} bytes but {log_file} holds {size}, parsing the log instead")
+        return None
+    if verify:
+        expected = ANALYZE_MODES[mode](log_file)
+        diff = diffResults(analysis, expected)
+        if diff:
+            print(f"Captured results differ from the log in {', '.join(diff[:5])}, using the log")
+            return expected
+    return analysis
+
+def main(log_file: str, mode: str = 'stream', use_cache: bool = True, formats = ('text',), captured = None,
+         verify: bool = False):
+    # Create a summary log file from original log, reusing the cached analysis if unchanged.
+    # With captured (a CaptureAnalyzer fed while the log was written) the log is not read again
+    analysis = capturedAnalysis(log_file, captured, mode, verify) if captured is not None else None
+    if analysis is not None:
+        if use_cache:
+            summary_cache.storeCached(log_file, analysis)
+    elif use_cache:
+        analysis = summary_cache.cachedAnalysis(log_file, ANALYZE_MODES[mode])
+    else:
+        analysis = ANALYZE_MODES[mode](log_file)
+    for fmt in formats:
+        log_test_summary(analysis, summaryPath(log_file, fmt=fmt), fmt)
 
 # --- Example Usage ---
 if __name__ == '__main__':
@@ -260,11 +756,26 @@ if __name__ == '__main__':
     parser.add_argument('-l', '--log', type=str, required=False, help="Path to the log .txt file.",
                         # default=f'/usr/local/google/home/chinmingryan/Documents/logs/mbu/{ip}.log')
                         default=f'/usr/local/google/home/chinmingryan/Documents/logs/mbu/test_command_output/mbu_b0_v5p2_ebu_883217b6e6e5ed766c652e82e8f24325.log')
+    parser.add_argument('-m', '--mode', type=str, choices=ANALYZE_MODES.keys(), default='stream',
+                        help="stream: read line by line. mmap: scan raw bytes, decode only marker lines. "
+                             "parallel: analyze iterations in a process pool using the log index. "
+                             "incremental: resume from the state saved by the previous run.")
+    parser.add_argument('-f', '--follow', type=float, default=None, metavar='SECONDS',
+                        help="Keep refreshing <log>_live_summary.log every SECONDS while the log is written.")
+    parser.add_argument('-F', '--format', type=str, nargs='+', choices=SUMMARY_FORMATS, default=['text'],
+                        help="Summary formats to write: text (<log>_summary.log), json (_summary.json), csv (_summary.csv).")
+    parser.add_argument('--no-cache', action='store_true', help="Re-analyze the log even if a cached summary exists.")
+    parser.add_argument('--clear-cache', action='store_true', help="Remove every cached summary before running.")
     args = parser.parse_args()
+    if args.clear_cache:
+        print(f"Removed {summary_cache.clearCache()} cached summaries")
+    if args.follow is not None:
+        followLog(args.log, args.follow)
+        sys.exit(0)
     start_time = time.perf_counter()
 
     # Create a summary log file from original log
-    main(args.log)
+    main(args.log, args.mode, not args.no_cache, args.format)
 
     # Print out elapsed time
     end_time = time.perf_counter()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# Author: Chin Ming Ryan Wong
+
+import collections, threading, time
+from constants import UNIT_MAX_ATTEMPTS, DEVICE_MAX_FAILURES
+
+SCHEDULES = ('per_device', 'shared', 'sharded')
+
+class IterationPool():
+    """
+    Iterations of a test plan handed out one at a time to the devices running it. With
+    per_device scheduling every device gets its own pool of --iteration units; with shared
+    scheduling the whole fleet pulls from one, so a fast board simply runs more iterations
+    and the run ends when the work is done rather than when the slowest board is. Sharded
+    runs fill the pool with (iteration, segment) units instead (plan_shards.shardUnits).
+
+    A unit whose iteration failed (serial error) or was abandoned (the device task died)
+    goes back to the front of the pool, preferably for another device, and is run at most
+    max_attempts times in all. A device stops taking units after max_failures failures in a row, so a dead board
+    cannot drain the pool. Thread-safe; also used as is from the asyncio engine.
+
+    Args:
+        iterations (int | list): Units in the pool: a count of iterations numbered from 0, or
+            the units themselves.
+        retry (bool): Put failed units back. False keeps the old per-device behaviour,
+            where a failed iteration is simply counted.
+        max_attempts (int): Most times one unit is run.
+        max_failures (int): Failures in a row after which a device is retired.
+    """
+    def __init__(self, iterations, retry = True, max_attempts = UNIT_MAX_ATTEMPTS, max_failures = DEVICE_MAX_FAILURES):
+        self.lock = threading.Lock()
+        units = range(int(iterations)) if isinstance(iterations, (int, str)) else iterations
+        self.pending = collections.deque(units)
+        self.total = len(self.pending)
+        # Sharded plans hand out (iteration, segment) units instead (plan_shards.shardUnits)
+        self.unit_name = "segment runs" if self.pending and isinstance(self.pending[0], tuple) else "iterations"
+        self.retry = retry
+        self.max_attempts = max_attempts
+        self.max_failures = max_failures
+        self.attempts = collections.Counter()
+        self.failed_on = collections.defaultdict(set)
+        self.dropped = []
+        self.running = {}
+        self.stats = {}
+        self.start = time.monotonic()
+
+    def _device(self, device) -> dict:
+        return self.stats.setdefault(device, {'done': 0, 'failed': 0, 'requeued': 0, 'seconds': 0.0,
+                                              'in_a_row': 0, 'retired': False})
+
+    def take(self, device):
+        """
+        Returns the next unit for device, or None once the pool is empty or the device is retired.
+        A unit still running on device that was not reported is counted as done.
+        """
+        with self.lock:
+            if device in self.running:
+                self._finish(device, True)
+            stats = self._device(device)
+            if stats['retired'] or not self.pending:
+                return None
+            # Prefer a unit that has not already failed on this device
+            unit = next((u for u in self.pending if device not in self.failed_on[u]), self.pending[0])
+            self.pending.remove(unit)
+            self.attempts[unit] += 1
+            self.running[device] = (unit, time.monotonic())
+            return unit
+
+    def units(self, device):
+        """
+        Yields units for device until the pool is empty (see take()).
+        """
+        while True:
+            unit = self.take(device)
+            if unit is None:
+                return
+            yield unit
+
+    def done(self, device):
+        with self.lock:
+            self._finish(device, True)
+
+    def failed(self, device):
+        with self.lock:
+            self._finish(device, False)
+
+    def abandon(self, device):
+        """
+        Called when the device task dies: its running unit is put back and the device retired.
+        """
+        with self.lock:
+            self._finish(device, False, requeue=True)
+            self._device(device)['retired'] = True
+
+    def _finish(self, device, ok, requeue = None):
+        if device not in self.running:
+            return
+        unit, start = self.running.pop(device)
+        stats = self._device(device)
+        stats['seconds'] += time.monotonic() - start
+        if ok:
+            stats['done'] += 1
+            stats['in_a_row'] = 0
+            return
+        stats['failed'] += 1
+        stats['in_a_row'] += 1
+        self.failed_on[unit].add(device)
+        if stats['in_a_row'] >= self.max_failures and self.retry:
+            stats['retired'] = True
+        if not (self.retry if requeue is None else requeue):
+            return
+        if self.attempts[unit] < self.max_attempts:
+            stats['requeued'] += 1
+            self.pending.appendleft(unit)
+        else:
+            self.dropped.append(unit)
+
+    def remaining(self) -> int:
+        with self.lock:
+            return len(self.pending)
+
+    def report(self, name = "") -> str:
+        """
+        Per-device iterations, failures and time, and what became of every unit.
+        """
+        with self.lock:
+            out = [f"--- Iteration schedule{f' ({name})' if name else ''} ---"]
+            for device, stats in sorted(self.stats.items()):
+                each = stats['seconds'] / (stats['done'] + stats['failed']) if stats['done'] + stats['failed'] else 0.0
+                out.append(f"{device}: {stats['done']} done {stats['failed']} failed {stats['requeued']} requeued, "
+                           f"{stats['seconds']:.1f} s ({each:.1f} s each)"
+                           f"{' - retired' if stats['retired'] else ''}")
+            done = sum(stats['done'] for stats in self.stats.values())
+            undone = len(self.pending) + len(self.running)
+            out.append(f"{done}/{self.total} {self.unit_name} done in {time.monotonic() - self.start:.1f} s, "
+                       f"{len(self.dropped)} dropped after {self.max_attempts} attempts, {undone} not run")
+            return "\n".join(out)
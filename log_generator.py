@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# Author: Chin Ming Ryan Wong
+
+import argparse
+import json
+import random
+from constants import LOG_PARSE_MARKER, HANG_MARKER, ERROR_MSG_MARKERS, TEST_CONTENT_END_MARKERS
+from constants import SUCCESS_END_MARKER, EXEC_TIME_MARKER
+
+# Test plan rows per profile: (kind, command). kind picks how the test reports its result:
+#   result   - RESULT_PATTERN "n Tests n Failures n Ignored" after the content end marker
+#   hsio     - RESULT_PATTERN_1 "PASSED - n" / "FAILED - n" (jedec_ufs hsio tests)
+#   passed   - hardcoded SUCCESS_END_MARKER line, closes the test immediately
+PROFILES = {
+    'apc': [
+        ('result', "google_tests -n dma_loopback -a 2"),
+        ('result', "google_tests -n cpu_cache_stress -a 4"),
+        ('result', "google_tests -n ddr_march_c -a 1"),
+        ('hsio', "jedec_ufs hsio_eye_scan -g 4"),
+        ('result', "google_tests -n pcie_link_check -a 2"),
+        ('passed', "gsa run_selftest 3"),
+        ('result', "google_tests -n thermal_sensor_read -a 1"),
+        ('hsio', "jedec_ufs hsio_loopback -g 3"),
+    ],
+    'aoss': [
+        ('passed', "aon toolbox_selftest -c 1"),
+        ('result', "google_tests -n aoss_mailbox -a 2"),
+        ('passed', "aon sensor_core_ping -c 3"),
+        ('result', "google_tests -n aoss_timer_drift -a 1"),
+        ('passed', "aon dvfs_walk -c 2"),
+    ],
+}
+PROMPT = "gsp ] "
+# Lines printed between iterations while the device reboots, none contain a marker
+BOOT_LINES = [
+    "Android Bootloader - UART_DM Initialized!!!",
+    "[0000.012] LK: boot reason 0x00000004",
+    "[0000.034] LK: ddr training done in 212 ms",
+    "[0000.051] LK: entering shell",
+]
+# Pre-rendered content blocks per test, so generating GBs is not per-line formatting bound
+_CONTENT_VARIANTS = 8
+
+def _contentBlock(rng, tag, kind):
+    # (lines, error line count) of one test's output before its result
+    lines = []
+    errors = 0
+    for k in range(rng.randint(5, 60)):
+        if rng.random() < 0.02:
+            lines.append(f"{rng.choice(ERROR_MSG_MARKERS)}E {tag}: timeout waiting for channel {k % 8}\x1b[0m")
+            errors += 1
+        elif kind == 'passed' and tag.startswith('aon') and k == 0:
+            # FALSE_TEST_MARKERS noise inside a test, never a test start
+            lines.append(f"aon = {rng.randint(0, 3)}")
+        else:
+            lines.append(f"[{k * 0.000731:10.6f}] I {tag}: step {k} value=0x{rng.getrandbits(32):08x} ok")
+    return lines, errors
+
+class LogGenerator():
+    """
+    Writes synthetic device logs in the format PortRunner records, together with the
+    exact analyzeLog results expected for them (the golden result).
+
+    Iterations start with LOG_PARSE_MARKER and run the profile's test plan. Each test
+    passes, fails, reports ignored cases, or hangs; a hang ends the iteration like
+    "Skipping to next reboot" does. Other commands occasionally hang too, which the
+    parser counts as a command hang, or as a hang of the test still open before them.
+    ANSI error lines appear inside test output.
+
+    Args:
+        seed (int): Random seed, the same seed and size give the same log.
+        profile (str): PROFILES entry, 'apc' or 'aoss'.
+        fail_rate, ignore_rate, hang_rate, cmd_hang_rate (float): Per-test probabilities.
+    """
+    def __init__(self, seed = 0, profile = 'apc', fail_rate = 0.03, ignore_rate = 0.02, hang_rate = 0.005,
+                 cmd_hang_rate = 0.002):
+        self.rng = random.Random(seed)
+        self.plan = PROFILES[profile]
+        self.fail_rate = fail_rate
+        self.ignore_rate = ignore_rate
+        self.hang_rate = hang_rate
+        self.cmd_hang_rate = cmd_hang_rate
+        self.content = {command: [_contentBlock(self.rng, command.split()[-3] if kind == 'result' else command.split()[0], kind)
+                                  for _ in range(_CONTENT_VARIANTS)]
+                        for kind, command in self.plan}
+
+    def _reset(self):
+        self.lines = []
+        self.line_num = 0
+        self.bytes_written = 0
+        self.test_stats = {}
+        self.iterations = 0
+        self.cmd_hang = []
+        # Expected parser state: test still open (no hardcoded success seen) and whether it has a result
+        self.open_test = None
+        self.open_has_result = False
+
+    def _emit(self, line):
+        self.lines.append(line)
+        self.line_num += 1
+        self.bytes_written += len(line) + 1
+        return self.line_num
+
+    def _stats(self, command):
+        return self.test_stats.setdefault(command, {
+            'total': 0, 'success': 0, 'timeout': False,
+            'failures': [], 'ignored': [], 'hangs': [],
+            'error_msg': 0
+        })
+
+    def _closeOpenTest(self, closing_line):
+        # What the parser records for the open test when the next test starts at closing_line
+        if self.open_test is not None and not self.open_has_result:
+            stats = self._stats(self.open_test)
+            stats['timeout'] = True
+            stats['hangs'].append({'count': 1, 'line': closing_line - 1})
+        self.open_test = None
+
+    def _hang(self):
+        line = self._emit(HANG_MARKER)
+        if self.open_test is None:
+            self.cmd_hang.append(line)
+        else:
+            self._stats(self.open_test)['hangs'].append({'count': 1, 'line': line})
+        self._emit("-------------Skipping to next reboot-------------")
+
+    def _runTest(self, kind, command):
+        # Returns False if the test hung
+        rng = self.rng
+        start = self._emit(f"{PROMPT}{command}")
+        self._closeOpenTest(start)
+        stats = self._stats(command)
+        stats['total'] += 1
+        self.open_test, self.open_has_result = command, False
+
+        content, errors = rng.choice(self.content[command])
+        hang = rng.random() < self.hang_rate
+        if hang:
+            content = content[:rng.randint(1, len(content))]
+            errors = sum(1 for line in content if line[:5] in ERROR_MSG_MARKERS)
+        for line in content:
+            self._emit(line)
+        stats['error_msg'] += errors
+        if hang:
+            self._hang()
+            return False
+
+        if kind == 'passed':
+            self._emit(SUCCESS_END_MARKER[1] if command.startswith('aon') else SUCCESS_END_MARKER[0])
+            stats['success'] += 1
+            self.open_test = None
+            return True
+
+        self._emit(f"{EXEC_TIME_MARKER} {rng.randint(20, 90000)} ms")
+        failures = rng.random() < self.fail_rate
+        if kind == 'hsio':
+            self._emit(TEST_CONTENT_END_MARKERS[1])
+            lanes = rng.randint(2, 16)
+            failed = rng.randint(1, lanes) if failures else 0
+            result_line = self._emit(f"PASSED - {lanes - failed}")
+            self._emit(f"FAILED - {failed}")
+            ignored = 0
+        else:
+            self._emit(TEST_CONTENT_END_MARKERS[0])
+            cases = rng.randint(1, 40)
+            failed = rng.randint(1, cases) if failures else 0
+            ignored = rng.randint(1, cases) if rng.random() < self.ignore_rate else 0
+            result_line = self._emit(f"{cases} Tests {failed} Failures {ignored} Ignored")
+        self._emit(PROMPT.strip())
+        self.open_has_result = True
+        if failed:
+            stats['failures'].append({'count': 1, 'line': result_line})
+        if ignored:
+            stats['ignored'].append({'count': 1, 'line': result_line})
+        if not failed and not ignored:
+            stats['success'] += 1
+        return True
+
+    def _iteration(self):
+        rng = self.rng
+        for line in BOOT_LINES:
+            self._emit(line)
+        self._emit(f"{PROMPT}{LOG_PARSE_MARKER}")
+        self.iterations += 1
+        self._emit(f"serial_num: 0x{rng.getrandbits(64):016x}")
+        for kind, command in self.plan:
+            if not self._runTest(kind, command):
+                return
+            if rng.random() < self.cmd_hang_rate:
+                # A non-test command that never returns
+                self._emit(f"{PROMPT}otp_tool read_fuse 0x{rng.getrandbits(8):02x}")
+                self._hang()
+                return
+
+    def writeLog(self, path: str, size: int) -> dict:
+        """
+        Writes whole iterations until the log is at least size bytes.
+
+        Returns:
+            dict: The expected analyzeLog results (classic test_stats dicts).
+        """
+        self._reset()
+        with open(path, "w", newline="\n") as f:
+            while self.bytes_written < size or self.iterations == 0:
+                self._iteration()
+                if len(self.lines) >= 50000:
+                    f.write("\n".join(self.lines) + "\n")
+                    self.lines = []
+            if self.lines:
+                f.write("\n".join(self.lines) + "\n")
+            self.lines = []
+        # The parser closes a test left open at end of file using the last line
+        self._closeOpenTest(self.line_num)
+        return self.expected()
+
+    def expected(self) -> dict:
+        stats = self.test_stats.values()
+        return {
+            "iterations": self.iterations,
+            "total_tests": sum(s['total'] for s in stats),
+            "total_passed": sum(s['success'] for s in stats),
+            "total_failed": sum(len(s['failures']) for s in stats),
+            "total_hangs": sum(len(s['hangs']) for s in stats),
+            "total_ignored": sum(len(s['ignored']) for s in stats),
+            "timeout_flag": any(s['timeout'] for s in stats),
+            "test_stats": self.test_stats,
+            "total_error_msg": sum(s['error_msg'] for s in stats),
+            "cmd_hang": {'count': len(self.cmd_hang), 'line': self.cmd_hang}
+        }
+
+def goldenPath(logPath: str) -> str:
+    return f"{logPath}.golden.json"
+
+def parseSize(text: str) -> int:
+    # "10M", "5G", "512K" or plain bytes
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def generateLog(path: str, size: int, seed = 0, profile = 'apc') -> dict:
+    """
+    Writes a synthetic log of at least size bytes and its golden result next to it.
+
+    Returns:
+        dict: The golden (expected analyzeLog) result.
+    """
+    expected = LogGenerator(seed, profile).writeLog(path, size)
+    with open(goldenPath(path), "w") as f:
+        json.dump(expected, f)
+    return expected
+
+def loadGolden(logPath: str) -> dict:
+    with open(goldenPath(logPath), "r") as f:
+        return json.load(f)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic device log and its golden analyzeLog result.")
+    parser.add_argument('-o', '--output', type=str, required=True, help="Path of the log to write.")
+    parser.add_argument('-s', '--size', type=str, default="10M", help="Target size, e.g. 10M, 1G.")
+    parser.add_argument('-p', '--profile', type=str, choices=PROFILES.keys(), default='apc', help="Test plan profile.")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed.")
+    args = parser.parse_args()
+    golden = generateLog(args.output, parseSize(args.size), args.seed, args.profile)
+    print(f"Wrote {args.output}: {golden['iterations']} iterations, {golden['total_tests']} tests, "
+          f"{golden['total_failed']} fails, {golden['total_hangs']} hangs -> {goldenPath(args.output)}")
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# Author: Chin Ming Ryan Wong
+
+import argparse
+import bisect
+import json
+import mmap
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import getSummary
+from getSummary import LogAnalyzer, iterMarkedLines, linesFromChunks, mergeResults
+from marker_matcher import MATCHER, ITERATION, HANG
+from constants import LOG_INDEX_EXT
+
+INDEX_VERSION = 1
+# Chunks per worker, so one slow chunk does not hold up the whole pool
+CHUNKS_PER_JOB = 4
+READ_BLOCK = 1 << 20
+
+def indexPath(logPath: str) -> str:
+    return f"{logPath}{LOG_INDEX_EXT}"
+
+def buildIndex(logPath: str) -> dict:
+    """
+    Scans a log once and records [byte offset, line number] of every iteration start
+    (LOG_PARSE_MARKER), test start and HANG_MARKER line.
+
+    Test starts are classified per line, without parser context.
+    """
+    st = os.stat(logPath)
+    index = {
+        'version': INDEX_VERSION,
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'iterations': [],
+        'tests': [],
+        'hangs': [],
+    }
+    if st.st_size == 0:
+        return index
+    with open(logPath, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for line_num, offset, line in iterMarkedLines(mm):
+            found = MATCHER.classify(line)
+            if ITERATION in found:
+                index['iterations'].append([offset, line_num])
+            if MATCHER.isTestStart(found):
+                index['tests'].append([offset, line_num])
+            if HANG in found:
+                index['hangs'].append([offset, line_num])
+    return index
+
+def writeIndex(logPath: str, index: dict):
+    with open(indexPath(logPath), "w") as f:
+        json.dump(index, f, separators=(',', ':'))
+
+def loadIndex(logPath: str, rebuild = True) -> dict:
+    """
+    Loads the sidecar index of a log. If it is missing or the log changed since it
+    was written, the index is rebuilt and rewritten (or None returned if rebuild is False).
+    """
+    st = os.stat(logPath)
+    try:
+        with open(indexPath(logPath), "r") as f:
+            index = json.load(f)
+        if (index.get('version') == INDEX_VERSION and index['size'] == st.st_size
+                and index['mtime_ns'] == st.st_mtime_ns):
+            return index
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+    if not rebuild:
+        return None
+    index = buildIndex(logPath)
+    writeIndex(logPath, index)
+    return index
+
+def _readRange(logPath, start, end):
+    # Yields the bytes of [start, end) in blocks
+    with open(logPath, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(READ_BLOCK, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+def iterationRange(index: dict, n: int):
+    """
+    Returns (start offset, end offset, first line number) of iteration n (1-based).
+    """
+    iterations = index['iterations']
+    if not 1 <= n <= len(iterations):
+        raise IndexError(f"Iteration {n} not in log ({len(iterations)} iterations)")
+    start, first_line = iterations[n - 1]
+    end = iterations[n][0] if n < len(iterations) else index['size']
+    return start, end, first_line
+
+def readIteration(logPath: str, n: int, index = None):
+    """
+    Yields (line number, line) for iteration n of a log without reading the lines before it.
+    """
+    index = loadIndex(logPath) if index is None else index
+    start, end, first_line = iterationRange(index, n)
+    for line_num, line in enumerate(linesFromChunks(_readRange(logPath, start, end)), first_line):
+        yield line_num, line
+
+def planChunks(index: dict, count: int):
+    """
+    Splits a log into at most count byte ranges of similar size. Each range after
+    the first starts at the first test of an iteration, where the parser is always
+    between tests.
+
+    Returns:
+        list: (start offset, end offset, first line, end line or None for the last chunk)
+    """
+    iteration_offsets = {offset for offset, _ in index['iterations']}
+    test_offsets = [offset for offset, _ in index['tests']]
+    candidates = []
+    for offset, _ in index['iterations']:
+        pos = bisect.bisect_right(test_offsets, offset)
+        if pos < len(test_offsets):
+            test = index['tests'][pos]
+            # A test line that is also an iteration marker is not a test start mid-test
+            if test[0] not in iteration_offsets and (not candidates or candidates[-1][0] < test[0]):
+                candidates.append(test)
+
+    size = index['size']
+    bounds = []
+    candidate_offsets = [offset for offset, _ in candidates]
+    for k in range(1, count):
+        pos = bisect.bisect_left(candidate_offsets, size * k // count)
+        if pos < len(candidates) and (not bounds or bounds[-1][0] < candidates[pos][0]):
+            bounds.append(candidates[pos])
+
+    chunks = []
+    start, first_line = 0, 1
+    for offset, line_num in bounds:
+        if offset > start:
+            chunks.append((start, offset, first_line, line_num))
+            start, first_line = offset, line_num
+    chunks.append((start, size, first_line, None))
+    return chunks
+
+def _isLastLine(logPath, start, end):
+    # True if [start, end) holds a single line
+    if end - start > READ_BLOCK:
+        return False
+    data = b"".join(_readRange(logPath, start, end)).rstrip(b"\r\n")
+    return b"\n" not in data and b"\r" not in data
+
+def _analyzeChunk(logPath, start, end, first_line, end_line):
+    # Worker: analyzes one byte range. Returns (results, clean) where clean is False
+    # if the range ended while the parser was reading a result block.
+    with open(logPath, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        analyzer = LogAnalyzer()
+        for line_num, _, line in iterMarkedLines(mm, start, end, first_line):
+            analyzer.feedLine(line, line_num)
+    clean = True
+    if end_line is not None:
+        if analyzer.state == 'test':
+            # The next chunk's first line is a test start, which closes this test
+            analyzer.last_test_line = end_line
+        elif analyzer.state != 'outer':
+            clean = False
+    return analyzer.finish(), clean
+
+def analyzeLogChunked(logPath: str, jobs = None) -> dict:
+    """
+    Analyzes a log in a process pool, split at iteration boundaries from its index.
+    Per-chunk test_stats are merged in log order with global line numbers, giving
+    the same results as analyzeLog.
+
+    Args:
+        logPath (str): The full path to an uncompressed log file.
+        jobs (int): Worker processes, defaults to the CPU count.
+
+    Returns:
+        dict: Same structure as analyzeLog, or None if the file does not exist.
+    """
+    if not os.path.isfile(logPath):
+        print(f"Error: Log file not found at '{logPath}'")
+        return None
+    jobs = jobs or os.cpu_count() or 1
+    index = loadIndex(logPath)
+    if index['size'] == 0:
+        return getSummary.analyzeLines([])
+    chunks = planChunks(index, jobs * CHUNKS_PER_JOB)
+    if len(chunks) > 1 and _isLastLine(logPath, chunks[-1][0], chunks[-1][1]):
+        # A test opened on the final line is closed using the previous test's
+        # last line, which a fresh worker does not have; keep it with its predecessor
+        start, _, first_line, _ = chunks[-2]
+        chunks[-2:] = [(start, chunks[-1][1], first_line, None)]
+    if len(chunks) == 1 or jobs == 1:
+        parts = [_analyzeChunk(logPath, *chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(chunks))) as pool:
+            parts = list(pool.map(_analyzeChunk, *zip(*[(logPath,) + chunk for chunk in chunks])))
+    k = 0
+    while k < len(parts):
+        if parts[k][1]:
+            k += 1
+            continue
+        # Boundary fell inside a result block: join with the next chunk and redo both
+        start, _, first_line, _ = chunks[k]
+        _, end, _, end_line = chunks[k + 1]
+        chunks[k:k + 2] = [(start, end, first_line, end_line)]
+        parts[k:k + 2] = [_analyzeChunk(logPath, *chunks[k])]
+    return mergeResults([results for results, _ in parts])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build a log's iteration index, print one iteration, or analyze it in parallel.")
+    parser.add_argument('-l', '--log', type=str, required=True, help="Path to the log file.")
+    parser.add_argument('-b', '--build', action='store_true', help="Rebuild the sidecar index.")
+    parser.add_argument('-n', '--iteration', type=int, help="Print iteration N (1-based) of the log.")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Analyze with this many worker processes and write the summary log.")
+    args = parser.parse_args()
+    start_time = time.perf_counter()
+
+    if args.build:
+        index = buildIndex(args.log)
+        writeIndex(args.log, index)
+        print(f"Indexed {len(index['iterations'])} iterations, {len(index['tests'])} tests, "
+              f"{len(index['hangs'])} hangs -> {indexPath(args.log)}")
+    if args.iteration is not None:
+        for line_num, line in readIteration(args.log, args.iteration):
+            sys.stdout.write(f"{line_num}: {line}")
+    if args.jobs is not None or (not args.build and args.iteration is None):
+        analysis = analyzeLogChunked(args.log, args.jobs)
+        getSummary.log_test_summary(analysis, getSummary.summaryPath(args.log))
+
+    # Print out elapsed time
+    end_time = time.perf_counter()
+    elapsed_ms = int((end_time - start_time) * 1000)
+    print(f"Total Execution Time: {elapsed_ms} (ms)")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# Author: Chin Ming Ryan Wong
+
+import atexit, logging, os, queue, threading, time
+from constants import LOG_FLUSH_INTERVAL, LOG_FLUSH_BYTES
+
+# Queue operations
+_WRITE = 0
+_SYNC = 1
+_CLOSE = 2
+_STOP = 3
+
+class LogWriter():
+    """
+    One background thread per host that owns every device log file. Callers only put
+    raw bytes on a queue, so the thread reading a UART never waits on the disk. Writes
+    are batched: pending bytes go to the files once flush_bytes have queued up or
+    flush_interval seconds have passed. fsync happens only when asked (sync(), at
+    iteration boundaries) and when a file is closed.
+
+    Args:
+        flush_interval (float): Most seconds bytes wait in memory before being written.
+        flush_bytes (int): Pending bytes (all files together) that trigger a write.
+    """
+    def __init__(self, flush_interval = LOG_FLUSH_INTERVAL, flush_bytes = LOG_FLUSH_BYTES):
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.queue = queue.SimpleQueue()
+        self.files = {}
+        self.pending = {}
+        self.pending_bytes = 0
+        self.thread = threading.Thread(target=self._run, name="log_writer", daemon=True)
+        self.thread.start()
+
+    def write(self, path, data: bytes):
+        self.queue.put((_WRITE, path, data))
+
+    def _wait(self, op, path):
+        # Queues op and blocks until the writer thread has done it
+        if not self.thread.is_alive():
+            return
+        done = threading.Event()
+        self.queue.put((op, path, done))
+        done.wait()
+
+    def sync(self, path = None):
+        """
+        Writes out and fsyncs path (every open file if None), returning once it is on disk.
+        """
+        self._wait(_SYNC, path)
+
+    def close(self, path):
+        """
+        Writes out, fsyncs and closes path, returning once it is done.
+        """
+        self._wait(_CLOSE, path)
+
+    def stop(self):
+        self._wait(_STOP, None)
+
+    def _flush(self, paths = None):
+        for path in list(self.pending) if paths is None else paths:
+            chunks = self.pending.pop(path, None)
+            if not chunks:
+                continue
+            try:
+                f = self.files.get(path)
+                if f is None:
+                    f = self.files[path] = open(path, "ab")
+                f.write(b"".join(chunks))
+                f.flush()
+            except OSError as e:
+                print(f"Error writing log {path}: {e}")
+        self.pending_bytes = sum(len(chunk) for chunks in self.pending.values() for chunk in chunks)
+
+    def _fsync(self, paths):
+        for path in paths:
+            f = self.files.get(path)
+            if f is None:
+                continue
+            try:
+                os.fsync(f.fileno())
+            except OSError as e:
+                print(f"Error syncing log {path}: {e}")
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(self.flush_interval - (time.monotonic() - last_flush), 0) if self.pending_bytes else None
+            try:
+                op, path, data = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                op = None
+            if op == _WRITE:
+                self.pending.setdefault(path, []).append(data)
+                self.pending_bytes += len(data)
+            elif op is not None:
+                paths = list(set(self.pending) | set(self.files)) if path is None else [path]
+                self._flush()
+                self._fsync(paths)
+                if op in (_CLOSE, _STOP):
+                    for p in paths:
+                        f = self.files.pop(p, None)
+                        if f is not None:
+                            f.close()
+                data.set()
+                if op == _STOP:
+                    return
+                last_flush = time.monotonic()
+                continue
+            if self.pending_bytes >= self.flush_bytes or time.monotonic() - last_flush >= self.flush_interval:
+                self._flush()
+                last_flush = time.monotonic()
+
+_WRITER = None
+_WRITER_LOCK = threading.Lock()
+
+def getWriter() -> LogWriter:
+    """
+    Returns the host's LogWriter, starting it on first use.
+    """
+    global _WRITER
+    with _WRITER_LOCK:
+        if _WRITER is None:
+            _WRITER = LogWriter()
+            atexit.register(_WRITER.stop)
+        return _WRITER
+
+def configureWriter(flush_interval = LOG_FLUSH_INTERVAL, flush_bytes = LOG_FLUSH_BYTES):
+    """
+    Sets how the host's LogWriter batches writes. Takes effect immediately.
+    """
+    writer = getWriter()
+    writer.flush_interval = flush_interval
+    writer.flush_bytes = flush_bytes
+
+class LogWriterHandler(logging.Handler):
+    """
+    logging handler that hands a device log to the host's LogWriter. Log records are
+    written as "%(message)s" lines; writeBytes() takes console output as is, without
+    going through a Formatter. tap, if given, is called with every byte written to the
+    log (e.g. getSummary.CaptureAnalyzer.feed).
+    """
+    def __init__(self, path, writer = None, tap = None):
+        super().__init__()
+        self.path = path
+        self.writer = writer if writer is not None else getWriter()
+        self.tap = tap
+
+    def emit(self, record):
+        try:
+            self.writeBytes(f"{self.format(record)}\n".encode())
+        except Exception:
+            self.handleError(record)
+
+    def writeBytes(self, data: bytes):
+        # Honours pauseLogger(), which raises the handler level
+        if logging.INFO >= self.level:
+            self.writer.write(self.path, data)
+            if self.tap is not None:
+                self.tap(data)
+
+    def sync(self):
+        self.writer.sync(self.path)
+
+    def close(self):
+        self.writer.close(self.path)
+        super().close()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# Author: Chin Ming Ryan Wong
+
+import argparse
+import heapq
+import re
+import time
+from constants import LOG_PARSE_MARKER, TEST_MARKERS, FALSE_TEST_MARKERS, ERROR_MSG_MARKERS, HANG_MARKER
+from constants import SUCCESS_END_MARKER, EXEC_TIME_MARKER
+
+# Marker families reported by MarkerMatcher.classify()
+ITERATION = 'iteration'
+TEST = 'test'
+FALSE_TEST = 'false_test'
+ERROR = 'error'
+SUCCESS = 'success'
+HANG = 'hang'
+EXEC_TIME = 'exec_time'
+
+DEFAULT_FAMILIES = {
+    ITERATION: [LOG_PARSE_MARKER],
+    TEST: TEST_MARKERS,
+    FALSE_TEST: FALSE_TEST_MARKERS,
+    ERROR: ERROR_MSG_MARKERS,
+    SUCCESS: SUCCESS_END_MARKER,
+    HANG: [HANG_MARKER],
+    EXEC_TIME: [EXEC_TIME_MARKER],
+}
+
+def _trieRegex(words):
+    """
+    Builds a regex alternation shaped as a prefix trie, e.g. ["gsa ", "gsa: x"] -> "gsa(?:\\ |:\\ x)".
+    The re module can then reject most positions on the first character, and at any
+    position the greedy optional groups match the longest marker.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for c in word:
+            node = node.setdefault(c, {})
+        node[''] = {}
+
+    def build(node):
+        optional = '' in node
+        alts = [re.escape(c) + build(child) for c, child in sorted(node.items()) if c != '']
+        if not alts:
+            return ''
+        body = alts[0] if len(alts) == 1 and not optional else f"(?:{'|'.join(alts)})"
+        return f"{body}?" if optional else body
+
+    return build(trie)
+
+class MarkerMatcher():
+    """
+    Classifies a log line against every marker family in a single regex scan.
+
+    classify() returns {family: offset of the first marker of that family}, so
+    "family in result" replaces any(m in line for m in markers) and the offset
+    replaces line.find(marker). Markers are matched on the raw line, as the old
+    TEST_MARKERS checks were: every TEST_MARKERS entry ends with a space, which
+    keeps "gsa " from matching "gsa: ", so lines must not be stripped first. The
+    markers the old code looked for in line.strip() (hang, error, success and
+    execution time) neither start nor end with whitespace, so matching them on
+    the raw line finds the same lines.
+    """
+    def __init__(self, families = None):
+        families = DEFAULT_FAMILIES if families is None else families
+        markers = {}
+        for family, family_markers in families.items():
+            for marker in family_markers:
+                markers.setdefault(marker, []).append(family)
+        # Two markers can only match at the same offset if one is a prefix of the
+        # other. The scan reports the longest, so attach the families of every
+        # marker that is a prefix of it.
+        self.families = {}
+        for marker in markers:
+            hit = []
+            for prefix, prefix_families in markers.items():
+                if marker.startswith(prefix):
+                    hit.extend(f for f in prefix_families if f not in hit)
+            self.families[marker] = hit
+
+        pattern = _trieRegex(markers)
+        self.pattern = re.compile(pattern)
+        # Zero width so overlapping markers at different offsets are all found
+        self.scan = re.compile(f"(?=({pattern}))")
+        # Raw log bytes are searched marker by marker, see ByteMarkerScanner. A marker
+        # containing another marker ("aon =" holds "aon ") finds no extra lines.
+        self.bytes_markers = [marker.encode('utf-8') for marker in markers
+                              if not any(other != marker and other in marker for other in markers)]
+
+    def classify(self, line: str) -> dict:
+        first = self.pattern.search(line)
+        if first is None:
+            return {}
+        found = {}
+        for m in self.scan.finditer(line, first.start()):
+            pos = m.start()
+            for family in self.families[m.group(1)]:
+                if family not in found:
+                    found[family] = pos
+        return found
+
+    def isTestStart(self, found: dict) -> bool:
+        return TEST in found and FALSE_TEST not in found and ERROR not in found
+
+class ByteMarkerScanner():
+    """
+    Finds the next marker in a bytes-like buffer (e.g. an mmap) with one buf.find per
+    marker instead of a regex. find() runs at memchr speed, and each marker is only
+    searched again once the scan has passed its last hit, so the whole buffer is
+    covered in roughly len(markers) fast passes.
+    """
+    def __init__(self, buf, markers, start = 0):
+        self.buf = buf
+        self.heap = []
+        for marker in markers:
+            pos = buf.find(marker, start)
+            if pos != -1:
+                self.heap.append((pos, marker))
+        heapq.heapify(self.heap)
+
+    def next(self, start: int) -> int:
+        """
+        Returns the offset of the first marker at or after start, or -1.
+        """
+        heap = self.heap
+        while heap and heap[0][0] < start:
+            marker = heap[0][1]
+            pos = self.buf.find(marker, start)
+            if pos == -1:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (pos, marker))
+        return heap[0][0] if heap else -1
+
+MATCHER = MarkerMatcher()
+
+def legacyClassify(line):
+    """
+    The per-line marker checks analyzeLog did before MarkerMatcher, kept for benchmarking.
+    """
+    is_test = any(m in line for m in TEST_MARKERS)
+    is_invalid = any(m in line for m in ERROR_MSG_MARKERS + FALSE_TEST_MARKERS)
+    if is_test and not is_invalid:
+        found_indices = (line.find(marker) for marker in TEST_MARKERS if line.find(marker) != -1)
+        min(found_indices, default=-1)
+    LOG_PARSE_MARKER in line
+    HANG_MARKER in line.strip()
+    any(marker in line.strip() for marker in ERROR_MSG_MARKERS)
+    any(marker in line.strip() for marker in SUCCESS_END_MARKER)
+    EXEC_TIME_MARKER in line.strip()
+
+def benchmark(lines, repeat = 3) -> dict:
+    """
+    Measures lines/sec of the legacy marker checks against MarkerMatcher.classify.
+
+    Returns:
+        dict: {'lines': n, 'legacy_lps': float, 'matcher_lps': float, 'speedup': float}
+    """
+    results = {'lines': len(lines)}
+    for name, fn in (('legacy_lps', legacyClassify), ('matcher_lps', MATCHER.classify)):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for line in lines:
+                fn(line)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = len(lines) / best if best else float('inf')
+    results['speedup'] = results['matcher_lps'] / results['legacy_lps']
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark legacy marker scanning against MarkerMatcher.")
+    parser.add_argument('-l', '--log', type=str, required=True, help="Path to a device log to benchmark on.")
+    parser.add_argument('-r', '--repeat', type=int, default=3, help="Best-of repeat count.")
+    args = parser.parse_args()
+    with open(args.log, "r") as f:
+        lines = f.readlines()
+    res = benchmark(lines, args.repeat)
+    print(f"{res['lines']} lines")
+    print(f"Legacy scan:    {res['legacy_lps']:,.0f} lines/sec")
+    print(f"MarkerMatcher:  {res['matcher_lps']:,.0f} lines/sec ({res['speedup']:.1f}x)")
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# Author: Chin Ming Ryan Wong
+
+import os, shutil, subprocess, time
+import serial
+import getSummary, serial_num_util
+from send_to_terminal import PortRunner, PortPool, ERROR, SILENCE_TIMEOUT, newPacingStats, pacingReport
+from dhub_automation import DhubAutomation
+from command_timing import CommandTiming, renderRowSummary
+from iteration_pool import IterationPool
+from plan_shards import captureTap
+from test_plan import segmentSteps, fastbootArgv, COMMAND, AOSS, BATCH, REBOOT, FASTBOOT
+from constants import LOG_OUTPUT_DIR
+
+class SyncOps():
+    """
+    What runPlan does to the ports, dhub and subprocesses of one device, for the thread
+    engine: PortRunner, DhubAutomation and subprocess.run, all blocking. None of these
+    coroutines ever awaits anything that suspends, so runSync() can drive runPlan on the
+    device's own thread without an event loop. async_engine.AsyncOps is the asyncio set.
+    """
+    runner = PortRunner
+
+    def __init__(self, soc_sn):
+        self.soc_sn = soc_sn
+        self.dhub = None
+
+    async def startDhub(self) -> dict:
+        self.dhub = DhubAutomation(self.soc_sn)
+        return self.dhub.get_dhub_ports()
+
+    async def stopDhub(self):
+        self.dhub.stop_dhub()
+
+    async def cresetAndLk(self, package_path, brd_sn):
+        serial_num_util.creset_and_lk(package_path, self.soc_sn, brd_sn)
+
+    async def run(self, cmd) -> int:
+        # Runs a command, returns its exit code
+        return subprocess.run(cmd, stdout=subprocess.DEVNULL).returncode
+
+    async def call(self, method, *args, **kwargs):
+        # A PortRunner method
+        return method(*args, **kwargs)
+
+    async def offload(self, func, *args, **kwargs):
+        # Blocking or CPU bound work (log fsync, summary); already off any loop here
+        return func(*args, **kwargs)
+
+def runSync(coro):
+    """
+    Runs a runPlan coroutine made with SyncOps to the end on this thread and returns its result.
+    """
+    try:
+        coro.send(None)
+    except StopIteration as done:
+        return done.value
+    coro.close()
+    raise RuntimeError("runSync: the coroutine suspended, it needs an event loop (use AsyncOps)")
+
+async def runPlan(ops, plan, soc_sn, brd_sn, package_path, iteration, timoeut = 120, silence_timeout = SILENCE_TIMEOUT,
+                  pacing = 'fixed', capture = 'buffered', timing = None, verify_summary = False,
+                  shard_report = None, ramdisk_cache = None):
+    """
+    Runs a compiled test plan (test_plan.compilePlan) iteration times on one device. This is
+    the step loop of both engines: every port, dhub and subprocess operation goes through ops,
+    so the plan handling and the logs are the same with either.
+
+    Args:
+        ops: SyncOps (thread engine, run with runSync) or async_engine.AsyncOps (event loop).
+        iteration: Iterations for this device, or the IterationPool shared by the fleet.
+        timoeut (int): Port timeout in seconds.
+        silence_timeout, pacing, capture: Passed to every PortRunner (see send_to_terminal).
+        timing (CommandTiming): Recorder of this device, a new one if None.
+        verify_summary (bool): Also re-parse the log after the run (getSummary.main).
+        shard_report (plan_shards.SegmentReport): Gets the results of every segment run of a sharded plan.
+        ramdisk_cache (ramdisk_cache.RamdiskCache): Skips fastboot rows the device does not need.
+    """
+    # Fail flag for skipping to next <reboot>
+    crit_err = False
+    # Time spent pacing commands, across every PortRunner of this device
+    pacing_stats = newPacingStats()
+    # Per-command and setup step timing, exported next to the summary
+    timing = timing if timing is not None else CommandTiming(soc_sn)
+    # Test results parsed from the log as it is written, for the summary at the end
+    summary_capture = getSummary.CaptureAnalyzer()
+    log_name = f"{plan.name}_{soc_sn}"
+    # Timing records go to disk as they are made, next to the log until the run is summarized
+    timing.open(LOG_OUTPUT_DIR, log_name)
+    # Start dhub
+    with timing.step('dhub_start'):
+        soc_ports = await ops.startDhub()
+    # Nothing to run without the APC port
+    if "APC" not in (soc_ports or {}):
+        await ops.stopDhub()
+        timing.discard()
+        print(f"[{soc_sn}] Error retrieving APC port: dhub did not report one")
+        return
+    # Every port of this dhub session is opened once and reused by all rows and iterations
+    # Timeout set by longest test in MBU set by
+    #   google_tests -v -n concurrency_fabdisp_stress -a g2d dpu cpu_memcpy cpu_memcpy cpu_memcpy cpu_memcpy dvfs_fabdisp
+    pool = PortPool(soc_ports, ops.runner, verbosity=False, timeout_arg = timoeut, logName= soc_sn,
+                    silence_timeout = silence_timeout, pacing = pacing, pacing_stats = pacing_stats, capture = capture,
+                    timing = timing)
+    # Iterations of this device alone, or of the whole fleet with shared scheduling
+    work = iteration if isinstance(iteration, IterationPool) else IterationPool(iteration, retry = False)
+    for unit in work.units(soc_sn):
+        # A sharded plan hands out (iteration, segment) units, each starting with a reboot
+        i, segment = unit if isinstance(unit, tuple) else (unit, None)
+        timing.iteration = i
+        # Results of this segment run alone, for the per-segment report
+        segment_capture = getSummary.CaptureAnalyzer() if segment is not None else None
+        unit_start = time.monotonic()
+        try:
+            # Start APC terminal (reopened here only if a serial error closed the pool)
+            port = pool.get("APC")
+            for step in (plan.steps if segment is None else segmentSteps(plan, segment)):
+                if step.kind == REBOOT:
+                    # Stop Port Runner and close every port of this dhub session (closing the log fsyncs it)
+                    await ops.offload(port.stopLogger)
+                    pool.closeAll()
+                    # Stop dhub
+                    await ops.stopDhub()
+                    # reboot SoC
+                    timing.row = step.row
+                    with timing.step('creset_and_lk', step.command):
+                        await ops.cresetAndLk(package_path, brd_sn)
+                    if ramdisk_cache is not None:
+                        ramdisk_cache.reset(soc_sn)
+                    # Start dhub again to refresh the connection
+                    with timing.step('dhub_start', step.command):
+                        pool.reopen(await ops.startDhub())
+                    port = pool.get("APC")
+                    # Let the console settle after boot
+                    await ops.call(port.pace, 3)
+                    port.startLogger(LOG_OUTPUT_DIR, name = log_name, tap = captureTap(summary_capture, segment_capture))
+                    if segment is not None:
+                        port.logger.info(f"-------------Segment {segment} iteration {i}-------------")
+                    # Turn off crit_err flag to skip to next set of test
+                    crit_err = False
+                    continue
+                # Everything else is skipped until the next reboot after a critical error
+                if crit_err:
+                    continue
+                if step.kind == BATCH:
+                    # Consecutive rows marked in the Batch column: one write, split back per command
+                    results = await ops.call(port.runBatch, list(step.payload), delay = step.delay,
+                                             timeout = step.timeout, rows = list(step.row))
+                    if ERROR in results:
+                        port.logger.info("-------------Skipping to next reboot-------------")
+                        crit_err = True
+                    continue
+                timing.row = step.row
+                if step.kind == AOSS:
+                    # A port dhub did not report fails the row like a hang would
+                    try:
+                        aoss_port = pool.get(step.port)
+                    except KeyError:
+                        port.logger.info(f"dhub did not report the {step.port} port. Skipping to next reboot.")
+                        crit_err = True
+                        continue
+                    # Add AOSS command logging here
+                    await ops.call(aoss_port.sendAndLog, step.payload, step.expect, timeout = step.timeout)
+                elif step.kind == COMMAND:
+                    # Send a command
+                    try:
+                        result = await ops.call(port.runCommand, step.payload, delay = step.delay,
+                                                timeout = step.timeout, silence_timeout = step.silence)
+                        # A hung command (HANG_MARKER already logged) means the SoC needs a reboot
+                        if result == ERROR:
+                            port.logger.info("-------------Skipping to next reboot-------------")
+                            crit_err = True
+                    except Exception:
+                        port.logger.info("-------------Skipping to next reboot-------------")
+                        crit_err = True
+                elif step.kind == FASTBOOT:
+                    # Rows that would leave the ramdisk as it already is on this device
+                    if ramdisk_cache is not None and ramdisk_cache.skip(soc_sn, step):
+                        port.logger.info(f"Ramdisk already on the device, skipping: {step.command}")
+                        continue
+                    # Execute the fastboot command
+                    with timing.step('fastboot', step.command) as record:
+                        returncode = await ops.run(fastbootArgv(step, soc_sn))
+                        if returncode != 0:
+                            record['outcome'] = 'ERROR'
+                    if ramdisk_cache is not None:
+                        ramdisk_cache.update(soc_sn, step, returncode == 0, record['prompt_s'])
+                    if returncode != 0:
+                        port.logger.info("Fastboot command failed. Skipping to next reboot.")
+                        crit_err = True
+            # Ports stay open for the next iteration
+            await ops.offload(port.stopLogger)
+            if segment is not None and shard_report is not None:
+                shard_report.record(segment, i, soc_sn, segment_capture.finish(), time.monotonic() - unit_start)
+            work.done(soc_sn)
+
+        except serial.SerialException as e:
+            print(f"Serial port error: {e}")
+            pool.closeAll()
+            work.failed(soc_sn)
+            await ops.run(['sudo', 'chown', '-R', 'chinmingryan', LOG_OUTPUT_DIR])
+    pool.closeAll()
+    await ops.stopDhub()
+    # With shared scheduling the fleet may have taken every iteration before this device got one
+    if not os.path.exists(os.path.join(LOG_OUTPUT_DIR, f"{log_name}.log")):
+        print(f"[{soc_sn}] No iterations run, nothing to summarize.")
+        timing.discard()
+        return
+    # Add summary log generation
+    log_dir_path = os.path.join(LOG_OUTPUT_DIR, log_name)
+    os.makedirs(log_dir_path, exist_ok=True)
+    shutil.move(os.path.join(LOG_OUTPUT_DIR, f"{log_name}.log"), log_dir_path)
+    await ops.offload(getSummary.main, os.path.join(log_dir_path, f"{log_name}.log"), captured = summary_capture,
+                      verify = verify_summary)
+    print(f"[{soc_sn}] {pacingReport(pacing_stats, pacing)}")
+    timing.export(log_dir_path)
+    print(f"[{soc_sn}] Slowest test plan rows:\n{renderRowSummary(timing.summary(), top = 5)}")
+    await ops.run(['sudo', 'chown', '-R', 'chinmingryan', LOG_OUTPUT_DIR])
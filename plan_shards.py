@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# Author: Chin Ming Ryan Wong
+
+import json, os, threading
+from datetime import datetime
+import getSummary
+from test_plan import segmentRows
+from constants import SEGMENT_HISTORY_EXT, SEGMENT_SUMMARY_EXT
+
+def captureTap(*captures):
+    """
+    Returns the log tap that feeds every given CaptureAnalyzer (None entries are skipped).
+    """
+    feeds = [capture.feed for capture in captures if capture is not None]
+    if len(feeds) == 1:
+        return feeds[0]
+    def tap(data):
+        for feed in feeds:
+            feed(data)
+    return tap
+
+def segmentKey(plan, segment) -> str:
+    # Segments are matched to their history by the rows they span, so an edited plan starts over
+    first, last = segmentRows(plan, segment)
+    return f"rows {first}-{last}"
+
+def loadHistory(plan, log_dir) -> dict:
+    """
+    Returns the mean seconds per segment key saved by the last sharded run of plan, {} if none.
+    """
+    path = os.path.join(log_dir, f"{plan.name}{SEGMENT_HISTORY_EXT}")
+    try:
+        with open(path, "r") as f:
+            return {key: entry['mean_s'] for key, entry in json.load(f).items() if entry.get('mean_s')}
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"Ignoring segment history {path}: {e}")
+        return {}
+
+def shardUnits(plan, iterations, history = None) -> list:
+    """
+    Splits iterations passes of plan into (iteration, segment) work units, longest first
+    (longest processing time first), so that devices pulling units in this order finish
+    close together. Segments without history go first, as if they were the longest.
+
+    Returns:
+        list: (iteration, segment) tuples for IterationPool.
+    """
+    history = history or {}
+    known = [history.get(segmentKey(plan, segment)) for segment in range(len(plan.segments))]
+    longest = max((seconds for seconds in known if seconds is not None), default=0.0)
+    seconds = [longest + 1.0 if s is None else s for s in known]
+    units = [(i, segment) for i in range(int(iterations)) for segment in range(len(plan.segments))]
+    # Stable, so equal segments keep plan and iteration order
+    return sorted(units, key=lambda unit: -seconds[unit[1]])
+
+class SegmentReport():
+    """
+    Collects the results of every segment run of a sharded plan, from all devices, and
+    merges them into one report per segment. run_SOP records each run with the results of
+    a CaptureAnalyzer fed only that run's part of the device log. Thread-safe.
+
+    Args:
+        plan (TestPlan): The sharded plan.
+        history (dict): Mean seconds per segment key from loadHistory(), shown next to this run's.
+    """
+    def __init__(self, plan, history = None):
+        self.plan = plan
+        self.history = history or {}
+        self.lock = threading.Lock()
+        self.runs = {segment: [] for segment in range(len(plan.segments))}
+
+    def record(self, segment, iteration, device, results, seconds):
+        with self.lock:
+            self.runs[segment].append({'iteration': iteration, 'device': device, 'results': results,
+                                       'seconds': seconds})
+
+    def segments(self) -> list:
+        """
+        Returns one dict per segment: key, rows, runs, devices, mean/total seconds and the
+        merged results of all its runs (None if it never ran).
+        """
+        with self.lock:
+            out = []
+            for segment, runs in self.runs.items():
+                first, end = self.plan.segments[segment]
+                seconds = [run['seconds'] for run in runs]
+                out.append({'segment': segment, 'key': segmentKey(self.plan, segment), 'steps': end - first,
+                            'runs': len(runs), 'devices': sorted({run['device'] for run in runs}),
+                            'total_s': sum(seconds), 'mean_s': sum(seconds) / len(seconds) if seconds else None,
+                            'history_s': self.history.get(segmentKey(self.plan, segment)),
+                            'results': getSummary.mergeResults([run['results'] for run in runs]) if runs else None,
+                            'failed_on': sorted({f"{run['device']}#{run['iteration']}" for run in runs
+                                                 if run['results']['total_failed'] or run['results']['total_hangs']
+                                                 or run['results']['cmd_hang']['count']})})
+            return out
+
+    def render(self, wall_s = None) -> str:
+        segments = self.segments()
+        fmt = lambda v: "-" if v is None else f"{v:.1f}"
+        out = ['----------------------- Segment Summary -----------------------']
+        out.append(f'Test plan: {self.plan.path}')
+        out.append(f'Generated: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}')
+        out.append(f'Segments: {len(segments)}')
+        out.append('')
+        for s in segments:
+            out.append(f"Segment {s['segment']} ({s['key']}, {s['steps']} steps): {s['runs']} runs on "
+                       f"{', '.join(s['devices']) or 'no device'}, mean {fmt(s['mean_s'])} s "
+                       f"(before {fmt(s['history_s'])} s)")
+            r = s['results']
+            if r is None:
+                out.append("    not run")
+                continue
+            status = "PASSED" if not (r['total_failed'] or r['total_ignored'] or r['total_hangs']) else "FAILED"
+            out.append(f"    {r['total_tests']} Tests {r['total_failed']} Fails {r['total_ignored']} Ignored "
+                       f"{r['total_hangs']} Hangs {r['total_error_msg']} Error Messages "
+                       f"{r['cmd_hang']['count']} Hanged Commands - {status}")
+            for test, stats in r['test_stats'].items():
+                if stats['failures'] or stats['ignored'] or stats['hangs']:
+                    out.append(f"    '{test}': {len(stats['failures'])} failure(s) {len(stats['ignored'])} ignored "
+                               f"{len(stats['hangs'])} hang(s)")
+            if s['failed_on']:
+                out.append(f"    failing runs (device#iteration): {', '.join(s['failed_on'])}")
+        out.append('')
+        busy = sum(s['total_s'] for s in segments)
+        line = f"Segment runs took {busy:.1f} s in all"
+        if wall_s:
+            line += f", {wall_s:.1f} s wall ({busy / wall_s:.1f}x)"
+        out.append(line)
+        return "\n".join(out) + "\n"
+
+    def write(self, log_dir, wall_s = None) -> str:
+        """
+        Writes <plan>_segment_summary.log and the per-segment history read by the next
+        sharded run of the plan (segments that did not run keep their old history).
+
+        Returns:
+            str: The summary path.
+        """
+        path = os.path.join(log_dir, f"{self.plan.name}{SEGMENT_SUMMARY_EXT}")
+        with open(path, "w") as f:
+            f.write(self.render(wall_s))
+        history = {key: {'mean_s': seconds} for key, seconds in self.history.items()}
+        for s in self.segments():
+            if s['mean_s'] is not None:
+                history[s['key']] = {'mean_s': s['mean_s'], 'runs': s['runs']}
+        with open(os.path.join(log_dir, f"{self.plan.name}{SEGMENT_HISTORY_EXT}"), "w") as f:
+            json.dump(history, f, indent=1)
+        return path
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# Author: Chin Ming Ryan Wong
+
+import hashlib, os, threading
+from test_plan import FASTBOOT
+from constants import RAMDISK_HASH_BLOCK
+
+def imageHash(path) -> str:
+    """
+    Returns the sha256 of a ramdisk image, read in RAMDISK_HASH_BLOCK pieces.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(RAMDISK_HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def fastbootRole(argv) -> str:
+    """
+    What a fastboot argv does to the ramdisk: 'stage', 'setup_stage', 'mount', 'unmount' or 'other'.
+    """
+    if argv[1:2] == ("stage",):
+        return 'stage'
+    if argv[1:3] == ("oem", "ramdisk") and argv[3:4] in (("setup_stage",), ("mount",), ("unmount",)):
+        return argv[3]
+    return 'other'
+
+class RamdiskCache():
+    """
+    Tracks which ramdisk image each device has staged and mounted since its last reset, so
+    run_SOP can skip fastboot rows that would leave the device as it already is. The images a
+    plan stages are hashed once when the cache is made, so devices are compared by content,
+    not by path.
+
+    With image H the device model is: <reboot device> clears everything, "stage H" stages H,
+    "oem ramdisk setup_stage" clears what is staged, "oem ramdisk mount" mounts what is staged,
+    "oem ramdisk unmount" unmounts, and any other or failed fastboot command leaves the device
+    unknown. In a run of fastboot rows tagged with H (test_plan.Step.ramdisk) that ends by
+    mounting, every row is skipped while H is mounted; in any tagged run, setup_stage and stage
+    are skipped while H is staged. A
+    skipped stage counts the image's size as saved, and every skipped row the time it took the
+    last time it ran on any device. Thread-safe.
+
+    Args:
+        plan (TestPlan): The compiled plan; the .ext2 images it stages are hashed here.
+    """
+    def __init__(self, plan):
+        self.lock = threading.Lock()
+        self.images = {}
+        # Rows of the tagged runs whose last ramdisk command is a mount
+        self.mounts = set()
+        runs = []
+        for i, step in enumerate(plan.steps):
+            if not step.ramdisk:
+                continue
+            if i == 0 or not plan.steps[i - 1].ramdisk:
+                runs.append([])
+            runs[-1].append(step)
+            if step.ramdisk not in self.images:
+                self.images[step.ramdisk] = (imageHash(step.ramdisk), os.path.getsize(step.ramdisk))
+        for run in runs:
+            roles = [fastbootRole(step.argv) for step in run]
+            roles = [role for role in roles if role != 'other']
+            if roles and roles[-1] == 'mount':
+                self.mounts.update(step.row for step in run)
+        self.devices = {}
+        self.seconds = {}
+        self.stats = {}
+
+    def _device(self, device) -> dict:
+        return self.devices.setdefault(device, {'staged': None, 'mounted': None})
+
+    def _stats(self, device) -> dict:
+        return self.stats.setdefault(device, {'skipped': 0, 'stages_skipped': 0, 'bytes_saved': 0, 'seconds_saved': 0.0})
+
+    def reset(self, device):
+        """
+        The device was reset: nothing is staged or mounted.
+        """
+        with self.lock:
+            self.devices[device] = {'staged': None, 'mounted': None}
+
+    def skip(self, device, step) -> bool:
+        """
+        Returns True (and counts what is saved) if the FASTBOOT step can be skipped on device.
+        """
+        if step.kind != FASTBOOT or not step.ramdisk:
+            return False
+        role = fastbootRole(step.argv)
+        digest, size = self.images[step.ramdisk]
+        with self.lock:
+            state = self._device(device)
+            if role == 'other':
+                return False
+            mounted = state['mounted'] == digest and step.row in self.mounts
+            if not mounted and not (state['staged'] == digest and role in ('setup_stage', 'stage')):
+                return False
+            stats = self._stats(device)
+            stats['skipped'] += 1
+            stats['seconds_saved'] += self.seconds.get(step.row, 0.0)
+            if role == 'stage':
+                stats['stages_skipped'] += 1
+                stats['bytes_saved'] += size
+            return True
+
+    def update(self, device, step, ok, seconds = None):
+        """
+        Applies a FASTBOOT step that ran on device (ok if it exited 0) to the device's state.
+        """
+        role = fastbootRole(step.argv)
+        with self.lock:
+            state = self._device(device)
+            if ok and seconds is not None:
+                self.seconds[step.row] = seconds
+            if not ok or role == 'other':
+                state['staged'] = state['mounted'] = None
+            elif role == 'stage':
+                state['staged'] = self.images[step.ramdisk][0] if step.ramdisk else None
+            elif role == 'setup_stage':
+                state['staged'] = None
+            elif role == 'mount':
+                state['mounted'] = state['staged']
+            elif role == 'unmount':
+                state['mounted'] = None
+
+    def report(self) -> str:
+        """
+        Skipped fastboot rows and the bytes and seconds they saved, per device and in all.
+        """
+        with self.lock:
+            out = [f"--- Ramdisk cache ({len(self.images)} images) ---"]
+            totals = {'skipped': 0, 'stages_skipped': 0, 'bytes_saved': 0, 'seconds_saved': 0.0}
+            for device, stats in sorted(self.stats.items()):
+                for key in totals:
+                    totals[key] += stats[key]
+                out.append(f"{device}: {stats['skipped']} fastboot rows skipped ({stats['stages_skipped']} stages), "
+                           f"{stats['bytes_saved'] / 1e6:.1f} MB and {stats['seconds_saved']:.1f} s saved")
+            out.append(f"All devices: {totals['skipped']} fastboot rows skipped ({totals['stages_skipped']} stages), "
+                       f"{totals['bytes_saved'] / 1e6:.1f} MB and {totals['seconds_saved']:.1f} s saved")
+            return "\n".join(out)
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# Author: Chin Ming Ryan Wong
+
+import array
+import json
+import struct
+import sys
+from collections.abc import Mapping
+
+# Per-occurrence outcomes, same names as the analyzeLog test_stats lists
+OUTCOMES = ('failures', 'ignored', 'hangs')
+STORE_MAGIC = b'LKRS'
+STORE_VERSION = 1
+# Column typecode: signed 64-bit, line numbers and counts never overflow it
+_TYPECODE = 'q'
+
+class ResultStore():
+    """
+    Compact, column-oriented store of analyzeLog results.
+
+    Test commands are interned once and referred to by id. Per-test counters are
+    arrays indexed by id, and every failure/ignored/hang occurrence is one entry in
+    a pair of array columns (test id, line number) kept in log order, instead of a
+    {'count': 1, 'line': n} dict per occurrence. Totals are array sums and column
+    lengths, so they never walk the occurrences.
+
+    results() wraps the store in the classic analyzeLog dict; its test_stats is a
+    TestStatsView that builds the old per-test dicts only when a caller reads them.
+    """
+    def __init__(self):
+        self.names = []     # test id -> test command
+        self.ids = {}       # test command -> test id
+        self.total = array.array(_TYPECODE)
+        self.success = array.array(_TYPECODE)
+        self.error_msg = array.array(_TYPECODE)
+        self.timeout = bytearray()
+        self.outcome_tests = {kind: array.array(_TYPECODE) for kind in OUTCOMES}
+        self.outcome_lines = {kind: array.array(_TYPECODE) for kind in OUTCOMES}
+        self.cmd_hang_lines = array.array(_TYPECODE)
+        self.iterations = 0
+        self._by_test = None
+
+    def testId(self, name: str) -> int:
+        tid = self.ids.get(name)
+        if tid is None:
+            tid = len(self.names)
+            name = sys.intern(name)
+            self.names.append(name)
+            self.ids[name] = tid
+            self.total.append(0)
+            self.success.append(0)
+            self.error_msg.append(0)
+            self.timeout.append(0)
+        return tid
+
+    def addOutcome(self, kind: str, tid: int, line: int):
+        self.outcome_tests[kind].append(tid)
+        self.outcome_lines[kind].append(line)
+        self._by_test = None
+
+    def addCmdHang(self, line: int):
+        self.cmd_hang_lines.append(line)
+
+    def extend(self, other):
+        """
+        Appends another store that covers the log after this one (global line numbers).
+        """
+        remap = [self.testId(name) for name in other.names]
+        for tid, other_tid in enumerate(remap):
+            self.total[other_tid] += other.total[tid]
+            self.success[other_tid] += other.success[tid]
+            self.error_msg[other_tid] += other.error_msg[tid]
+            self.timeout[other_tid] |= other.timeout[tid]
+        for kind in OUTCOMES:
+            self.outcome_tests[kind].extend(array.array(_TYPECODE, (remap[tid] for tid in other.outcome_tests[kind])))
+            self.outcome_lines[kind].extend(other.outcome_lines[kind])
+        self.cmd_hang_lines.extend(other.cmd_hang_lines)
+        self.iterations += other.iterations
+        self._by_test = None
+        return self
+
+    def outcomesByTest(self) -> dict:
+        """
+        Returns {kind: [line numbers of test id 0, of test id 1, ...]}, built once per change.
+        """
+        if self._by_test is None:
+            by_test = {}
+            for kind in OUTCOMES:
+                lines = [[] for _ in self.names]
+                for tid, line in zip(self.outcome_tests[kind], self.outcome_lines[kind]):
+                    lines[tid].append(line)
+                by_test[kind] = lines
+            self._by_test = by_test
+        return self._by_test
+
+    def testStats(self, tid: int) -> dict:
+        """
+        Returns one test's stats in the classic analyzeLog test_stats format.
+        """
+        by_test = self.outcomesByTest()
+        stats = {
+            'total': self.total[tid], 'success': self.success[tid], 'timeout': bool(self.timeout[tid]),
+            'error_msg': self.error_msg[tid]
+        }
+        for kind in OUTCOMES:
+            stats[kind] = [{'count': 1, 'line': line} for line in by_test[kind][tid]]
+        return stats
+
+    def results(self) -> dict:
+        """
+        Returns the analyzeLog results dict backed by this store.
+        """
+        return {
+            "iterations": self.iterations,
+            "total_tests": sum(self.total),
+            "total_passed": sum(self.success),
+            "total_failed": len(self.outcome_lines['failures']),
+            "total_hangs": len(self.outcome_lines['hangs']),
+            "total_ignored": len(self.outcome_lines['ignored']),
+            "timeout_flag": any(self.timeout),
+            "test_stats": TestStatsView(self),
+            "total_error_msg": sum(self.error_msg),
+            "cmd_hang": {'count': len(self.cmd_hang_lines), 'line': list(self.cmd_hang_lines)}
+        }
+
+    @classmethod
+    def fromResults(cls, results: dict):
+        """
+        Builds a store from any analyzeLog results dict, classic or store-backed.
+        """
+        test_stats = results['test_stats']
+        if isinstance(test_stats, TestStatsView):
+            return cls().extend(test_stats.store)
+        store = cls()
+        for name, stats in test_stats.items():
+            tid = store.testId(name)
+            store.total[tid] = stats['total']
+            store.success[tid] = stats['success']
+            store.error_msg[tid] = stats['error_msg']
+            store.timeout[tid] = int(bool(stats['timeout']))
+        # Columns are in log order; a classic dict only keeps order per test
+        for kind in OUTCOMES:
+            occurrences = sorted((info['line'], store.ids[name]) for name, stats in test_stats.items()
+                                 for info in stats[kind] for _ in range(info['count']))
+            for line, tid in occurrences:
+                store.addOutcome(kind, tid, line)
+        store.cmd_hang_lines.extend(results['cmd_hang']['line'])
+        store.iterations = results['iterations']
+        return store
+
+    def _columns(self):
+        # Every array column, in serialization order
+        columns = [self.total, self.success, self.error_msg]
+        for kind in OUTCOMES:
+            columns += [self.outcome_tests[kind], self.outcome_lines[kind]]
+        return columns + [self.cmd_hang_lines]
+
+    def toBytes(self) -> bytes:
+        """
+        Serializes the store: magic, version, a JSON header with the test names,
+        then the raw column buffers.
+        """
+        columns = self._columns()
+        header = json.dumps({
+            'names': self.names,
+            'iterations': self.iterations,
+            'byteorder': sys.byteorder,
+            'lengths': [len(column) for column in columns],
+        }).encode('utf-8')
+        parts = [STORE_MAGIC, struct.pack('<II', STORE_VERSION, len(header)), header, bytes(self.timeout)]
+        parts += [column.tobytes() for column in columns]
+        return b"".join(parts)
+
+    @classmethod
+    def fromBytes(cls, data):
+        data = memoryview(data)
+        if bytes(data[:4]) != STORE_MAGIC:
+            raise ValueError("Not a result store")
+        version, header_len = struct.unpack('<II', data[4:12])
+        if version != STORE_VERSION:
+            raise ValueError(f"Unsupported result store version {version}")
+        header = json.loads(bytes(data[12:12 + header_len]))
+        pos = 12 + header_len
+        store = cls()
+        store.names = [sys.intern(name) for name in header['names']]
+        store.ids = {name: tid for tid, name in enumerate(store.names)}
+        store.iterations = header['iterations']
+        store.timeout = bytearray(data[pos:pos + len(store.names)])
+        pos += len(store.names)
+        columns = store._columns()
+        itemsize = columns[0].itemsize
+        for column, length in zip(columns, header['lengths']):
+            column.frombytes(data[pos:pos + length * itemsize])
+            if header['byteorder'] != sys.byteorder:
+                column.byteswap()
+            pos += length * itemsize
+        return store
+
+    def toState(self) -> dict:
+        # JSON-serializable form, used by LogAnalyzer.getState
+        state = {'names': self.names, 'iterations': self.iterations, 'timeout': list(self.timeout),
+                 'total': list(self.total), 'success': list(self.success), 'error_msg': list(self.error_msg),
+                 'cmd_hang_lines': list(self.cmd_hang_lines)}
+        for kind in OUTCOMES:
+            state[kind] = [list(self.outcome_tests[kind]), list(self.outcome_lines[kind])]
+        return state
+
+    @classmethod
+    def fromState(cls, state: dict):
+        store = cls()
+        store.names = list(state['names'])
+        store.ids = {name: tid for tid, name in enumerate(store.names)}
+        store.iterations = state['iterations']
+        store.timeout = bytearray(state['timeout'])
+        for name in ('total', 'success', 'error_msg', 'cmd_hang_lines'):
+            setattr(store, name, array.array(_TYPECODE, state[name]))
+        for kind in OUTCOMES:
+            tests, lines = state[kind]
+            store.outcome_tests[kind] = array.array(_TYPECODE, tests)
+            store.outcome_lines[kind] = array.array(_TYPECODE, lines)
+        return store
+
+class TestStatsView(Mapping):
+    """
+    Read-only test_stats adapter over a ResultStore: test command -> the classic
+    {'total', 'success', 'timeout', 'failures', 'ignored', 'hangs', 'error_msg'} dict.
+    """
+    def __init__(self, store: ResultStore):
+        self.store = store
+
+    def __getitem__(self, name):
+        return self.store.testStats(self.store.ids[name])
+
+    def __iter__(self):
+        return iter(self.store.names)
+
+    def __len__(self):
+        return len(self.store.names)
+
+def saveResults(results: dict, path: str):
+    """
+    Writes an analyzeLog results dict in the ResultStore binary format.
+    """
+    with open(path, "wb") as f:
+        f.write(ResultStore.fromResults(results).toBytes())
+
+def loadResults(path: str) -> dict:
+    """
+    Loads results written by saveResults.
+    """
+    with open(path, "rb") as f:
+        return ResultStore.fromBytes(f.read()).results()
@@ -1,29 +1,159 @@
 #!/usr/bin/env python3
 import argparse, os, serial, time, logging
 from datetime import datetime
-from constants import HANG_MARKER
+from constants import HANG_MARKER, ERROR_MSG_MARKERS
+from log_writer import LogWriterHandler
 
 DELAY = 0.2
+# Seconds without any console output before a command is poked with a newline, and
+# again after the poke before it is declared hung. None uses the port timeout, as the
+# old blocking reads did
+SILENCE_TIMEOUT = None
+# Sleep between in_waiting polls while the console is quiet
+POLL_INTERVAL = 0.01
+# Pacing between commands: 'fixed' sleeps delay seconds after every command, 'adaptive'
+# moves on as soon as the console has been quiet for READY_QUIET after the prompt
+PACING_MODES = ('fixed', 'adaptive')
+READY_QUIET = 0.02
+FASTBOOT_START_DELAY = 3
+# Batch mode: consecutive rows marked in the test plan's Batch column are written in one
+# go, at most this many bytes of commands at a time so the UART receive buffer keeps up
+BATCH_MAX_BYTES = 256
+BATCH_TRUE = ('1', 'y', 'yes', 'true', 'x')
+# Console capture: 'buffered' logs a response once its prompt arrives, 'stream' appends
+# output to the log as it arrives and keeps only a short tail in memory
+CAPTURE_MODES = ('buffered', 'stream')
+# readResponse() outcomes
+PROMPT_FOUND = 'prompt'
+SILENT = 'silent'
+TIMED_OUT = 'timeout'
 # Return statements for runCommand()
 ERROR_MSG = 2
 ERROR = 1
 SUCCESS = 0
+OUTCOME_NAMES = {SUCCESS: 'SUCCESS', ERROR: 'ERROR', ERROR_MSG: 'ERROR_MSG'}
 # Hang patterns
-class MultiLineFormatter(logging.Formatter):
-    def format(self, record):
-        full_msg = super().format(record)
-        lines = full_msg.splitlines()
-        if len(lines) <= 1:
-            return full_msg
-        
-        prefix = full_msg[:full_msg.find(record.getMessage())]
-            # Add prefix to every line
-        return "\n".join([lines[0]] + [prefix + line for line in lines[1:]])
+class StreamCapture():
+    """
+    Logs one command's output while it is still arriving. Error colour codes are looked
+    for over the stream (including codes split across reads) and the output is stripped
+    exactly like response.strip() in buffered mode, so the log is the same either way.
+    Only the rolling tail and any trailing whitespace are held in memory.
+
+    Args:
+        write (callable): Takes the bytes to append to the log.
+    """
+    MARKERS = [marker.encode() for marker in ERROR_MSG_MARKERS]
+
+    def __init__(self, write):
+        self.write = write
+        self.error = False
+        self.started = False
+        self.held = b""
+        self.tail = b""
+        self.keep = max(len(marker) for marker in self.MARKERS) - 1
+
+    def feed(self, data: bytes):
+        if not data:
+            return
+        if not self.error:
+            window = self.tail + data
+            self.error = any(marker in window for marker in self.MARKERS)
+            self.tail = window[-self.keep:]
+        if not self.started:
+            data = data.lstrip()
+            if not data:
+                return
+            self.started = True
+        stripped = data.rstrip()
+        if stripped:
+            self.write(self.held + stripped)
+            self.held = data[len(stripped):]
+        else:
+            # Whitespace is only written once more output follows it
+            self.held += data
+
+    def finish(self):
+        # Ends the record; trailing whitespace is dropped like strip()
+        self.write(b"\n")
+
+def rowSeconds(row: dict, column: str):
+    # Optional per-row seconds from a test plan column (Delay, Timeout, Silence), None if empty
+    value = (row.get(column) or "").strip()
+    return float(value) if value else None
+
+def isBatchable(row: dict) -> bool:
+    # Plain APC commands marked in the Batch column
+    command = (row.get("Command") or "").strip()
+    return ((row.get("Batch") or "").strip().lower() in BATCH_TRUE and '<' not in command and '>' not in command
+            and "AOSS_SENSOR_CORE: " not in command and "AOSS_A32 uart: " not in command)
+
+def batchRows(rows, max_bytes = BATCH_MAX_BYTES):
+    """
+    Numbers test plan rows from 1 and groups runs of batchable rows.
+
+    Yields:
+        tuple: (row number, row) for a single row, or (list of row numbers, list of rows)
+        for two or more consecutive batchable rows, at most max_bytes of commands each.
+    """
+    batch = []
+    size = 0
+    def flush():
+        if len(batch) == 1:
+            yield batch[0]
+        elif batch:
+            yield [num for num, _ in batch], [row for _, row in batch]
+    for row_num, row in enumerate(rows, 1):
+        if not isBatchable(row):
+            yield from flush()
+            batch, size = [], 0
+            yield row_num, row
+            continue
+        length = len(row["Command"].strip()) + 1
+        if batch and size + length > max_bytes:
+            yield from flush()
+            batch, size = [], 0
+        batch.append((row_num, row))
+        size += length
+    yield from flush()
+
+def batchSeconds(rows) -> tuple:
+    """
+    Returns (delay, timeout) of a batch: the longest Delay of its rows, and the sum of
+    their Timeouts if every row has one (None otherwise).
+    """
+    delays = [delay for delay in (rowSeconds(row, "Delay") for row in rows) if delay is not None]
+    timeouts = [rowSeconds(row, "Timeout") for row in rows]
+    return (max(delays) if delays else None), (None if None in timeouts else sum(timeouts))
+
+def newPacingStats() -> dict:
+    # commands paced, seconds the fixed delays cost, seconds actually waited
+    return {'commands': 0, 'fixed_s': 0.0, 'waited_s': 0.0}
+
+def pacingReport(stats: dict, pacing: str) -> str:
+    saved = stats['fixed_s'] - stats['waited_s']
+    return (f"Pacing ({pacing}): {stats['commands']} commands, fixed delays cost {stats['fixed_s']:.1f} s, "
+            f"waited {stats['waited_s']:.1f} s, saved {saved:.1f} s")
 
 class PortRunner():
-    def __init__(self, prt, timeout_arg = 100, delay = DELAY, verbosity = False, logName = 'terminal'):
+    def __init__(self, prt, timeout_arg = 100, delay = DELAY, verbosity = False, logName = 'terminal',
+                 silence_timeout = SILENCE_TIMEOUT, pacing = 'fixed', pacing_stats = None, capture = 'buffered',
+                 timing = None):
         self.prt = prt
+        self.capture = capture
+        # command_timing.CommandTiming shared by the runners of one device, None to not record
+        self.timing = timing
+        # Set by readResponse: monotonic time of the first byte (None if nothing came), bytes read
+        # and the time each prompt was seen
+        self.first_byte = None
+        self.bytes_read = 0
+        self.prompt_times = []
         self.delay = delay
+        self.pacing = pacing
+        # Shared across runners of one device so the report covers reboots
+        self.pacing_stats = pacing_stats if pacing_stats is not None else newPacingStats()
+        self.timeout = timeout_arg
+        self.silence_timeout = silence_timeout
         self.verbosity = verbosity
         self.original_fh_level = None
 
@@ -61,9 +191,9 @@ class PortRunner():
         self.ser.close()
         print(f'Closed port:{self.prt}')
     
-    def startLogger(self, log_file_name, name = None):
-        # If this logger already has a FileHandler, don't add another one.
-        if any(isinstance(h, logging.FileHandler) for h in self.logger.handlers):
+    def startLogger(self, log_file_name, name = None, tap = None):
+        # If this logger already has a file handler, don't add another one.
+        if any(isinstance(h, (logging.FileHandler, LogWriterHandler)) for h in self.logger.handlers):
             print(f"Logger '{self.logger.name}' already logging to file. Skipping new handler.")
             return
         
@@ -72,10 +202,32 @@ class PortRunner():
         os.makedirs(log_file_name, exist_ok=True)
         if name != None: log_file = os.path.join(log_file_name, f'{name}.log')
         else: log_file = os.path.join(log_file_name, f'{timestamp}.log')
-        self.fh = logging.FileHandler(log_file, mode="a")
-        formatter = MultiLineFormatter("%(message)s")
-        self.fh.setFormatter(formatter)
+        # Appended to by the host's background log writer, never on this thread
+        self.fh = LogWriterHandler(log_file, tap = tap)
         self.logger.addHandler(self.fh)
+
+    def logBytes(self, data: bytes):
+        """
+        Appends console output to the log as is: the raw bytes go to the log writer, the
+        verbose console gets the decoded text. Nothing is added, so a record may be
+        written in pieces.
+        """
+        for h in self.logger.handlers:
+            if logging.INFO < h.level:
+                continue
+            if isinstance(h, LogWriterHandler):
+                h.writeBytes(data)
+            elif isinstance(h, logging.StreamHandler):
+                h.acquire()
+                try:
+                    h.stream.write(data.decode(errors='ignore'))
+                    h.flush()
+                finally:
+                    h.release()
+
+    def logResponse(self, response: bytes):
+        # One whole response as one log line
+        self.logBytes(response + b"\n")
     
     def resumeLogger(self):
         if hasattr(self, 'fh') and self.original_fh_level is not None:
@@ -92,31 +244,261 @@ class PortRunner():
             print("File logger not active, nothing to pause.")
 
     def stopLogger(self):
+        # Closing the handler writes out and fsyncs the log, so this marks iteration boundaries
         # Added a check to prevent errors if handler was already removed
         if hasattr(self, 'fh'):
             self.logger.removeHandler(self.fh)
+            self.fh.close()
+
+    def readResponse(self, expect_response = 'gsp ]', silence_timeout = None, sink = None, timeout = None, count = 1):
+        """
+        Reads console output until expect_response without blocking on the port: whatever
+        is in in_waiting is pulled in chunks and a rolling tail is scanned for the prompt,
+        so a prompt split across chunks is still found.
+
+        A command that keeps printing is waited on for up to timeout seconds. Once the
+        console has been silent for the silence window it is poked with a newline (the
+        prompt may have been missed), and if it stays silent for another window the
+        command is declared hung. Output after a poke means the command is still running,
+        so the next silence is poked again. See silenceWindow() for the window.
+
+        Args:
+            expect_response (str): Prompt that ends the response.
+            silence_timeout (float): This command's silence budget (a test plan Silence value), None for
+                the runner's.
+            sink (callable): If given, every chunk is passed to it as it arrives instead of being kept.
+            timeout (float): Seconds the command may take in total, defaults to two port timeouts.
+            count (int): Prompts to wait for, one per command written (see runBatch).
+
+        Returns:
+            tuple: (response bytes up to and including the last prompt (b"" with a sink), PROMPT_FOUND, SILENT or TIMED_OUT)
+        """
+        expect = expect_response.encode()
+        silence = self.silenceWindow(silence_timeout)
+        budget = 2 * self.timeout if timeout is None else timeout
+        chunks = []
+        keep = chunks.append if sink is None else sink
+        tail = b""
+        poked = False
+        found = 0
+        start = last_output = time.monotonic()
+        self.first_byte = None
+        self.bytes_read = 0
+        self.prompt_times = []
+        while True:
+            waiting = self.ser.in_waiting
+            now = time.monotonic()
+            if waiting:
+                data = self.ser.read(waiting)
+                last_output = now
+                poked = False
+                if self.first_byte is None: self.first_byte = now
+                self.bytes_read += len(data)
+                window = tail + data
+                pos = window.find(expect)
+                while pos != -1:
+                    found += 1
+                    self.prompt_times.append(now)
+                    if found == count:
+                        # Bytes after the prompt would be discarded by the next reset_input_buffer anyway
+                        keep(data[:pos + len(expect) - len(tail)])
+                        return b"".join(chunks), PROMPT_FOUND
+                    pos = window.find(expect, pos + len(expect))
+                keep(data)
+                tail = window[-(len(expect) - 1):] if len(expect) > 1 else b""
+            elif now - last_output >= silence:
+                if poked:
+                    return b"".join(chunks), SILENT
+                self.ser.write('\n'.encode())
+                poked = True
+                last_output = now
+            else:
+                time.sleep(POLL_INTERVAL)
+            if now - start >= budget:
+                return b"".join(chunks), TIMED_OUT
+
+    def silenceWindow(self, silence_timeout = None) -> float:
+        """
+        Seconds of silence before readResponse pokes the console, and again before it
+        declares a hang. A command's own silence_timeout (Silence column) is a hard
+        budget: poked halfway, hung once the whole of it has passed in silence. The
+        runner's silence_timeout (-s) is the window itself, so a silent command ends
+        after twice it, and None uses the port timeout like the old blocking reads.
+        """
+        if silence_timeout is not None:
+            return silence_timeout / 2
+        return self.silence_timeout if self.silence_timeout is not None else self.timeout
+
+    def waitReady(self, max_wait, quiet = READY_QUIET) -> float:
+        """
+        Waits until the console has been quiet for quiet seconds, or max_wait passed.
+        Output arriving after the prompt is dropped, as reset_input_buffer would.
+
+        Returns:
+            float: Seconds waited.
+        """
+        start = last_output = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if now - start >= max_wait:
+                break
+            waiting = self.ser.in_waiting
+            if waiting:
+                self.ser.read(waiting)
+                last_output = now
+            elif now - last_output >= quiet:
+                break
+            else:
+                time.sleep(POLL_INTERVAL)
+        return time.monotonic() - start
+
+    def pace(self, fixed_delay, override = None):
+        """
+        Waits between commands. override (seconds, from the test plan) always sleeps;
+        otherwise the runner's pacing mode decides. fixed_delay is what the old code slept
+        and is recorded in pacing_stats next to the time actually waited.
+        """
+        if override is not None:
+            time.sleep(override)
+            waited = override
+        elif self.pacing == 'adaptive':
+            waited = self.waitReady(fixed_delay)
+        else:
+            time.sleep(fixed_delay)
+            waited = fixed_delay
+        self.pacing_stats['commands'] += 1
+        self.pacing_stats['fixed_s'] += fixed_delay
+        self.pacing_stats['waited_s'] += waited
 
-    def runCommand(self, command, ignore_fail = False, expect_response = 'gsp ]'):
+    def runCommand(self, command, ignore_fail = False, expect_response = 'gsp ]', delay = None, timeout = None,
+                   silence_timeout = None):
+        """
+        Sends a command and logs its response; a hang is logged with HANG_MARKER.
+        timeout and silence_timeout are this command's budgets (from the test plan),
+        see readResponse: the command is declared hung once silent for silence_timeout.
+
+        Returns:
+            int: SUCCESS, ERROR (hung or timed out) or ERROR_MSG (error colour codes in the output).
+        """
         self.ser.reset_input_buffer()
         self.ser.reset_output_buffer()
         if command[:-2] != '\n': self.ser.write(f'{command}\n'.encode())
         elif command[:2] == '\n': self.ser.write(f'{command}'.encode())
-        response = self.ser.read_until(expect_response.encode())
-        if response[-5:].decode('utf-8', errors='ignore') != expect_response:
-            self.ser.write('\n'.encode())
-            retry_response = self.ser.read_until(expect_response.encode())
-            if retry_response[-5:].decode('utf-8', errors='ignore') != expect_response:
-                self.logger.info(f"{response.decode(errors='ignore').strip()}")
-                self.logger.info(HANG_MARKER)
-                return ERROR
+        sent_at, sent = time.time(), time.monotonic()
+        if self.capture == 'stream':
+            capture = StreamCapture(self.logBytes)
+            _, status = self.readResponse(expect_response, silence_timeout, capture.feed, timeout)
+            done = time.monotonic()
+            result = self.finishStream(capture, status, ignore_fail)
+        else:
+            response, status = self.readResponse(expect_response, silence_timeout, timeout = timeout)
+            done = time.monotonic()
+            result = self.finishBuffered(response, status, ignore_fail)
+        self.recordCommand(command, sent_at, sent, done, result)
+        if result == SUCCESS: self.pace(self.delay, delay)
+        return result
+
+    def finishBuffered(self, response, status, ignore_fail):
+        # runCommand's result for a whole response, logged here
+        if status != PROMPT_FOUND:
+            self.logResponse(response.strip())
+            self.logger.info(HANG_MARKER)
+            return ERROR
         elif not ignore_fail and ((b'\x1b[31m' in response) or (b'\x1b[91m' in response)):
-            self.logger.info(f"{response.decode(errors='ignore').strip()}")
+            self.logResponse(response.strip())
             return ERROR_MSG
-        self.logger.info(f"{response.decode(errors='ignore').strip()}") # Store the output
-        time.sleep(self.delay)
+        self.logResponse(response.strip()) # Store the output
         return SUCCESS
 
-    
+    def runBatch(self, commands, ignore_fail = False, expect_response = 'gsp ]', delay = None, timeout = None,
+                 rows = None):
+        """
+        Writes several short commands in one go and splits the output back into one
+        response per command by counting prompts. Every response is logged and checked
+        for errors like runCommand's, but the write/wait/sleep cycle is paid once: the
+        runner paces once, after the whole batch.
+
+        Args:
+            commands (list): Commands, each expected to end with one prompt.
+            timeout (float): Seconds the whole batch may take, defaults to two port timeouts.
+            rows (list): Test plan row numbers of the commands, for the timing records.
+
+        Returns:
+            list: runCommand's result for every command that ran, up to the first that hung.
+            The commands after it were sent anyway: the log notes how many, and their timing
+            records have outcome SENT.
+        """
+        self.ser.reset_input_buffer()
+        self.ser.reset_output_buffer()
+        self.ser.write("".join(f"{command}\n" for command in commands).encode())
+        sent_at, sent = time.time(), time.monotonic()
+        response, status = self.readResponse(expect_response, timeout = timeout, count = len(commands))
+        results = self.finishBatch(commands, response, status, expect_response, ignore_fail, sent_at, sent, rows)
+        if ERROR not in results:
+            # The old code slept after every command
+            self.pacing_stats['commands'] += len(commands) - 1
+            self.pacing_stats['fixed_s'] += (len(commands) - 1) * self.delay
+            self.pace(self.delay, delay)
+        return results
+
+    def finishBatch(self, commands, response, status, expect_response, ignore_fail, sent_at, sent, rows = None):
+        # Splits a batch response at its prompts, then logs and records each command
+        expect = expect_response.encode()
+        parts = response.split(expect)
+        prompts = self.prompt_times[:len(commands)]
+        results = []
+        for i, command in enumerate(commands):
+            start = sent if i == 0 else prompts[i - 1]
+            if i < len(prompts):
+                part, part_status, done = parts[i] + expect, PROMPT_FOUND, prompts[i]
+            else:
+                # The command the batch hung on
+                part, part_status, done = parts[i] if i < len(parts) else b"", status, time.monotonic()
+            result = self.finishBuffered(part, part_status, ignore_fail)
+            results.append(result)
+            if self.timing is not None:
+                if rows is not None:
+                    self.timing.row = rows[i]
+                first_byte = self.first_byte - sent if i == 0 and self.first_byte is not None else None
+                self.timing.command(command, sent_at + (start - sent), first_byte, done - start, len(part),
+                                    OUTCOME_NAMES[result])
+            if part_status != PROMPT_FOUND:
+                break
+        unread = commands[len(results):]
+        if unread:
+            # Already written to the console, so they may still run and print after the hang
+            self.logger.info(f"-------------{len(unread)} batched commands after the hang were sent, not waited for-------------")
+            if self.timing is not None:
+                for i, command in enumerate(unread, len(results)):
+                    if rows is not None:
+                        self.timing.row = rows[i]
+                    self.timing.command(command, sent_at, None, None, 0, 'SENT')
+        return results
+
+    def finishStream(self, capture, status, ignore_fail):
+        # runCommand's result for output already streamed to the log
+        capture.finish()
+        if status != PROMPT_FOUND:
+            self.logger.info(HANG_MARKER)
+            return ERROR
+        elif not ignore_fail and capture.error:
+            return ERROR_MSG
+        return SUCCESS
+
+    def recordCommand(self, command, sent_at, sent, done, result, kind = 'command'):
+        """
+        Adds a command to the timing records, if any.
+
+        Args:
+            sent_at (float): Wall clock time the command was sent.
+            sent, done (float): Monotonic times it was sent and its prompt (or hang) was seen.
+            result (int): SUCCESS, ERROR or ERROR_MSG.
+        """
+        if self.timing is None:
+            return
+        first_byte = None if self.first_byte is None else self.first_byte - sent
+        self.timing.command(command, sent_at, first_byte, done - sent, self.bytes_read, OUTCOME_NAMES[result], kind)
+
     def setVerbosity(self, flag):
         self.verbosity = flag
         if self.verbosity:
@@ -126,23 +508,88 @@ class PortRunner():
         else:
             print("Verbosity input was not True/False")
     
+    def sendAndLog(self, command, expect_response, count = 2, timeout = None):
+        # AOSS ports: send, read up to count prompts and log whatever came back.
+        # timeout caps the whole command instead of each read
+        sent_at, sent = time.time(), time.monotonic()
+        self.ser.write(f'{command}\n'.encode())
+        response = b""
+        for _ in range(count):
+            if timeout is not None:
+                self.ser.timeout = max(timeout - (time.monotonic() - sent), 0)
+            response += self.ser.read_until(expect_response.encode())
+        self.ser.timeout = self.timeout
+        # read_until does not say when the first byte came
+        self.first_byte, self.bytes_read = None, len(response)
+        self.recordCommand(command, sent_at, sent, time.monotonic(),
+                           SUCCESS if response.count(expect_response.encode()) >= count else ERROR, 'aoss')
+        self.logResponse(response)
+        return response
+
     def startFastbootServer(self):
-        self.ser.write("google_tests -n fastboot_start -a 2\n")
-        time.sleep(3)
-        self.ser.write("\n")
-        response = self.ser.read_until(b'gsp ]')
-        if response[-5:].decode('utf-8', errors='ignore') != "gsp ]":
-            self.ser.write('\n'.encode())
-            retry_response = self.ser.read_until(b'gsp ]')
-            if retry_response[-5:].decode('utf-8', errors='ignore') != "gsp ]":
-                return ERROR
+        self.ser.write("google_tests -n fastboot_start -a 2\n".encode())
+        if self.pacing == 'adaptive':
+            # The prompt is polled for below instead of sleeping a fixed delay first
+            self.pacing_stats['fixed_s'] += FASTBOOT_START_DELAY
+        else:
+            self.pace(FASTBOOT_START_DELAY)
+        # Some boards only print the prompt once the console is poked
+        self.ser.write("\n".encode())
+        response, status = self.readResponse('gsp ]')
+        if status != PROMPT_FOUND:
+            return ERROR
         elif b'\x1b[31m' in response or b'\x1b[91m' in response:
             return ERROR_MSG
-        self.logger.info(f"{response.decode(errors='ignore').strip()}")
-        time.sleep(self.delay)
+        self.logResponse(response.strip())
+        self.pace(self.delay)
         return SUCCESS
 
 
+class PortPool():
+    """
+    The serial ports of one device for one dhub session. Each port is opened the first
+    time it is used and then reused across test plan rows and iterations, instead of
+    a new PortRunner per command. reopen() switches to the ports of a new dhub session
+    (after <reboot device>) and closeAll() closes everything that was opened.
+
+    Args:
+        ports (dict): dhub port name ("APC", "AOSS_SENSOR_CORE", "AOSS_A32", "CPM") -> PTY path.
+        runner (class): PortRunner or a subclass, e.g. async_engine.AsyncPortRunner.
+        runner_kwargs: Passed to every runner (timeout_arg, logName, pacing, ...).
+    """
+    def __init__(self, ports, runner = PortRunner, **runner_kwargs):
+        self.ports = dict(ports or {})
+        self.runner = runner
+        self.runner_kwargs = runner_kwargs
+        self.runners = {}
+
+    def get(self, name):
+        runner = self.runners.get(name)
+        if runner is None:
+            if name not in self.ports:
+                raise KeyError(f"dhub did not report a {name} port")
+            runner = self.runner(self.ports[name], **self.runner_kwargs)
+            self.runners[name] = runner
+        return runner
+
+    def closeAll(self):
+        for runner in self.runners.values():
+            try:
+                runner.close()
+            except Exception as e:
+                print(f"Error closing port {runner.prt}: {e}")
+        self.runners = {}
+
+    def reopen(self, ports):
+        self.closeAll()
+        self.ports = dict(ports or {})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.closeAll()
+
 def testHarness(prt):
     port = PortRunner(prt, verbosity=True)
     port.startLogger('test')
@@ -1,155 +1,83 @@
 #!/usr/bin/env python3
 # Author: Chin Ming Ryan Wong
 
-import argparse, os, serial, time, logging, csv, subprocess, threading, shutil
-from send_to_terminal import PortRunner, ERROR_MSG, ERROR
-from dhub_automation import DhubAutomation
-import serial_num_util, getSummary
-from constants import LOG_OUTPUT_DIR
+import argparse, os, time, threading, asyncio
+from send_to_terminal import SILENCE_TIMEOUT, PACING_MODES, CAPTURE_MODES
+import serial_num_util, async_engine, log_writer, fleet_summary, plan_shards, plan_runner, staging_scheduler
+from ramdisk_cache import RamdiskCache
+from command_timing import CommandTiming
+from iteration_pool import IterationPool, SCHEDULES
+from test_plan import compilePlan, printErrors
+from constants import LOG_OUTPUT_DIR, LOG_FLUSH_INTERVAL, LOG_FLUSH_BYTES, FLEET_SUMMARY_NAME, STAGING_CONCURRENCY, STAGING_GROUP, STAGING_METRICS_NAME
 
-class MultiLineFormatter(logging.Formatter):
-    def format(self, record):
-        full_msg = super().format(record)
-        lines = full_msg.splitlines()
-        if len(lines) <= 1:
-            return full_msg
-        
-        prefix = full_msg[:full_msg.find(record.getMessage())]
-            # Add prefix to every line
-        return "\n".join([lines[0]] + [prefix + line for line in lines[1:]])
-
-def run_SOP(test_plan, soc_sn, brd_sn, package_path, iteration, timoeut =  120):
-    # Fail flag for skipping to next <reboot>
-    crit_err = False
-    # Start dhub
-    dhub_inst = DhubAutomation(soc_sn)
-    # Get APC port
-    try:
-        soc_ports = dhub_inst.get_dhub_ports()
-        apc_port = soc_ports["APC"]
-        aoss_port = soc_ports["AOSS_SENSOR_CORE"]
-        aoss_a32_port = soc_ports["AOSS_A32"]
-    except KeyError as e:
-        dhub_inst.stop_dhub()
-        print(f"Error retrieving APC port: {e}")
-    # Start APC terminal
-    # Timeout set by longest test in MBU set by
-    #   google_tests -v -n concurrency_fabdisp_stress -a g2d dpu cpu_memcpy cpu_memcpy cpu_memcpy cpu_memcpy dvfs_fabdisp
-    port = PortRunner(apc_port, verbosity=False, timeout_arg = timoeut, logName= soc_sn)
-    for i in range(int(iteration)):
-        try:
-            # Open the serial port
-            with open(test_plan) as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    command = row["Command"].strip()
-                    if "AOSS_SENSOR_CORE: " in command and not crit_err:
-                        # print(f'Sending AOSS command: {command.replace("AOSS_SENSOR_CORE: ","")}')
-                        # Add AOSS command logging here
-                        port_aoss = PortRunner(aoss_port, verbosity=False, timeout_arg = timoeut, logName= soc_sn)
-                        port_aoss.ser.write(f'{command.replace("AOSS_SENSOR_CORE: ","")}\n'.encode())
-                        full_response = b""
-                        for _ in range(2):
-                            chunk = port_aoss.ser.read_until(b'e24]')
-                            full_response += chunk
-                        decoded_response = full_response.decode('utf-8', errors='ignore')
-                        port_aoss.logger.info(f"{decoded_response}")
-                        # port_aoss.runCommand(command.replace("AOSS_SENSOR_CORE: ",""), expect_response="e24]",)
-                    elif "AOSS_A32 uart: " in command and not crit_err:
-                        # print(f'Sending AOSS A32 command: {command.replace("AOSS_A32 uart: ","")}')
-                        # Add AOSS A32 command logging here
-                        port_aoss_a32 = PortRunner(aoss_a32_port, verbosity=False, timeout_arg = timoeut, logName= soc_sn)
-                        port_aoss_a32.ser.write(f'{command.replace("AOSS_A32 uart: ","")}\n'.encode())
-                        full_response = b""
-                        for _ in range(2):
-                            chunk = port_aoss_a32.ser.read_until(b'a32]')
-                            full_response += chunk
-                        decoded_response = full_response.decode('utf-8', errors='ignore')
-                        port_aoss_a32.logger.info(f"{decoded_response}")
-                        # port_aoss_a32.runCommand(command.replace("AOSS_A32: ",""), expect_response="a32]",)
-
-                    elif '<' not in command and '>' not in command and not crit_err:
-                        # print(f'Sending test: {command}')
-                        # Send a command
-                        try:
-                            port.runCommand(command)
-                        except Exception as e:
-                            # print(f"Error sending command '{command}': {e}")
-                            port.logger.info("-------------Skipping to next reboot-------------")
-                            crit_err = True
-                    elif '<' in command or '>' in command:
-                        cmd_line = command[1:-1].strip()  # Remove the angle brackets
-                        if cmd_line == "reboot device":
-                            # Stop Port Runner
-                            port.stopLogger()
-                            port.close()
-                            # Stop dhub
-                            dhub_inst.stop_dhub()
-                            # reboot SoC
-                            serial_num_util.creset_and_lk(package_path, soc_sn, brd_sn)
-                            # Start dhub again to refresh the connection
-                            dhub_inst.__init__(soc_sn)
-                            soc_ports = dhub_inst.get_dhub_ports()
-                            apc_port = soc_ports["APC"]
-                            aoss_port = soc_ports["AOSS_SENSOR_CORE"]
-                            port = PortRunner(apc_port, verbosity=False, timeout_arg = timoeut, logName= soc_sn)
-                            time.sleep(3)
-                            log_name = os.path.basename(test_plan).replace('.csv','')
-                            log_name = f"{log_name}_{soc_sn}"
-                            # print(f"Starting new log: {log_name}")
-                            port.startLogger(LOG_OUTPUT_DIR, name = log_name)
-                            # Turn off crit_err flag to skip to next set of test
-                            crit_err = False
-                
-                        # Only load ramdisk if no critical error
-                        elif cmd_line.startswith("fastboot") and not crit_err:
-                            cmd_line = cmd_line.split()
-                            # If the command involves a ramdisk file, prepend the package path
-                            if '.ext2' in cmd_line[-1]:
-                                ramdisk_path = os.path.join(package_path, cmd_line[-1])
-                                cmd_line[-1] = ramdisk_path
-                            cmd_line.insert(1, "-s")
-                            cmd_line.insert(2, soc_sn)
-                            # print(f"Executing fastboot command: {cmd_line}")
-                            # Execute the fastboot command
-                            fastboot_output = subprocess.run(cmd_line, stdout=subprocess.DEVNULL)
-                            if fastboot_output.returncode != 0:
-                                port.logger.info("Fastboot command failed. Skipping to next reboot.")
-                                crit_err = True
-            # Change ownership of log files to user
-            port.stopLogger()
-            port.close()
-            try:
-                port_aoss.close()
-            except:
-                pass
-
-        except serial.SerialException as e:
-            print(f"Serial port error: {e}")
-            port.close()
-            subprocess.run(['sudo', 'chown', '-R', 'chinmingryan', LOG_OUTPUT_DIR])
-    # Add summary log generation
-    log_dir_path = os.path.join(LOG_OUTPUT_DIR, log_name)
-    os.makedirs(log_dir_path,exist_ok=True)
-    shutil.move(os.path.join(LOG_OUTPUT_DIR,f"{log_name}.log"), log_dir_path)
-    getSummary.main(os.path.join(log_dir_path, f"{log_name}.log"))
-    subprocess.run(['sudo', 'chown', '-R', 'chinmingryan', LOG_OUTPUT_DIR])
+def run_SOP(plan, soc_sn, brd_sn, package_path, iteration, **kwargs):
+    """
+    Runs a compiled test plan (test_plan.compilePlan) iteration times on one device, blocking
+    this thread. The step loop is plan_runner.runPlan, shared with the asyncio engine; kwargs are its.
+    """
+    plan_runner.runSync(plan_runner.runPlan(plan_runner.SyncOps(soc_sn), plan, soc_sn, brd_sn, package_path,
+                                            iteration, **kwargs))
 
-def device_task(test_plan, soc_sn, brd_sn, lk_package_path, iteration):
+def device_task(plan, soc_sn, brd_sn, lk_package_path, iteration, silence_timeout = SILENCE_TIMEOUT, pacing = 'fixed',
+                capture = 'buffered', verify_summary = False, shard_report = None, ramdisk_cache = None):
     """
     Wrapper function to handle both setup and execution in the thread.
+
+    iteration is the iteration count, or the IterationPool shared by the fleet.
     """
+    if isinstance(iteration, IterationPool) and not iteration.remaining():
+        print(f"[{soc_sn}] No iterations left, skipping.")
+        return
     print(f"[{soc_sn}] Starting setup (Reset & LK)...")
     
     # 1. Move setup INSIDE the thread so it runs in parallel
-    serial_num_util.creset_and_lk(lk_package_path, soc_sn, brd_sn)
+    timing = CommandTiming(soc_sn)
+    with timing.step('creset_and_lk'):
+        serial_num_util.creset_and_lk(lk_package_path, soc_sn, brd_sn)
     
     print(f"[{soc_sn}] Setup complete. Starting SOP execution...")
     
     # 2. Run the actual SOP
-    run_SOP(test_plan, soc_sn, brd_sn, lk_package_path, iteration)
+    try:
+        run_SOP(plan, soc_sn, brd_sn, lk_package_path, iteration, silence_timeout = silence_timeout, pacing = pacing,
+                capture = capture, timing = timing, verify_summary = verify_summary, shard_report = shard_report,
+                ramdisk_cache = ramdisk_cache)
+    except Exception:
+        # Hand the iteration this device was running back to the rest of the fleet
+        if isinstance(iteration, IterationPool):
+            iteration.abandon(soc_sn)
+        raise
     print(f"[{soc_sn}] Task finished.")
 
+def reportPlan(plan, paired_sn_list, work, shard_report = None):
+    """
+    Reports a run with shared or sharded scheduling: the plan's device logs are summarized together
+    into <plan>_fleet_summary.log in LOG_OUTPUT_DIR, followed by the per-device iteration schedule.
+    A sharded run also gets <plan>_segment_summary.log, the results merged per segment.
+    """
+    schedule = work.report(plan.name)
+    print(schedule)
+    if shard_report is not None:
+        print(f"Segment summary saved to {shard_report.write(LOG_OUTPUT_DIR, time.monotonic() - work.start)}")
+    logs = [os.path.join(LOG_OUTPUT_DIR, f"{plan.name}_{pair['soc_sn']}", f"{plan.name}_{pair['soc_sn']}.log")
+            for pair in paired_sn_list]
+    logs = [log for log in logs if os.path.exists(log)]
+    if not logs:
+        return
+    output = os.path.join(LOG_OUTPUT_DIR, f"{plan.name}_{FLEET_SUMMARY_NAME}")
+    # runPlan already wrote every device's summary
+    fleet_summary.summarizeFleet(LOG_OUTPUT_DIR, output = output, logs = logs, write_device_summaries = False)
+    with open(output, "a") as f:
+        f.write(f"\n{schedule}\n")
+
+def reportStaging():
+    """
+    Prints the host's LK staging metrics and writes one row per staging to LOG_OUTPUT_DIR.
+    """
+    scheduler = staging_scheduler.getScheduler()
+    print(scheduler.report())
+    scheduler.writeCsv(os.path.join(LOG_OUTPUT_DIR, STAGING_METRICS_NAME))
+
 def main():
     parser = argparse.ArgumentParser(
         description="Send commands from a file to a Minicom pseudo-terminal (PTY)."
@@ -175,7 +103,111 @@ def main():
         help="Number of times to run SOP.",
         default="10"
     )
+    parser.add_argument(
+        "-S",
+        "--schedule",
+        type=str,
+        choices=SCHEDULES,
+        help="per_device: every device runs --iteration loops. shared: --iteration loops in all, taken one at a time "
+             "by whichever device is free; a failed loop is retried on another device. sharded: like shared, but "
+             "every <reboot device> segment of every loop is a separate unit, so one pass of a long plan is spread "
+             "over all devices.",
+        default="per_device"
+    )
+    parser.add_argument(
+        "-s",
+        "--silence_timeout",
+        type=float,
+        help="Seconds of console silence before a command is poked, and again before it is declared hung. "
+             "Defaults to the port timeout (120 s).",
+        default=SILENCE_TIMEOUT
+    )
+    parser.add_argument(
+        "-P",
+        "--pacing",
+        type=str,
+        choices=PACING_MODES,
+        help="fixed: sleep after every command (old behaviour). adaptive: continue once the console is quiet after the prompt. "
+             "A \"Delay\" column in the test plan overrides either per command.",
+        default="fixed"
+    )
+    parser.add_argument(
+        "-C",
+        "--capture",
+        type=str,
+        choices=CAPTURE_MODES,
+        help="buffered: log each response once its prompt arrives. stream: append output to the log as it arrives, "
+             "so long tests keep little in memory and lose nothing if the host process dies.",
+        default="buffered"
+    )
+    parser.add_argument(
+        "-B",
+        "--batch",
+        action="store_true",
+        help="Write consecutive test plan rows marked in the \"Batch\" column in one go and split the output back "
+             "per command by counting prompts, instead of one write/wait/sleep cycle per row."
+    )
+    parser.add_argument(
+        "-V",
+        "--verify_summary",
+        action="store_true",
+        help="Also re-parse each log after the run and compare it with the results parsed while it was captured."
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        type=str,
+        choices=["threads", "asyncio"],
+        help="threads: one thread per device. asyncio: every device on one event loop (scales to more boards per host).",
+        default="threads"
+    )
+    parser.add_argument(
+        "-c",
+        "--max_concurrency",
+        type=int,
+        help="With --engine asyncio, the most devices running at once (0 = all).",
+        default=0
+    )
+    parser.add_argument(
+        "--staging_concurrency",
+        type=int,
+        help="Most boards in ROM recovery / LK staging at once per USB bus (see --staging_group), 0 = no limit. "
+             "The others queue, and failed stagings are retried with backoff.",
+        default=STAGING_CONCURRENCY
+    )
+    parser.add_argument(
+        "--staging_group",
+        type=str,
+        choices=staging_scheduler.STAGING_GROUPS,
+        help="What --staging_concurrency applies to: each USB bus, each hub, or the whole host.",
+        default=STAGING_GROUP
+    )
+    parser.add_argument(
+        "--ramdisk_cache",
+        action="store_true",
+        help="Skip fastboot ramdisk rows that would stage or mount the image a device already holds since its "
+             "last reboot, and report the bytes and seconds saved."
+    )
+    parser.add_argument(
+        "--flush_interval",
+        type=float,
+        help="Most seconds console output is held in memory before the log writer writes it out.",
+        default=LOG_FLUSH_INTERVAL
+    )
+    parser.add_argument(
+        "--flush_bytes",
+        type=int,
+        help="Pending console bytes (all devices) that make the log writer write out early.",
+        default=LOG_FLUSH_BYTES
+    )
     args = parser.parse_args()
+    log_writer.configureWriter(args.flush_interval, args.flush_bytes)
+    staging_scheduler.configureScheduler(args.staging_concurrency, args.staging_group)
+    # Parsed and checked once, then shared read-only by every device
+    plan = compilePlan(args.test_plan, args.lk_package_path, args.batch)
+    if printErrors(plan):
+        return
+    ramdisk_cache = RamdiskCache(plan) if args.ramdisk_cache else None
     if serial_num_util.retrieve_sn_list_from_file() == []:
         print("Serial number pair file not found. Generating new serial number pairs...")
         paired_sn_list = serial_num_util.get_paired_sn()
@@ -184,9 +216,30 @@ def main():
         print("Retrieving serial number pairs from file...")
         paired_sn_list = serial_num_util.retrieve_sn_list_from_file()
     
-    threads = []
-
     print(f"Starting tests for {len(paired_sn_list)} devices...")
+    # With shared scheduling every device pulls its iterations from one pool
+    iteration = IterationPool(args.iteration) if args.schedule == "shared" else args.iteration
+    shard_report = None
+    if args.schedule == "sharded":
+        # The pool holds every <reboot device> segment of every pass instead, longest first
+        history = plan_shards.loadHistory(plan, LOG_OUTPUT_DIR)
+        iteration = IterationPool(plan_shards.shardUnits(plan, args.iteration, history))
+        shard_report = plan_shards.SegmentReport(plan, history)
+    if args.engine == "asyncio":
+        asyncio.run(async_engine.run_devices(plan, paired_sn_list, args.lk_package_path, iteration,
+                                             args.max_concurrency, silence_timeout = args.silence_timeout,
+                                             pacing = args.pacing, capture = args.capture,
+                                             verify_summary = args.verify_summary, shard_report = shard_report,
+                                             ramdisk_cache = ramdisk_cache))
+        print("All devices have finished execution.")
+        reportStaging()
+        if ramdisk_cache is not None:
+            print(ramdisk_cache.report())
+        if args.schedule != "per_device":
+            reportPlan(plan, paired_sn_list, iteration, shard_report)
+        return
+
+    threads = []
 
     for serial_pair in paired_sn_list:
         soc = serial_pair['soc_sn']
@@ -195,7 +248,8 @@ def main():
         # Create the thread targeting the WRAPPER function
         t = threading.Thread(
             target=device_task, 
-            args=(args.test_plan, soc, brd, args.lk_package_path, args.iteration)
+            args=(plan, soc, brd, args.lk_package_path, iteration, args.silence_timeout, args.pacing,
+                  args.capture, args.verify_summary, shard_report, ramdisk_cache)
         )
         
         threads.append(t)
@@ -206,6 +260,11 @@ def main():
         t.join()
 
     print("All devices have finished execution.")
+    reportStaging()
+    if ramdisk_cache is not None:
+        print(ramdisk_cache.report())
+    if args.schedule != "per_device":
+        reportPlan(plan, paired_sn_list, iteration, shard_report)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
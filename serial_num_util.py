@@ -1,30 +1,33 @@
 #!/usr/bin/env python3
 # Author: Chin Ming Ryan Wong
 
-import subprocess, time, os, argparse
+import subprocess, time, argparse, functools
+import staging_scheduler
 from constants import FTDI_MULTI_PATH, SN_PAIR_FILE, STAGE_LK_PATH
 
+def stage_attempt(package_path, soc_sn = None, brd_sn = None) -> bool:
+    """
+    One ROM recovery + LK staging of a device. Returns True if LK was staged.
+    """
+    print("Attempting ROM Recovery")
+    if brd_sn == None:
+        subprocess.run(['sudo', FTDI_MULTI_PATH, '5'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    else:
+        subprocess.run(['sudo', FTDI_MULTI_PATH, '5', brd_sn], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    print(f"Re-staging {brd_sn} for lk")
+    if soc_sn == None:
+        cmd = f"{STAGE_LK_PATH} --path {package_path}"
+    else:
+        cmd = f"{STAGE_LK_PATH} --path {package_path} --serial {soc_sn}"
+    output = subprocess.run(cmd, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # print("LK loaded")
+    return output.returncode == 0
+
 def creset_and_lk(package_path, soc_sn = None, brd_sn = None):
     print(f"C-Resetting device with SoC SN: {soc_sn} and Board SN: {brd_sn}")
-    failCount = 0
-    reboot = False
-    # Try up to 5 times to recover and stage LK
-    while failCount < 5 and not reboot:
-        print(f"Attempting ROM Recovery")
-        if brd_sn == None:
-            subprocess.run(['sudo', FTDI_MULTI_PATH, '5'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        else:
-            subprocess.run(['sudo', FTDI_MULTI_PATH, '5', brd_sn], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        print(f"Re-staging {brd_sn} for lk")
-        if soc_sn == None:
-            cmd = f"{STAGE_LK_PATH} --path {package_path}"
-        else:
-            cmd = f"{STAGE_LK_PATH} --path {package_path} --serial {soc_sn}"
-        output = subprocess.run(cmd, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        if output.returncode != 0: failCount += 1
-        else:
-            # print("LK loaded")
-            reboot = True
+    # Queued with the other boards on the same USB bus, retried with backoff (see staging_scheduler)
+    staging_scheduler.getScheduler().stage(functools.partial(stage_attempt, package_path, soc_sn, brd_sn),
+                                           soc_sn, brd_sn)
     time.sleep(5)
 
 def get_brd_serial_num():
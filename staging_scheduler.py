@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# Author: Chin Ming Ryan Wong
+
+import asyncio, collections, csv, os, random, threading, time
+from command_timing import percentile
+from constants import (STAGING_CONCURRENCY, STAGING_GROUP, STAGING_ATTEMPTS, STAGING_BACKOFF, STAGING_BACKOFF_MAX,
+                       SYSFS_USB_DEVICES)
+
+STAGING_GROUPS = ('bus', 'hub', 'host')
+STAGING_FIELDS = ['device', 'group', 'queued', 'queue_wait_s', 'staging_s', 'backoff_s', 'attempts', 'retries', 'outcome']
+
+def usbLocation(soc_sn = None, brd_sn = None, devices = SYSFS_USB_DEVICES):
+    """
+    Returns the sysfs name (e.g. "1-4.2": bus 1, hub port 4, port 2) of the USB device with serial
+    soc_sn, or else of the FTDI whose serial starts with brd_sn. None if neither is connected.
+    """
+    try:
+        names = os.listdir(devices)
+    except OSError:
+        return None
+    serials = {}
+    for name in names:
+        try:
+            with open(os.path.join(devices, name, "serial"), "r") as f:
+                serials[name] = f.read().strip()
+        except OSError:
+            continue
+    for name, serial in serials.items():
+        if soc_sn and serial == soc_sn:
+            return name
+    for name, serial in serials.items():
+        if brd_sn and serial.startswith(brd_sn):
+            return name
+    return None
+
+def locationGroup(location, group_by = STAGING_GROUP) -> str:
+    """
+    Returns the staging group of a sysfs USB name: its bus ("usb1"), the hub it hangs off ("1-4"),
+    or "host" for everything. Devices that were not found share the "unknown" group.
+    """
+    if group_by == 'host':
+        return 'host'
+    if location is None:
+        return 'unknown'
+    bus, _, ports = location.partition("-")
+    if group_by == 'bus' or "." not in ports:
+        return f"usb{bus}"
+    return f"{bus}-{ports.rsplit('.', 1)[0]}"
+
+class _Group():
+    # Staging slots of one bus/hub; waiters are woken in arrival order
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.waiters = collections.deque()
+
+class StagingScheduler():
+    """
+    One per host. Every ROM recovery + LK staging (serial_num_util.creset_and_lk and its asyncio
+    twin) runs through it, so boards sharing a USB bus (or hub) are staged at most concurrency at
+    a time instead of all at once. Devices queue first come, first served; a failed attempt gives
+    its slot back and is retried after an exponential backoff with jitter. Every staging is
+    recorded with its queue wait, staging time and retries. Thread-safe, and stageAsync() waits
+    without blocking the event loop.
+
+    Args:
+        concurrency (int): Stagings at once per group, 0 for no limit.
+        group_by (str): One of STAGING_GROUPS.
+        attempts (int): Most attempts per staging.
+        backoff (float): Seconds before the first retry, doubled for every further one.
+        backoff_max (float): Longest wait between attempts.
+    """
+    def __init__(self, concurrency = STAGING_CONCURRENCY, group_by = STAGING_GROUP, attempts = STAGING_ATTEMPTS,
+                 backoff = STAGING_BACKOFF, backoff_max = STAGING_BACKOFF_MAX):
+        self.concurrency = concurrency
+        self.group_by = group_by
+        self.attempts = attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.lock = threading.Lock()
+        self.groups = {}
+        self.locations = {}
+        self.records = []
+
+    def groupOf(self, soc_sn = None, brd_sn = None) -> str:
+        # Looked up once per device: a board in reset may have dropped off the bus
+        key = (soc_sn, brd_sn)
+        if key not in self.locations or self.locations[key] is None:
+            self.locations[key] = usbLocation(soc_sn, brd_sn)
+        return locationGroup(self.locations[key], self.group_by)
+
+    def _take(self, group, wake) -> bool:
+        # Takes a slot now, or queues wake() to be called once the slot is handed over
+        with self.lock:
+            g = self.groups.setdefault(group, _Group(self.concurrency))
+            if not g.limit or (g.active < g.limit and not g.waiters):
+                g.active += 1
+                return True
+            g.waiters.append(wake)
+            return False
+
+    def _release(self, group):
+        with self.lock:
+            g = self.groups[group]
+            if g.waiters:
+                # Handed straight to the next waiter, so active stays the same
+                g.waiters.popleft()()
+            else:
+                g.active -= 1
+
+    def _acquire(self, group):
+        done = threading.Event()
+        if not self._take(group, done.set):
+            done.wait()
+
+    async def _acquireAsync(self, group):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        wake = lambda: loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+        if self._take(group, wake):
+            return
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self.lock:
+                waiters = self.groups[group].waiters
+                handed = wake not in waiters
+                if not handed:
+                    waiters.remove(wake)
+            if handed:
+                self._release(group)
+            raise
+
+    def _delay(self, retry) -> float:
+        return min(self.backoff * 2 ** retry, self.backoff_max) * random.uniform(0.5, 1.0)
+
+    def _newRecord(self, soc_sn, brd_sn, group) -> dict:
+        return {'device': soc_sn or brd_sn, 'group': group, 'queued': time.time(), 'queue_wait_s': 0.0,
+                'staging_s': 0.0, 'backoff_s': 0.0, 'attempts': 0, 'retries': 0, 'outcome': 'ERROR'}
+
+    def _finish(self, record):
+        record['retries'] = max(record['attempts'] - 1, 0)
+        with self.lock:
+            self.records.append(record)
+        if record['outcome'] == 'ERROR':
+            print(f"[{record['device']}] Staging failed after {record['attempts']} attempts")
+
+    def stage(self, attempt, soc_sn = None, brd_sn = None) -> bool:
+        """
+        Runs attempt() (one ROM recovery + LK staging, True on success) in a slot of the device's
+        group, retrying with backoff up to attempts times.
+
+        Returns:
+            bool: True once an attempt succeeded.
+        """
+        group = self.groupOf(soc_sn, brd_sn)
+        record = self._newRecord(soc_sn, brd_sn, group)
+        try:
+            for retry in range(self.attempts):
+                if retry:
+                    delay = self._delay(retry - 1)
+                    record['backoff_s'] += delay
+                    time.sleep(delay)
+                start = time.monotonic()
+                self._acquire(group)
+                record['queue_wait_s'] += time.monotonic() - start
+                start = time.monotonic()
+                try:
+                    record['attempts'] += 1
+                    ok = attempt()
+                finally:
+                    record['staging_s'] += time.monotonic() - start
+                    self._release(group)
+                if ok:
+                    record['outcome'] = 'SUCCESS'
+                    return True
+            return False
+        finally:
+            self._finish(record)
+
+    async def stageAsync(self, attempt, soc_sn = None, brd_sn = None) -> bool:
+        """
+        stage() on the event loop; attempt is a coroutine function.
+        """
+        group = self.groupOf(soc_sn, brd_sn)
+        record = self._newRecord(soc_sn, brd_sn, group)
+        try:
+            for retry in range(self.attempts):
+                if retry:
+                    delay = self._delay(retry - 1)
+                    record['backoff_s'] += delay
+                    await asyncio.sleep(delay)
+                start = time.monotonic()
+                await self._acquireAsync(group)
+                record['queue_wait_s'] += time.monotonic() - start
+                start = time.monotonic()
+                try:
+                    record['attempts'] += 1
+                    ok = await attempt()
+                finally:
+                    record['staging_s'] += time.monotonic() - start
+                    self._release(group)
+                if ok:
+                    record['outcome'] = 'SUCCESS'
+                    return True
+            return False
+        except asyncio.CancelledError:
+            record['outcome'] = 'CANCELLED'
+            raise
+        finally:
+            self._finish(record)
+
+    def report(self) -> str:
+        """
+        Stagings per group with p50/p95/max queue wait and staging time, retries and failures.
+        """
+        with self.lock:
+            records = list(self.records)
+        fmt = lambda v: "-" if v is None else f"{v:.1f}"
+        limit = self.concurrency or "no limit"
+        out = [f"--- LK staging ({limit} per {self.group_by}) ---",
+               f"{'group':<12}{'stagings':>9}{'wait p50':>10}{'wait p95':>10}{'wait max':>10}"
+               f"{'stage p50':>11}{'stage p95':>11}{'retries':>9}{'failed':>8}"]
+        groups = {}
+        for record in records:
+            groups.setdefault(record['group'], []).append(record)
+        for group, rows in sorted(groups.items()) + [('all', records)]:
+            waits = [r['queue_wait_s'] for r in rows]
+            stagings = [r['staging_s'] for r in rows]
+            out.append(f"{group:<12}{len(rows):>9}{fmt(percentile(waits, 50)):>10}{fmt(percentile(waits, 95)):>10}"
+                       f"{fmt(max(waits, default=None)):>10}{fmt(percentile(stagings, 50)):>11}"
+                       f"{fmt(percentile(stagings, 95)):>11}{sum(r['retries'] for r in rows):>9}"
+                       f"{sum(r['outcome'] == 'ERROR' for r in rows):>8}")
+        return "\n".join(out)
+
+    def writeCsv(self, path):
+        with self.lock:
+            records = list(self.records)
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=STAGING_FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+
+_SCHEDULER = None
+_SCHEDULER_LOCK = threading.Lock()
+
+def getScheduler() -> StagingScheduler:
+    """
+    Returns the host's StagingScheduler, creating it on first use.
+    """
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = StagingScheduler()
+        return _SCHEDULER
+
+def configureScheduler(concurrency = STAGING_CONCURRENCY, group_by = STAGING_GROUP, attempts = STAGING_ATTEMPTS,
+                       backoff = STAGING_BACKOFF, backoff_max = STAGING_BACKOFF_MAX):
+    """
+    Sets how the host's StagingScheduler limits and retries stagings. Call before the first staging.
+    """
+    scheduler = getScheduler()
+    scheduler.concurrency = concurrency
+    scheduler.group_by = group_by
+    scheduler.attempts = attempts
+    scheduler.backoff = backoff
+    scheduler.backoff_max = backoff_max
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# Author: Chin Ming Ryan Wong
+
+import argparse
+import hashlib
+import os
+from result_store import ResultStore
+from constants import SUMMARY_CACHE_DIR, SUMMARY_CACHE_MAX_BYTES
+
+CACHE_EXT = ".rs"
+# Any change to these files can change analyzeLog results, so it invalidates the cache
+PARSER_SOURCES = ("getSummary.py", "marker_matcher.py", "result_store.py", "constants.py")
+_PARSER_HASH = None
+
+def cacheDir(cache_dir = None) -> str:
+    return os.path.expanduser(cache_dir or SUMMARY_CACHE_DIR)
+
+def parserHash() -> str:
+    """
+    Returns a hash of the parser sources and markers, computed once per process.
+    """
+    global _PARSER_HASH
+    if _PARSER_HASH is None:
+        h = hashlib.sha1()
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in PARSER_SOURCES:
+            with open(os.path.join(here, name), "rb") as f:
+                h.update(f.read())
+        _PARSER_HASH = h.hexdigest()
+    return _PARSER_HASH
+
+def cacheKey(logPath: str) -> str:
+    """
+    Returns the cache key of a log: (path, size, mtime, parser hash). A log that grows
+    or is rewritten gets a new key; its old entry ages out through eviction.
+    """
+    st = os.stat(logPath)
+    identity = f"{os.path.abspath(logPath)}\0{st.st_size}\0{st.st_mtime_ns}\0{parserHash()}"
+    return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+def _entryPath(key, cache_dir):
+    return os.path.join(cacheDir(cache_dir), f"{key}{CACHE_EXT}")
+
+def loadCached(logPath: str, cache_dir = None) -> dict:
+    """
+    Returns the cached results of a log, or None on a miss.
+    """
+    path = _entryPath(cacheKey(logPath), cache_dir)
+    try:
+        with open(path, "rb") as f:
+            results = ResultStore.fromBytes(f.read()).results()
+    except (FileNotFoundError, ValueError):
+        return None
+    # Hits refresh the mtime, which eviction uses as last access time
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    return results
+
+def storeCached(logPath: str, results: dict, cache_dir = None, max_bytes = None):
+    """
+    Writes the results of a log to the cache, then evicts old entries over max_bytes.
+    """
+    directory = cacheDir(cache_dir)
+    os.makedirs(directory, exist_ok=True)
+    path = _entryPath(cacheKey(logPath), cache_dir)
+    # Unique temp name, fleet workers may store the same log at once
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(ResultStore.fromResults(results).toBytes())
+    os.replace(tmp_path, path)
+    evict(cache_dir, max_bytes)
+
+def _entries(directory):
+    # [(mtime, size, path)] of every cache entry, oldest first
+    entries = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if not entry.name.endswith(CACHE_EXT):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+    except FileNotFoundError:
+        pass
+    return sorted(entries)
+
+def evict(cache_dir = None, max_bytes = None) -> int:
+    """
+    Removes least recently used entries until the cache fits in max_bytes.
+
+    Returns:
+        int: Number of entries removed.
+    """
+    max_bytes = SUMMARY_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = _entries(cacheDir(cache_dir))
+    size = sum(entry[1] for entry in entries)
+    removed = 0
+    for _, entry_size, path in entries:
+        if size <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        size -= entry_size
+    return removed
+
+def clearCache(cache_dir = None) -> int:
+    """
+    Removes every cache entry. Returns the number removed.
+    """
+    return evict(cache_dir, max_bytes=-1)
+
+def cachedAnalysis(logPath: str, analyze, cache_dir = None, max_bytes = None) -> dict:
+    """
+    Returns the results of analyze(logPath), served from the cache if the log is
+    unchanged since it was last analyzed. stdin and missing files are never cached.
+
+    Args:
+        logPath (str): Path of the log.
+        analyze (function): One of the getSummary.ANALYZE_MODES functions.
+        cache_dir (str): Cache directory, defaults to SUMMARY_CACHE_DIR.
+        max_bytes (int): Cache size limit, defaults to SUMMARY_CACHE_MAX_BYTES.
+    """
+    if logPath == "-" or not os.path.isfile(logPath):
+        return analyze(logPath)
+    results = loadCached(logPath, cache_dir)
+    if results is not None:
+        print(f"Using cached summary of '{logPath}'")
+        return results
+    results = analyze(logPath)
+    if results is not None:
+        try:
+            storeCached(logPath, results, cache_dir, max_bytes)
+        except OSError as e:
+            print(f"Warning: could not cache summary of '{logPath}': {e}")
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Inspect or clear the persistent summary cache.")
+    parser.add_argument('-d', '--dir', type=str, default=None, help="Cache directory (default: SUMMARY_CACHE_DIR).")
+    parser.add_argument('-c', '--clear', action='store_true', help="Remove every cached summary.")
+    parser.add_argument('-s', '--max-size', type=int, default=None, metavar='BYTES', help="Evict down to BYTES.")
+    args = parser.parse_args()
+    if args.clear:
+        print(f"Removed {clearCache(args.dir)} cached summaries")
+    elif args.max_size is not None:
+        print(f"Removed {evict(args.dir, args.max_size)} cached summaries")
+    entries = _entries(cacheDir(args.dir))
+    print(f"{cacheDir(args.dir)}: {len(entries)} entries, {sum(entry[1] for entry in entries)} bytes")
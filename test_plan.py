@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# Author: Chin Ming Ryan Wong
+
+import argparse, csv, os
+from typing import NamedTuple
+from send_to_terminal import rowSeconds, batchRows, batchSeconds
+
+# Step kinds
+COMMAND = 'command'
+AOSS = 'aoss'
+BATCH = 'batch'
+REBOOT = 'reboot'
+FASTBOOT = 'fastboot'
+
+# Command prefix -> (dhub port, prompt) of the AOSS consoles; everything else goes to APC
+AOSS_ROUTES = {"AOSS_SENSOR_CORE: ": ("AOSS_SENSOR_CORE", 'e24]'),
+               "AOSS_A32 uart: ": ("AOSS_A32", 'a32]')}
+APC_PROMPT = 'gsp ]'
+
+class Step(NamedTuple):
+    """
+    One compiled test plan row (or batch of rows).
+
+    kind: COMMAND, AOSS, BATCH, REBOOT or FASTBOOT.
+    row: Test plan row number, a tuple of them for a BATCH.
+    command: The row as written in the plan (what timing records and logs show).
+    port: dhub port the payload is written to, None for REBOOT/FASTBOOT.
+    payload: Text written to the port (prefix removed), a tuple of them for a BATCH.
+    expect: Prompt that ends the response.
+    argv: fastboot argv with the ramdisk path resolved, without "-s <serial>" (see fastbootArgv()).
+    delay, timeout, silence: Per-row Delay/Timeout/Silence seconds, None if not given. Silence is
+        a hard budget: the row is declared hung once silent that long, see
+        send_to_terminal.PortRunner.silenceWindow.
+    segment: Index of the <reboot device> segment the step belongs to (0 before the first reboot).
+    ramdisk: For FASTBOOT steps in a run of consecutive fastboot rows that stages one .ext2 image,
+        that image's path (see ramdisk_cache), None otherwise.
+    """
+    kind: str
+    row: object
+    command: str
+    port: str = None
+    payload: object = None
+    expect: str = None
+    argv: tuple = ()
+    delay: float = None
+    timeout: float = None
+    silence: float = None
+    segment: int = 0
+    ramdisk: str = None
+
+class TestPlan(NamedTuple):
+    """
+    A test plan compiled once by compilePlan() and shared read-only by every device worker.
+
+    name: Plan file name without .csv (device logs are <name>_<soc_sn>.log).
+    steps: Tuple of Step, in plan order.
+    segments: (first, end) step index range of every segment; segment n > 0 starts with its REBOOT step.
+    errors: Problems found while compiling, as "row N: ..." strings. Empty for a runnable plan.
+    """
+    path: str
+    name: str
+    steps: tuple
+    segments: tuple
+    errors: tuple
+
+def fastbootArgv(step: Step, soc_sn) -> list:
+    """
+    Returns the argv of a FASTBOOT step for one device.
+    """
+    return [step.argv[0], "-s", soc_sn, *step.argv[1:]]
+
+def segmentSteps(plan: TestPlan, segment) -> tuple:
+    """
+    Returns the steps of one segment, starting with a reboot so that it runs from a clean
+    reset on any device (a plan's rows before its first <reboot device> get one added).
+    """
+    first, end = plan.segments[segment]
+    steps = plan.steps[first:end]
+    if not steps or steps[0].kind != REBOOT:
+        steps = (Step(REBOOT, None, "<reboot device>", segment=segment),) + steps
+    return steps
+
+def segmentRows(plan: TestPlan, segment) -> tuple:
+    """
+    Returns the (first, last) test plan row numbers of a segment, (None, None) if it is empty.
+    """
+    first, end = plan.segments[segment]
+    rows = [row for step in plan.steps[first:end] for row in (step.row if step.kind == BATCH else (step.row,))]
+    return (rows[0], rows[-1]) if rows else (None, None)
+
+def _compileRow(row_num, row, package_path, segment, errors) -> Step:
+    command = (row["Command"] or "").strip()
+    seconds = dict(delay=rowSeconds(row, "Delay"), timeout=rowSeconds(row, "Timeout"),
+                   silence=rowSeconds(row, "Silence"), segment=segment)
+    for prefix, (port, expect) in AOSS_ROUTES.items():
+        if prefix in command:
+            return Step(AOSS, row_num, command, port, command.replace(prefix, ""), expect, **seconds)
+    if '<' not in command and '>' not in command:
+        return Step(COMMAND, row_num, command, "APC", command, APC_PROMPT, **seconds)
+    cmd_line = command[1:-1].strip()  # Remove the angle brackets
+    if cmd_line == "reboot device":
+        return Step(REBOOT, row_num, command, **seconds)
+    if cmd_line.startswith("fastboot"):
+        argv = cmd_line.split()
+        # If the command involves a ramdisk file, prepend the package path
+        if '.ext2' in argv[-1]:
+            argv[-1] = os.path.join(package_path, argv[-1])
+            if not os.path.isfile(argv[-1]):
+                errors.append(f"row {row_num}: ramdisk not found: {argv[-1]}")
+        return Step(FASTBOOT, row_num, command, argv=tuple(argv), **seconds)
+    errors.append(f"row {row_num}: unknown directive: {command}")
+    return None
+
+def _markRamdisks(steps):
+    # Tags each run of consecutive FASTBOOT steps with the one .ext2 image it stages, if any
+    first = 0
+    while first < len(steps):
+        end = first
+        while end < len(steps) and steps[end].kind == FASTBOOT:
+            end += 1
+        images = {step.argv[-1] for step in steps[first:end] if step.argv[1:2] == ("stage",) and '.ext2' in step.argv[-1]}
+        if len(images) == 1:
+            image = images.pop()
+            steps[first:end] = [step._replace(ramdisk=image) for step in steps[first:end]]
+        first = end + 1
+
+def compilePlan(test_plan, package_path, batch = False) -> TestPlan:
+    """
+    Parses a test plan CSV once: routes every row to its port, strips the AOSS prefixes,
+    resolves fastboot ramdisk paths against the LK package, groups Batch rows (with batch)
+    and splits the plan into <reboot device> segments.
+
+    Args:
+        test_plan (str): Path to the test plan .csv file.
+        package_path (str): LK package directory holding the .ext2 ramdisks.
+        batch (bool): Group consecutive rows marked in the Batch column (see send_to_terminal.batchRows).
+
+    Returns:
+        TestPlan: The compiled plan. errors lists every missing ramdisk, unknown directive,
+        bad number and missing Command column; the plan should not be run unless it is empty.
+    """
+    errors = []
+    steps = []
+    starts = [0]
+    with open(test_plan, newline="") as f:
+        reader = csv.DictReader(f)
+        if "Command" not in (reader.fieldnames or []):
+            errors.append("row 0: no Command column")
+            rows = []
+        else:
+            rows = list(reader)
+    for row_num, row in (batchRows(rows) if batch else enumerate(rows, 1)):
+        try:
+            if isinstance(row, list):
+                delay, timeout = batchSeconds(row)
+                payload = tuple(r["Command"].strip() for r in row)
+                steps.append(Step(BATCH, tuple(row_num), "; ".join(payload), "APC", payload, APC_PROMPT,
+                                  delay=delay, timeout=timeout, segment=len(starts) - 1))
+                continue
+            step = _compileRow(row_num, row, package_path, len(starts) - 1, errors)
+        except ValueError as e:
+            errors.append(f"row {row_num}: {e}")
+            continue
+        if step is None:
+            continue
+        if step.kind == REBOOT:
+            # A reboot starts a new segment, except as the plan's first step
+            if steps:
+                starts.append(len(steps))
+            step = step._replace(segment=len(starts) - 1)
+        steps.append(step)
+    _markRamdisks(steps)
+    segments = tuple(zip(starts, starts[1:] + [len(steps)]))
+    return TestPlan(test_plan, os.path.basename(test_plan).replace('.csv', ''), tuple(steps), segments, tuple(errors))
+
+def printErrors(plan: TestPlan) -> bool:
+    """
+    Prints the plan's errors. Returns True if there were any.
+    """
+    for error in plan.errors:
+        print(f"Test plan error ({plan.path}) {error}")
+    return bool(plan.errors)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compile and check a test plan without running it.")
+    parser.add_argument('-t', '--test_plan', type=str, required=True, help="Path to the test plan .csv file.")
+    parser.add_argument('-k', '--lk_package_path', type=str, required=True,
+                        help="Path to the directory containing the LK package.")
+    parser.add_argument('-B', '--batch', action="store_true", help="Group rows marked in the Batch column.")
+    args = parser.parse_args()
+    plan = compilePlan(args.test_plan, args.lk_package_path, args.batch)
+    for step in plan.steps:
+        row = f"{step.row[0]}-{step.row[-1]}" if step.kind == BATCH else step.row
+        target = " ".join(step.argv) if step.kind == FASTBOOT else step.port or ""
+        print(f"{step.segment:>3} {row:>8}  {step.kind:<9}{target:<18} {step.command}")
+    print(f"{len(plan.steps)} steps in {len(plan.segments)} segments")
+    if printErrors(plan):
+        raise SystemExit(1)